@@ -0,0 +1,289 @@
+"""Hot-path benchmarks against a synthetic library
+
+    python -m tests.benchmarks --rows 1000000 --output new.json
+    python -m tests.benchmarks --compare old.json new.json
+
+Results are written as JSON so that runs from different versions can be diffed offline.
+This module is not collected by pytest and does not need network access
+"""
+
+import argparse, contextlib, json, os, platform, random, sqlite3, statistics, sys, tempfile, time
+from pathlib import Path
+
+from xklb import __version__
+from xklb.utils import consts
+
+WORDS = """
+    alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima mike november oscar papa quebec romeo
+    sierra tango uniform victor whiskey xray yankee zulu river mountain forest desert ocean island valley canyon
+    lecture concert interview trailer episode season documentary tutorial review highlights live remastered
+""".split()
+EXTENSIONS = ["mp4", "mkv", "webm", "mp3", "opus", "flac", "jpg", "png"]
+MEDIA_COLUMNS = {
+    # integer columns first so that db_utils.optimize does not need to rewrite the table
+    "id": "INTEGER PRIMARY KEY",
+    "playlists_id": "INTEGER",
+    "size": "INTEGER",
+    "duration": "INTEGER",
+    "width": "INTEGER",
+    "height": "INTEGER",
+    "time_created": "INTEGER",
+    "time_modified": "INTEGER",
+    "time_downloaded": "INTEGER",
+    "time_deleted": "INTEGER",
+    "path": "TEXT",
+    "title": "TEXT",
+    "type": "TEXT",
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m tests.benchmarks", description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000, help="Number of synthetic media rows")
+    parser.add_argument("--files", type=int, default=20_000, help="Number of files in the synthetic directory tree")
+    parser.add_argument("--sample-hash-size", type=int, default=64, help="Size of the sample-hash test file (MiB)")
+    parser.add_argument("--cluster-rows", type=int, default=20_000, help="Number of paths to cluster")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs per benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", default=[], help="Only run benchmarks whose name contains a substring")
+    parser.add_argument("--database", help="Reuse (or create) the synthetic database at this path")
+    parser.add_argument("--output", "-o", help="Write JSON results to a file instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files")
+    return parser.parse_args()
+
+
+def random_path(rng, i):
+    depth = rng.randint(2, 6)
+    parts = [rng.choice(WORDS) + str(rng.randint(0, 9)) for _ in range(depth)]
+    name = " ".join(rng.choices(WORDS, k=rng.randint(1, 4)))
+    return os.sep + os.path.join("library", *parts, f"{name} {i}.{rng.choice(EXTENSIONS)}")
+
+
+def generate_media(rng, n):
+    now = int(time.time())
+    for i in range(1, n + 1):
+        path = random_path(rng, i)
+        ext = path.rsplit(".", 1)[-1]
+        time_created = now - rng.randint(0, 10 * 365 * 86400)
+        yield (
+            i,
+            rng.randint(1, 20),
+            rng.randint(1_000, 8_000_000_000),
+            None if ext in ("jpg", "png") else rng.randint(5, 4 * 3600),
+            rng.choice([None, 640, 1280, 1920, 3840]),
+            rng.choice([None, 360, 720, 1080, 2160]),
+            time_created,
+            time_created + rng.randint(0, 86400),
+            time_created + rng.randint(0, 86400),
+            time_created + 86400 if rng.random() < 0.05 else 0,
+            path,
+            " ".join(rng.choices(WORDS, k=rng.randint(2, 8))),
+            ext,
+        )
+
+
+def generate_database(path, rows, seed):
+    from xklb.utils import db_utils
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE media (" + ", ".join(f"[{k}] {v}" for k, v in MEDIA_COLUMNS.items()) + ")",
+    )
+    conn.execute("CREATE TABLE history (media_id INTEGER, time_played INTEGER, playhead INTEGER, done INTEGER)")
+    conn.execute("CREATE TABLE captions (media_id INTEGER, time INTEGER, text TEXT)")
+
+    conn.executemany(
+        f"INSERT INTO media VALUES ({','.join(['?'] * len(MEDIA_COLUMNS))})",
+        generate_media(rng, rows),
+    )
+
+    now = int(time.time())
+    conn.executemany(
+        "INSERT INTO history VALUES (?, ?, ?, ?)",
+        (
+            (rng.randint(1, rows), now - rng.randint(0, 365 * 86400), rng.randint(0, 3600), int(rng.random() < 0.5))
+            for _ in range(rows // 5)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO captions VALUES (?, ?, ?)",
+        (
+            (rng.randint(1, rows), rng.randint(0, 3600), " ".join(rng.choices(WORDS, k=rng.randint(3, 12))))
+            for _ in range(rows // 2)
+        ),
+    )
+    conn.commit()
+
+    args = argparse.Namespace(database=path, verbose=0)
+    args.db = db_utils.connect(args, conn=conn)
+    db_utils.optimize(args)
+    return args.db
+
+
+def generate_file_tree(base_dir, n, seed):
+    rng = random.Random(seed)
+    for i in range(n):
+        p = Path(base_dir, *[rng.choice(WORDS) for _ in range(rng.randint(1, 4))], f"{i}.{rng.choice(EXTENSIONS)}")
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.touch()
+
+
+def generate_large_file(path, mib, seed):
+    rng = random.Random(seed)
+    with open(path, "wb") as f:
+        for _ in range(mib):
+            f.write(rng.randbytes(1024 * 1024))
+
+
+def parse_lb_args(parse_args_fn, argv):
+    sys.argv = ["lb", *argv]
+    return parse_args_fn()
+
+
+def media_sql_benchmark(database, argv):
+    from xklb.playback import play_actions
+    from xklb.utils import sqlgroups
+
+    def run():
+        args = parse_lb_args(lambda: play_actions.parse_args(consts.SC.watch), [database, *argv])
+        return list(args.db.query(*sqlgroups.media_sql(args)))
+
+    return run
+
+
+def fs_sql_benchmark(database, argv):
+    from xklb.fsdb import disk_usage
+    from xklb.utils import sqlgroups
+
+    def run():
+        args = parse_lb_args(disk_usage.parse_args, [database, *argv])
+        return list(args.db.query(*sqlgroups.fs_sql(args, limit=None)))
+
+    return run
+
+
+def get_benchmarks(args, tempdir):
+    from xklb.createdb import fs_add
+    from xklb.files import sample_hash
+    from xklb.folders import big_dirs
+    from xklb.fsdb import disk_usage
+    from xklb.mediadb import db_folder_stats
+    from xklb.text import cluster_sort
+    from xklb.utils import db_utils, file_utils, strings
+    from xklb.utils.objects import NoneSpace
+
+    database = args.database or os.path.join(tempdir, "synthetic.db")
+    if not os.path.exists(database):
+        generate_database(database, args.rows, args.seed)
+
+    du_args = parse_lb_args(disk_usage.parse_args, [database])
+    du_args.data = disk_usage.get_data(du_args)
+    fs_du_args = parse_lb_args(disk_usage.parse_args, [database])
+    fs_du_args.folder_stats = db_folder_stats.can_use(fs_du_args)
+    bd_args = parse_lb_args(big_dirs.parse_args, [database])
+    media = [dict(d) for d in du_args.data]
+
+    tree_dir = os.path.join(tempdir, "tree")
+    generate_file_tree(tree_dir, args.files, args.seed)
+
+    large_file = os.path.join(tempdir, "sample_hash.bin")
+    generate_large_file(large_file, args.sample_hash_size, args.seed)
+
+    sentences = [strings.path_to_sentence(d["path"]) for d in media[: args.cluster_rows]]
+
+    extract_rows = [
+        {k: v for k, v in d.items() if k != "id"} | {"tags": d["title"], "description": "benchmark"}
+        for d in media[:10_000]
+    ]
+
+    def extract_chunk():
+        fs_args = NoneSpace(
+            db=db_utils.connect(NoneSpace(database=":memory:", verbose=0), conn=sqlite3.connect(":memory:")),
+            playlists_id=1,
+            profiles=[consts.DBType.video],
+            scan_subtitles=False,
+        )
+        fs_add.extract_chunk(fs_args, [d.copy() for d in extract_rows])
+
+    return {
+        "media_sql.watch": media_sql_benchmark(database, []),
+        "media_sql.print_all": media_sql_benchmark(database, ["-p", "-L", "inf"]),
+        "media_sql.sort_size": media_sql_benchmark(database, ["-p", "-u", "size desc", "-L", "1000"]),
+        "media_sql.search": media_sql_benchmark(database, ["-p", "-L", "inf", WORDS[3], WORDS[7]]),
+        "media_sql.history": media_sql_benchmark(database, ["-p", "-L", "inf", "--played-within", "30 days"]),
+        "fs_sql.all": fs_sql_benchmark(database, []),
+        "fs_sql.where": fs_sql_benchmark(database, ["--size=+1GB", "--duration=-60"]),
+        "disk_usage.get_subset.depth3": lambda: disk_usage.get_subset(du_args, level=3),
+        "disk_usage.get_subset.prefix": lambda: disk_usage.get_subset(
+            du_args, level=4, prefix=os.sep + os.path.join("library", WORDS[0] + "0") + os.sep
+        ),
+        "disk_usage.get_subset.folder_stats.depth3": lambda: disk_usage.get_subset(fs_du_args, level=3),
+        "disk_usage.get_subset.folder_stats.prefix": lambda: disk_usage.get_subset(
+            fs_du_args, level=4, prefix=os.sep + os.path.join("library", WORDS[0] + "0") + os.sep
+        ),
+        "big_dirs.group_files_by_parents": lambda: big_dirs.group_files_by_parents(bd_args, media),
+        "file_utils.rglob": lambda: file_utils.rglob(tree_dir),
+        "sample_hash.sample_hash_file": lambda: sample_hash.sample_hash_file(large_file),
+        "cluster_sort.find_clusters": lambda: cluster_sort.find_clusters(None, sentences),
+        "fs_add.extract_chunk": extract_chunk,
+    }
+
+
+def run_benchmarks(args):
+    results = {}
+    with tempfile.TemporaryDirectory() as tempdir, contextlib.redirect_stdout(sys.stderr):
+        t0 = time.perf_counter()
+        benchmarks = get_benchmarks(args, tempdir)
+        print(f"Generated synthetic data in {time.perf_counter() - t0:.2f}s")
+
+        for name, fn in benchmarks.items():
+            if args.only and not any(s in name for s in args.only):
+                continue
+
+            timings = []
+            for _ in range(args.repeat):
+                t = time.perf_counter()
+                fn()
+                timings.append(time.perf_counter() - t)
+            results[name] = {"seconds": timings, "min": min(timings), "median": statistics.median(timings)}
+            print(f"{name:<40} {min(timings):10.4f}s")
+
+    return {
+        "version": __version__,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "params": {
+            k: getattr(args, k) for k in ("rows", "files", "sample_hash_size", "cluster_rows", "repeat", "seed")
+        },
+        "results": results,
+    }
+
+
+def compare(old_path, new_path):
+    old = json.loads(Path(old_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    print(f"{'benchmark':<40} {old['version']:>12} {new['version']:>12} {'ratio':>8}")
+    for name in sorted(old["results"].keys() | new["results"].keys()):
+        a = old["results"].get(name, {}).get("min")
+        b = new["results"].get(name, {}).get("min")
+        ratio = f"{b / a:7.2f}x" if a and b else ""
+        print(f"{name:<40} {a or float('nan'):12.4f} {b or float('nan'):12.4f} {ratio:>8}")
+
+
+def main():
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = json.dumps(run_benchmarks(args), indent=2)
+    if args.output:
+        Path(args.output).write_text(results + "\n")
+    else:
+        print(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
+from pathlib import Path
 from unittest import mock
 
+from tests.utils import connect_db_args
 from xklb.lb import library as lb
 
 
@@ -36,3 +38,70 @@ def test_fsupdate_multi(mocked, temp_db):
     lb(["playlists", db1])
     out = mocked.call_args[0][1]
     assert len(out) == 3
+
+
+def test_fsupdate_incremental(temp_file_tree, temp_db):
+    db1 = temp_db()
+    src1 = temp_file_tree({"folder1": {"file1.txt": "1", "subfolder1": {"file2.txt": "2"}}, "file3.txt": "3"})
+    lb(["fsadd", "--fs", "--incremental", db1, src1])
+
+    db = connect_db_args(db1).db
+    assert db.pop("select count(*) from media") == 3
+    assert db.pop("select count(*) from scan_manifest") == 3
+
+    Path(src1, "folder1", "subfolder1", "file4.txt").write_text("4")
+    Path(src1, "file3.txt").unlink()
+    lb(["fsupdate", "--fs", "--incremental", db1])
+
+    assert db.pop("select count(*) from media where time_deleted = 0") == 3
+    assert db.pop("select path from media where time_deleted > 0").endswith("file3.txt")
+
+    Path(src1, "file3.txt").write_text("3")
+    lb(["fsupdate", "--fs", "--incremental", db1])
+    assert db.pop("select count(*) from media where time_deleted = 0") == 4
+
+
+def test_fsadd_incremental_filters(temp_file_tree, temp_db):
+    db1 = temp_db()
+    src1 = temp_file_tree({"folder1": {"file1.txt": "1", "file2.md": "2"}})
+    lb(["fsadd", "--fs", "--incremental", "-e", "txt", db1, src1])
+
+    db = connect_db_args(db1).db
+    assert db.pop("select count(*) from media") == 1
+
+    # same folder mtimes but a wider extension set
+    lb(["fsadd", "--fs", "--incremental", "-e", "txt", "-e", "md", db1, src1])
+    assert db.pop("select count(*) from media where time_deleted = 0") == 2
+
+
+def test_fsadd_counts_written_media(temp_file_tree, temp_db, monkeypatch, capsys):
+    from xklb.createdb import fs_add
+
+    extract_metadata = fs_add.extract_metadata
+    monkeypatch.setattr(
+        fs_add, "extract_metadata", lambda args, p: None if p.endswith("file2.txt") else extract_metadata(args, p)
+    )
+
+    db1 = temp_db()
+    src1 = temp_file_tree({"folder1": {"file1.txt": "1", "file2.txt": "2"}, "file3.txt": "3"})
+    lb(["fsadd", "--fs", db1, src1])
+
+    assert connect_db_args(db1).db.pop("select count(*) from media") == 2
+    assert "Added 2 new media" in capsys.readouterr().out
+
+
+def test_fsadd_move_scans_open_files_once_per_batch(temp_file_tree, temp_db, tmp_path, monkeypatch):
+    from xklb.utils import file_utils
+
+    scans = []
+    scan = file_utils.open_files.scan
+    monkeypatch.setattr(file_utils.open_files, "scan", lambda: scans.append(1) or scan())
+
+    db1 = temp_db()
+    src1 = temp_file_tree({f"file{i}.txt": str(i) for i in range(10)})
+    lb(["fsadd", "--fs", "--move", str(tmp_path / "moved"), db1, src1])
+
+    assert len(scans) == 1
+    assert len(list((tmp_path / "moved").rglob("*.txt"))) == 10
+    db = connect_db_args(db1).db
+    assert db.pop("select count(*) from media where path like ?", [str(tmp_path / "moved") + "%"]) == 10
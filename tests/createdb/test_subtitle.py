@@ -0,0 +1,32 @@
+import subprocess
+
+from xklb.createdb import av, subtitle
+from xklb.utils import processes
+
+
+def test_externalize_internal_subtitles(tmp_path):
+    path = str(tmp_path / "subs.mkv")
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-v",
+            "error",
+            "-i",
+            "tests/data/test.mp4",
+            "-i",
+            "tests/data/test.eng.vtt",
+            "-i",
+            "tests/data/test.vtt",
+        ]
+        + ["-map", "0:v", "-map", "1", "-map", "2", "-c:v", "copy", "-c:s", "srt", path],
+        check=True,
+    )
+    streams = processes.FFProbe(path).streams
+
+    subtitle_paths = subtitle.externalize_internal_subtitles(path, streams)
+    assert len(subtitle_paths) == 2
+    assert all(subtitle.read_sub(p) for p in subtitle_paths)
+
+    tags = av.get_subtitle_tags(path, streams, scan_subtitles=True)
+    assert tags["subtitle_count"] == 2
+    assert len(tags["subtitles"]) == 2
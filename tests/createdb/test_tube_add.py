@@ -1,8 +1,13 @@
+import time
 from types import SimpleNamespace
 from unittest import mock
 
-from tests.utils import tube_db
+from tests.utils import connect_db_args, tube_db
+from xklb.createdb import tube_backend
+from xklb.data.http_errors import HTTPTooManyRequests
 from xklb.lb import library as lb
+from xklb.mediadb import db_playlists
+from xklb.utils import db_utils
 
 
 def test_tw_print(capsys):
@@ -86,3 +91,38 @@ def test_tube_dl_conversion(get_playlist_metadata, download):
     lb(["download", tube_db, "--prefix", STORAGE_PREFIX, "--video"])
     out = download.call_args[0]
     assert out[1]["path"] == PLAYLIST_VIDEO_URL
+
+
+def test_tubeupdate_parallel_rate_limited(temp_db, monkeypatch):
+    db1 = temp_db()
+    args = connect_db_args(db1)
+    args.db["playlists"].insert_all(
+        [
+            {
+                "path": p,
+                "extractor_key": "ydl_Test",
+                "extractor_config": "{}",
+                "time_modified": 0,
+                "hours_update_delay": 1,
+            }
+            for p in ("/a", "/b", "/c")
+        ],
+        pk="path",
+    )
+
+    calls = []
+
+    def get_playlist_metadata(args, playlist_path, ydl_opts, playlist_root=True):
+        calls.append((playlist_path, time.monotonic()))
+        if playlist_path == "/b" and len([p for p, _t in calls if p == "/b"]) == 1:
+            raise HTTPTooManyRequests
+        db_utils.write(args, db_playlists.increase_update_delay, playlist_path)
+        return 0
+
+    monkeypatch.setattr(tube_backend, "get_playlist_metadata", get_playlist_metadata)
+    lb(["tube-update", db1, "--threads=3", "--same-extractor-threads=3", "--same-extractor-interval=0.05"])
+
+    assert sorted(p for p, _t in calls) == ["/a", "/b", "/b", "/c"]
+    starts = [t for _p, t in calls]
+    assert all(b - a >= 0.04 for a, b in zip(starts, starts[1:]))
+    assert args.db.pop("select count(*) from playlists where time_modified > 0") == 3
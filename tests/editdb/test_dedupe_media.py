@@ -1,4 +1,4 @@
-import argparse
+import argparse, shutil
 
 import pytest
 
@@ -93,3 +93,44 @@ def test_dedupe(db1, flags, deleted):
     media = list(d["path"] for d in args.db.query("SELECT path FROM media WHERE time_deleted>0"))
 
     assert media == deleted
+
+
+def test_dedupe_fs_hash_index(temp_file_tree, temp_db):
+    src1 = temp_file_tree({"file4.txt": "5", "file5.txt": "5", "file6.txt": "6"})
+    db = temp_db()
+    lb(["fsadd", "--fs", db, src1])
+
+    lb(["dedupe-media", "--fs", "--hash-algorithm", "fast", db])
+
+    args = connect_db_args(db)
+    media_hashes = list(args.db.query("SELECT * FROM media_hashes WHERE full_hash IS NOT NULL"))
+    assert len(media_hashes) == 2
+    assert media_hashes[0]["full_hash"] == media_hashes[1]["full_hash"]
+    assert len(list(args.db.query("SELECT path FROM media WHERE time_deleted>0"))) == 1
+
+
+def test_dedupe_image(tmp_path, temp_db):
+    from PIL import Image
+
+    with Image.open("tests/data/test.gif") as img:
+        img.convert("RGB").save(tmp_path / "a.png")
+        img.convert("RGB").resize((img.width // 2, img.height // 2)).save(tmp_path / "b.png")
+    shutil.copy("tests/data/test_frame.gif", tmp_path / "c.gif")
+
+    db = temp_db()
+    args = connect_db_args(db)
+    args.db["media"].insert_all(
+        [
+            {"path": str(tmp_path / name), "size": size, "time_deleted": 0}
+            for name, size in [("a.png", 200), ("b.png", 100), ("c.gif", 50), ("d.mp4", 300)]
+        ],
+        pk="path",
+    )
+    shutil.copy("tests/data/test.mp4", tmp_path / "d.mp4")
+
+    lb(["dedupe-media", "--image", db])
+    assert [d["path"] for d in args.db.query("SELECT path FROM media WHERE time_deleted>0")] == [
+        str(tmp_path / "b.png")
+    ]
+    assert args.db.pop("SELECT count(*) FROM image_hashes WHERE phash IS NOT NULL") == 3
+    assert args.db.pop("SELECT count(*) FROM image_hashes") == 3  # d.mp4 is not fingerprinted
@@ -0,0 +1,41 @@
+import os
+
+from xklb.folders import big_dirs
+from xklb.lb import library as lb
+
+
+def test_group_files_by_parent():
+    media = [
+        {"path": "/a/b/1.mp4", "size": 10, "duration": 5},
+        {"path": "/a/b/2.mp4", "size": 30, "duration": 5, "time_last_played": 1},
+        {"path": "/a/b/3.mp4", "size": 20, "time_deleted": 1},
+        {"path": "/a/c/1.mp4", "size": 5},
+    ]
+    folders = big_dirs.group_files_by_parent(None, media)
+    assert folders[0] == {
+        "path": "/a/b",
+        "total": 3,
+        "duration": 10,
+        "median_duration": 5,
+        "size": 40,
+        "median_size": 20,
+        "played": 1,
+        "exists": 2,
+        "deleted": 1,
+        "deleted_size": 20,
+        "deleted_duration": 0,
+        "folders": 0,
+    }
+
+    assert big_dirs.media_by_parent(media)["/a/c/"] == [{"path": "/a/c/1.mp4", "size": 5}]
+
+
+def test_big_dirs_db_medians(temp_db, temp_file_tree, capsys):
+    src = temp_file_tree({"a": {"1.txt": "1", "2.txt": "22", "3.txt": "333"}, "b": {"4.txt": "4444" * 10}})
+    db = temp_db()
+    lb(["fsadd", "--fs", db, src])
+
+    lb(["big-dirs", db, "--folder-sizes=+1B", "--folder-counts=+0", "--sort-groups-by", "median_size desc"])
+    out = capsys.readouterr().out
+    assert "median_size" in out
+    assert out.index(os.path.join(src, "a")) < out.index(os.path.join(src, "b"))  # largest last
@@ -39,3 +39,35 @@ def test_rebin_folders():
     untouched, rebinned = scatter.rebin_folders(dummy_folders(5) + dummy_folders(5, "/tmp/f/"), 6)
     assert rebinned == []
     assert len(untouched) == 10
+
+
+def test_group_by_mount():
+    files = [{"path": "/mnt/d1/a/1"}, {"path": "/mnt/d10/a/2"}, {"path": "/mnt/d1/b/c/3"}, {"path": "/other/4"}]
+    mount_files = scatter.group_by_mount(["/mnt/d1", "/mnt/d10", "/mnt/d1/b"], files)
+    assert [d["path"] for d in mount_files["/mnt/d1"]] == ["/mnt/d1/a/1"]
+    assert [d["path"] for d in mount_files["/mnt/d10"]] == ["/mnt/d10/a/2"]
+    assert [d["path"] for d in mount_files["/mnt/d1/b"]] == ["/mnt/d1/b/c/3"]
+
+
+def test_plan_moves():
+    disk_stats = [
+        {"mount": "/mnt/d1", "used": 0.5, "free": 0.2, "total": 0.4, "free_bytes": 0},
+        {"mount": "/mnt/d2", "used": 0.25, "free": 0.4, "total": 0.3, "free_bytes": 100},
+        {"mount": "/mnt/d3", "used": 0.25, "free": 0.4, "total": 0.3, "free_bytes": 60},
+    ]
+    to_rebin = [
+        {"mount": "/mnt/d1", "path": "/mnt/d1/a/1", "size": 30},
+        {"mount": "/mnt/d1", "path": "/mnt/d1/a/2", "size": 30},
+        {"mount": "/mnt/d1", "path": "/mnt/d1/b/3", "size": 50},
+        {"mount": "/mnt/d1", "path": "/mnt/d1/c/4", "size": 40},
+        {"mount": "/mnt/d1", "path": "/mnt/d1/d/5", "size": 50},
+    ]
+    rebinned, unplaced = scatter.plan_moves(utils.NoneSpace(policy="pfrd", group="size"), disk_stats, to_rebin)
+
+    assert {d["from_path"]: d["path"] for d in rebinned} == {
+        "/mnt/d1/a/1": "/mnt/d2/a/1",
+        "/mnt/d1/a/2": "/mnt/d2/a/2",
+        "/mnt/d1/b/3": "/mnt/d3/b/3",
+        "/mnt/d1/c/4": "/mnt/d2/c/4",
+    }
+    assert [d["path"] for d in unplaced] == ["/mnt/d1/d/5"]
@@ -50,3 +50,11 @@ def test_cluster_by_size():
         {"duration": 108, "size": 108},
     ]
     assert similar_files.cluster_by_size(args, media) == [0, 1, 0, 2, 0, 2]
+
+
+def test_cluster_by_numbers_far_groups():
+    media = [{"exists": 2**i, "size": 2**i, "duration": 5} for i in range(40)] * 2
+    assert similar_folders.cluster_by_numbers(args, media) == list(range(40)) * 2
+
+    media = [{"exists": 10, "size": 0, "duration": 5}, {"exists": 10, "size": 1, "duration": 5}]
+    assert similar_folders.cluster_by_numbers(args, media) == [0, 1]
@@ -0,0 +1,102 @@
+import os
+
+from tests.utils import NoneSpace
+from xklb.fsdb import disk_usage
+from xklb.lb import library as lb
+from xklb.mediadb import db_folder_stats, db_media
+from xklb.utils import db_utils
+
+MEDIA = [
+    {"id": 1, "path": "/a/b/1.mp4", "size": 10, "duration": 5, "time_deleted": 0},
+    {"id": 2, "path": "/a/b/2.mp4", "size": 30, "duration": 5, "time_deleted": 0},
+    {"id": 3, "path": "/a/b/c/3.mp4", "size": 20, "duration": 1, "time_deleted": 0},
+    {"id": 4, "path": "/a/d/4.mp4", "size": 5, "duration": 2, "time_deleted": 1},
+    {"id": 5, "path": "/e/5.mp4", "size": 1, "duration": 2, "time_deleted": 0},
+]
+
+
+def get_args(temp_db):
+    args = NoneSpace(database=temp_db(), verbose=0)
+    args.db = db_utils.connect(args)
+    args.db["media"].insert_all(MEDIA, pk="id")
+    args.db["media"].create_index(["path"], unique=True)
+    return args
+
+
+def folder_stats(args):
+    return {d.pop("path"): d for d in args.db.query("SELECT * FROM folder_stats ORDER BY path")}
+
+
+def test_folder_stats_triggers(temp_db):
+    args = get_args(temp_db)
+    assert db_folder_stats.ensure(args)
+
+    stats = folder_stats(args)
+    assert stats["/a/b/"] == {
+        "parent": "/a/",
+        "depth": 3,
+        "count": 2,
+        "size": 40,
+        "duration": 10,
+        "deleted": 0,
+        "deleted_size": 0,
+        "deleted_duration": 0,
+    }
+    assert stats["/a/d/"]["deleted_size"] == 5
+    assert "/a/" not in stats
+
+    db_media.mark_media_deleted(args, ["/a/b/1.mp4"])
+    db_media.mark_media_undeleted(args, ["/a/d/4.mp4"])
+    args.db["media"].insert_all([{"id": 6, "path": "/a/b/2.mp4", "size": 50}], pk="id", replace=True)
+    args.db["media"].insert({"id": 7, "path": "/f/7.mp4", "size": 3, "duration": 1})
+    args.db.execute("UPDATE media SET path = '/a/d/5.mp4' WHERE id = 5")
+    args.db.execute("DELETE FROM media WHERE id = 3")
+
+    incremental = folder_stats(args)
+    db_folder_stats.create(args)
+    assert incremental == folder_stats(args)
+    assert incremental["/a/b/"]["size"] == 50
+    assert "/e/" not in incremental
+
+    # new columns change the triggers so the table is rebuilt
+    args.db["media"].add_column("is_dir", int)
+    assert db_folder_stats.ensure(args)
+    assert "is_dir" in args.db.pop("SELECT sql FROM sqlite_master WHERE name = 'folder_stats_media_update'")
+    assert incremental == folder_stats(args)
+
+
+def test_disk_usage_folder_stats(temp_db):
+    args = get_args(temp_db)
+    args.sort_groups_by = None
+    args.filter_sql = ["AND COALESCE(m.time_deleted,0) = 0"]
+    args.data = [d for d in MEDIA if not d["time_deleted"]]
+    assert db_folder_stats.ensure(args)
+
+    for level in range(1, 6):
+        args.folder_stats = False
+        expected = disk_usage.get_subset(args, level=level)
+        args.folder_stats = True
+        assert [(d["path"], d["size"]) for d in disk_usage.get_subset(args, level=level)] == [
+            (d["path"], d["size"]) for d in expected
+        ]
+
+    assert db_folder_stats.rollup(db_folder_stats.get_folders(args, prefix="/a/"))["/a/"]["count"] == 3
+
+
+def test_disk_usage_folder_stats_output(temp_db, temp_file_tree, monkeypatch, capsys):
+    src = temp_file_tree({"a": {"1.txt": "1", "2.txt": "22"}, "b": {"3.txt": "333"}})
+    db = temp_db()
+    lb(["fsadd", "--fs", db, src])
+    lb(["optimize", db])
+    capsys.readouterr()
+
+    outputs = []
+    for use_folder_stats in (True, False):
+        if not use_folder_stats:
+            monkeypatch.setattr(db_folder_stats, "can_use", lambda args: False)
+        for args in ([db], [db, os.path.join(src, "a") + os.sep]):
+            lb(["du", *args])
+            outputs.append(capsys.readouterr().out)
+
+    assert "rank" in outputs[1]
+    assert outputs[:2] == outputs[2:]
@@ -1,8 +1,11 @@
-import os
+import http.server, os, threading
+
+import pytest
 
 from tests.utils import connect_db_args
 from xklb.createdb.tube_add import tube_add
 from xklb.lb import library as lb
+from xklb.mediadb import db_media
 
 URL = "https://www.youtube.com/watch?v=BaW_jenozKc"
 STORAGE_PREFIX = "tests/data/"
@@ -34,3 +37,72 @@ def test_yt():
     video_id = "BaW_jenozKc"
     thumbnail_path = os.path.join(STORAGE_PREFIX, "Youtube", "Philipp Hagemeister", f"{video_id}.jpg")
     assert os.path.exists(thumbnail_path), "Thumbnail file does not exist"
+
+
+@pytest.mark.parametrize("links", [False, True])
+def test_download_per_host_threads(temp_db, temp_file_tree, links):
+    page = '<a href="/a.txt">a</a> <a href="/b.txt">b</a> <a href="/c.txt">c</a>'
+    src_dir = temp_file_tree({"a.txt": "a", "b.txt": "b", "c.txt": "c", "page.html": page})
+    out_dir = temp_file_tree({})
+    rate_limited_path = "/page.html" if links else "/b.txt"
+    requests_seen = []
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=src_dir, **kwargs)
+
+        def do_GET(self):
+            requests_seen.append(self.path)
+            if self.path == rate_limited_path and requests_seen.count(self.path) == 1:
+                self.send_error(429)
+            else:
+                super().do_GET()
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        db1 = temp_db()
+        args = connect_db_args(db1)
+        db_media.add_many(
+            args,
+            [
+                {"path": f"{base_url}/{name}", "time_created": 1, "time_modified": 0, "time_deleted": 0}
+                for name in (["page.html"] if links else ["a.txt", "b.txt", "c.txt"])
+            ],
+        )
+
+        dl_args = [
+            "dl",
+            db1,
+            "--fs",
+            f"--prefix={out_dir}",
+            "--threads=2",
+            "--same-host-threads=2",
+            "--http-retries=0",
+            "--sleep-interval=0.01",
+            *(["--links"] if links else []),
+        ]
+        lb(dl_args)
+        if links:
+            # inner links are not retried in the same run so the claim is released for the next run
+            assert requests_seen == ["/page.html"]
+            assert args.db.pop("select time_modified from media where path = ?", [f"{base_url}/page.html"]) == 0
+            lb(dl_args)
+    finally:
+        server.shutdown()
+
+    if links:
+        assert sorted(requests_seen) == ["/a.txt", "/b.txt", "/c.txt", "/page.html", "/page.html"]
+    else:
+        assert sorted(requests_seen) == ["/a.txt", "/b.txt", "/b.txt", "/c.txt"]
+    media = list(args.db.query("select path, webpath from media where time_downloaded > 0 order by path"))
+    assert [os.path.basename(d["path"]) for d in media] == ["a.txt", "b.txt", "c.txt"]
+    if links:
+        assert {d["webpath"] for d in media} == {f"{base_url}/page.html"}
+    else:
+        assert [d["webpath"] for d in media] == [f"{base_url}/{name}" for name in ("a.txt", "b.txt", "c.txt")]
+    assert all(os.path.exists(d["path"]) for d in media)
@@ -0,0 +1,44 @@
+from tests.utils import connect_db_args
+from xklb.lb import library as lb
+from xklb.mediadb import db_history, db_media
+
+
+def test_history_add(temp_db):
+    db1 = temp_db()
+    args = connect_db_args(db1)
+    db_media.add_many(
+        args,
+        [
+            {"path": "/a.mp4", "title": "a", "subtitles": [{"time": 1, "text": "hello"}]},
+            {"path": "/b.mp4", "size": 1},
+            {"path": "/a.mp4", "size": 2},
+        ],
+    )
+    assert [(d["path"], d["title"], d["size"]) for d in args.db.query("select * from media order by path")] == [
+        ("/a.mp4", "a", 2),
+        ("/b.mp4", None, 1),
+    ]
+    assert args.db.pop("select text from captions") == "hello"
+
+    lb(["history-add", db1, "/a.mp4", "/b.mp4"])
+    lb(["history-add", db1, "/a.mp4"])
+    assert args.db.pop("select count(*) from history") == 3
+
+    assert (
+        db_history.add_many(
+            args,
+            [
+                {"path": "/a.mp4", "time_played": 10, "playhead": 5},
+                {"media_id": args.db.pop("select id from media where path = '/b.mp4'"), "time_played": 20, "done": 1},
+                {"path": "/missing.mp4", "time_played": 30},
+            ],
+        )
+        == 2
+    )
+    assert [
+        (d["path"], d["playhead"], d["done"])
+        for d in args.db.query(
+            "select path, playhead, done from history join media on media.id = media_id where time_played < 100"
+            " order by time_played"
+        )
+    ] == [("/a.mp4", 5, None), ("/b.mp4", None, 1)]
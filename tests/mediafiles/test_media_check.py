@@ -1,5 +1,9 @@
+import shutil, subprocess
+from pathlib import Path
 from unittest import skip
 
+import pytest
+
 from xklb.mediafiles import media_check
 from xklb.utils import nums
 
@@ -19,3 +23,40 @@ def test_decode_quick_scan():
     assert media_check.decode_quick_scan("tests/data/corrupt.mp4", nums.calculate_segments(12, 1), 1) == 1.0
     assert media_check.decode_quick_scan("tests/data/corrupt.mp4", nums.calculate_segments(12, 2), 1) == 1.0
     assert media_check.decode_quick_scan("tests/data/corrupt.mp4", nums.calculate_segments(12, 3), 1) == 1.0
+
+
+def test_decode_quick_scan_batch_err_detect(monkeypatch):
+    commands = []
+
+    def cmd(*args, **kwargs):
+        commands.append(args)
+        return subprocess.CompletedProcess(args, 0, "", "")
+
+    monkeypatch.setattr(media_check, "which", lambda name: None if name == "systemd-run" else name)
+    monkeypatch.setattr(media_check.processes, "cmd", cmd)
+    assert media_check.decode_quick_scan("tests/data/test.mp4", list(range(12)), 1) == 0
+
+    for command in commands:
+        inputs = [i for i, arg in enumerate(command) if arg == "-i"]
+        assert len(inputs) == command.count("-err_detect")
+        for i in inputs:
+            assert command[i - 6 : i - 4] == ("-err_detect", "explode")
+
+
+@pytest.mark.skipif(not shutil.which("ffmpeg"), reason="requires ffmpeg")
+def test_decode_quick_scan_batch_late_corruption(monkeypatch, tmp_path):
+    # corrupt the second half of the stream only so the first input of each batch decodes fine
+    good = Path("tests/data/test.mp4").read_bytes()
+    bad = Path("tests/data/corrupt.mp4").read_bytes()
+    data = bytearray(good)
+    for i in range(100_000, 125_000):
+        data[i] = bad[i]
+    path = str(tmp_path / "late_corrupt.mp4")
+    Path(path).write_bytes(data)
+
+    monkeypatch.setattr(media_check, "which", lambda name: None if name == "systemd-run" else shutil.which(name))
+    segments = list(range(12))
+    per_segment = [media_check.decode_quick_scan(path, [scan], 1) for scan in segments]
+    assert per_segment[0] == 0
+    assert 0 < sum(per_segment) < len(segments)
+    assert media_check.decode_quick_scan(path, segments, 1) == sum(per_segment) / len(segments)
@@ -0,0 +1,22 @@
+from tests.utils import connect_db_args
+from xklb.lb import library as lb
+from xklb.mediadb import db_history, db_media
+
+
+def test_copy_play_counts(temp_db):
+    source_db, target_db = temp_db(), temp_db()
+    s_args = connect_db_args(source_db)
+    db_media.add_many(s_args, [{"path": "/src/a.mp4"}, {"path": "/src/b.mp4"}, {"path": "/src/c.mp4"}])
+    db_history.create(s_args)
+    db_history.add(s_args, ["/src/a.mp4"], time_played=10, playhead=5)
+    db_history.add(s_args, ["/src/b.mp4"], time_played=20, mark_done=1)
+
+    t_args = connect_db_args(target_db)
+    db_media.add_many(t_args, [{"path": "/dst/b.mp4"}, {"path": "/dst/a.mp4"}])
+
+    lb(["copy-play-counts", "--source-prefix", "/src/", "--target-prefix", "/dst/", source_db, target_db])
+
+    history = t_args.db.query(
+        "select path, time_played, playhead, done from history join media on media.id = history.media_id order by path"
+    )
+    assert [tuple(d.values()) for d in history] == [("/dst/a.mp4", 10, 5, None), ("/dst/b.mp4", 20, None, 1)]
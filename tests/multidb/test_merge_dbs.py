@@ -1,5 +1,6 @@
 from tests.utils import connect_db_args, tube_db, v_db
 from xklb.lb import library as lb
+from xklb.mediadb import db_media
 
 
 def test_merge(temp_db):
@@ -16,3 +17,15 @@ def test_split(temp_db):
 
     args = connect_db_args(db1)
     assert args.db.pop("SELECT COUNT(*) FROM media") == 2
+
+
+def test_merge_upsert(temp_db):
+    db1, db2 = temp_db(), temp_db()
+    db_media.add_many(connect_db_args(db1), [{"path": "/a", "title": "a"}, {"path": "/b", "size": 1}])
+    args = connect_db_args(db2)
+    db_media.add_many(args, [{"path": "/b", "title": "b"}])
+
+    lb(["merge-dbs", "--bk", "path", "--upsert", "-t", "media", db1, db2])
+
+    media = args.db.query("select id, path, title, size from media order by path")
+    assert [tuple(d.values()) for d in media] == [(2, "/a", "a", None), (1, "/b", "b", 1)]
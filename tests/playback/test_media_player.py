@@ -1,4 +1,4 @@
-import tempfile, unittest
+import tempfile, time, unittest
 from pathlib import Path
 from types import SimpleNamespace
 from unittest import mock
@@ -77,6 +77,24 @@ def test_prefetch(media):
     assert prep.remaining == 0
 
 
+def test_prefetch_in_background(media, monkeypatch):
+    def slow_prep_media(self, m):
+        time.sleep(0.5)
+        return m
+
+    monkeypatch.setattr(MediaPrefetcher, "prep_media", slow_prep_media)
+    args = NoneSpace(prefetch=2)
+    prep = MediaPrefetcher(args, media)
+
+    start = time.monotonic()
+    prep.fetch()
+    assert time.monotonic() - start < 0.4
+    assert len(prep.futures) == 2
+
+    assert prep.get_m() == {"path": "tests/data/test.mp4"}
+    prep.close()
+
+
 def test_wt_help(capsys):
     wt_help_text = "usage:,where,sort,--duration".split(",")
 
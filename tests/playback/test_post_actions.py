@@ -0,0 +1,22 @@
+import argparse, os
+
+import pytest
+
+from xklb.playback import post_actions
+from xklb.utils import file_utils
+
+
+@pytest.mark.skipif(not os.path.exists("/proc"), reason="requires procfs")
+def test_delete_media_skips_open_files(tmp_path):
+    open_path = tmp_path / "open.mp4"
+    closed_path = tmp_path / "closed.mp4"
+    open_path.write_text("1")
+    closed_path.write_text("2")
+
+    file_utils.open_files.get(refresh=True)  # a stale snapshot must not be trusted
+    with open(open_path):
+        deleted = post_actions.delete_media(argparse.Namespace(prefix=True), [str(open_path), str(closed_path)])
+
+    assert deleted == 1
+    assert open_path.exists()
+    assert not closed_path.exists()
@@ -1,6 +1,9 @@
+import os, sqlite3
+
 import pytest
 
 from xklb.lb import library as lb
+from xklb.utils import file_utils
 
 
 @pytest.mark.parametrize(
@@ -25,3 +28,51 @@ def test_lb_incremental_diff(args, stdout, capsys):
     lb(["incremental-diff", *args])
     captured = capsys.readouterr().out
     assert all(l in captured for l in stdout)
+
+
+def test_incremental_diff_chunks(temp_file_tree, capsys):
+    rows = [(i, i * 2) for i in range(10)]
+    changed_rows = [(i, -i if i in (3, 7) else v) for i, v in rows]
+    tmp_dir = temp_file_tree(
+        {
+            "a.csv": "id,v\n" + "\n".join(f"{i},{v}" for i, v in rows),
+            "b.csv": "id,v\n" + "\n".join(f"{i},{v}" for i, v in changed_rows),
+        }
+    )
+    path1, path2 = os.path.join(tmp_dir, "a.csv"), os.path.join(tmp_dir, "b.csv")
+
+    ((_name, chunks),) = file_utils.read_file_to_dataframe_chunks(path1, 3)
+    assert [len(df) for df in chunks] == [3, 3, 3, 1]
+
+    lb(["incremental-diff", "--batch-size=3", path1, path2])
+    assert capsys.readouterr().out.count("_only") == 4
+
+    db1 = os.path.join(tmp_dir, "a.db")
+    with sqlite3.connect(db1) as conn:
+        conn.execute("CREATE TABLE t (id, v)")
+        conn.executemany("INSERT INTO t VALUES (?, ?)", rows)
+    ((_name, chunks),) = file_utils.read_file_to_dataframe_chunks(db1, 4, start_row=1)
+    assert [df["id"].tolist() for df in chunks] == [[1, 2, 3, 4], [5, 6, 7, 8], [9]]
+
+
+def test_incremental_diff_latin1(tmp_path, capsys):
+    path1, path2 = tmp_path / "a.csv", tmp_path / "b.csv"
+    path1.write_bytes("id,name\n1,café\n2,crème\n3,brûlée\n".encode("latin-1"))
+    path2.write_bytes("id,name\n1,café\n2,crème\n3,flan\n".encode("latin-1"))
+
+    ((_name, chunks),) = file_utils.read_file_to_dataframe_chunks(str(path1), 2)
+    assert [name for df in chunks for name in df["name"]] == ["café", "crème", "brûlée"]
+
+    lb(["incremental-diff", "--batch-size=2", str(path1), str(path2)])
+    assert capsys.readouterr().out.count("_only") == 2
+
+    # the only non-UTF-8 byte is far past the first chunk and the first pandas read buffer
+    rows = "".join(f"{i},row{i}\n" for i in range(300_000))
+    path1.write_bytes(("id,name\n" + rows + "300000,café\n").encode("latin-1"))
+    path2.write_bytes(("id,name\n" + rows + "300000,flan\n").encode("latin-1"))
+
+    ((_name, chunks),) = file_utils.read_file_to_dataframe_chunks(str(path1), 100_000)
+    assert [df["name"].iloc[-1] for df in chunks][-1] == "café"
+
+    lb(["incremental-diff", "--batch-size=100000", str(path1), str(path2)])
+    assert capsys.readouterr().out.count("_only") == 2
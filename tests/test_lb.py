@@ -1,11 +1,11 @@
-import os.path, sys
+import os.path, subprocess, sys
 from pathlib import Path
 
 import pytest
 
 from tests.utils import p
 from xklb.lb import library as lb
-from xklb.lb import modules, progs
+from xklb.lb import modules, progs, subcommand_table
 from xklb.utils import iterables
 
 subcommands = list(iterables.flatten((v.keys() for _, v in progs.items())))
@@ -69,3 +69,22 @@ def test_pytest_files_exist(path):
         p("tests/playback/test_surf.py"),  # TODO: remove one line when you see this
     ):
         assert os.path.getsize(path) > 0, f"Pytest file {path} is empty."
+
+
+@pytest.mark.parametrize("subcommand", ["now", "next", "pause", "seek"])
+def test_import_budget(subcommand):
+    module_name = subcommand_table()[subcommand].rsplit(".", 1)[0]
+    r = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import xklb.lb, {module_name}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    import_times = {}
+    for line in r.stderr.splitlines()[1:]:
+        _self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        import_times[name.strip()] = int(cumulative_us)
+
+    heavy_modules = {"IPython", "bs4", "requests", "pandas", "numpy", "yt_dlp", "sqlite_utils", "rich", "tabulate"}
+    assert not heavy_modules & set(import_times)
+    assert import_times[module_name] + import_times["xklb.lb"] < 2_000_000  # microseconds
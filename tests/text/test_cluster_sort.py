@@ -62,3 +62,27 @@ red apple"""
         {"common_path": "*#1", "grouped_paths": ["green"]},
         {"common_path": "*#2", "grouped_paths": ["yellow"]},
     ]
+
+
+def test_lb_cs_image(mock_stdin, capsys, tmp_path):
+    from PIL import Image
+
+    with Image.open("tests/data/test.gif") as img:
+        img.convert("RGB").save(tmp_path / "a.png")
+        img.convert("RGB").resize((img.width // 2, img.height // 2)).save(tmp_path / "b.png")
+    paths = [str(tmp_path / "a.png"), str(tmp_path / "b.png"), "tests/data/test_frame.gif"]
+
+    image_db = str(tmp_path / "image_hashes.db")
+    for _ in range(2):  # second run reads fingerprints from the index
+        with mock_stdin("\n".join(paths)):
+            lb(["cluster-sort", "--image", "--image-db", image_db, "--print-groups"])
+        groups = json.loads(capsys.readouterr().out)
+        assert sorted(d["grouped_paths"] for d in groups) == [paths[:2], paths[2:]]
+
+
+def test_find_clusters_vocabulary_fallback():
+    from xklb.text import cluster_sort
+
+    assert cluster_sort.vectorize(["the of", "the and", "of and"]).shape == (3, 3)  # only stop words
+    assert cluster_sort.vectorize(["1", "2", "3"]).shape[0] == 3  # no words; character n-grams
+    assert len(set(cluster_sort.find_clusters(2, iter(["red apple", "red apple", "green", "yellow"])))) == 2
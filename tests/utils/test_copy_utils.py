@@ -0,0 +1,107 @@
+import errno, os, threading, time
+
+import pytest
+
+from xklb.utils import copy_utils
+
+
+def unsupported_method(fsrc, fdst):
+    raise OSError(errno.EOPNOTSUPP, "not supported")
+
+
+@pytest.mark.parametrize("methods", ["default", "buffered"])
+def test_copy_file(methods, tmp_path, monkeypatch):
+    if methods == "buffered":
+        monkeypatch.setattr(copy_utils, "COPY_METHODS", [("unsupported", unsupported_method)])
+        monkeypatch.setattr(copy_utils, "unsupported", set())
+
+    src = tmp_path / "src.bin"
+    src.write_bytes(os.urandom(3 * 1024 * 1024 + 7))
+    os.utime(src, (1_000_000, 1_000_000))
+
+    method = copy_utils.copy_file(src, tmp_path / "dest.bin")
+    assert (tmp_path / "dest.bin").read_bytes() == src.read_bytes()
+    assert os.stat(tmp_path / "dest.bin").st_mtime == 1_000_000
+    if methods == "buffered":
+        assert method == "buffered"
+        assert ("unsupported", src.stat().st_dev, src.stat().st_dev) in copy_utils.unsupported
+
+    with pytest.raises(FileExistsError):
+        copy_utils.copy_file(src, tmp_path / "dest.bin", overwrite=False)
+
+
+def test_transfer(tmp_path):
+    sources = []
+    for i in range(20):
+        p = tmp_path / f"{i}.txt"
+        p.write_text(str(i))
+        sources.append(str(p))
+    pairs = [(p, str(tmp_path / "out" / "dest.txt" if i % 5 == 0 else p + ".out")) for i, p in enumerate(sources)]
+
+    lock = threading.Lock()
+    running = []
+    max_running = 0
+
+    def fn(src, dest):
+        nonlocal max_running
+        with lock:
+            assert dest not in running  # same destination never overlaps
+            running.append(dest)
+            max_running = max(max_running, len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(dest)
+
+    prepared = []
+
+    def prepare(src, dest):
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        prepared.append(dest)
+        return src, dest
+
+    stats = copy_utils.transfer(fn, iter(pairs), prepare=prepare, threads=8, device_threads=2, queue_size=3)
+    assert stats["files"] == 20
+    assert stats["bytes"] == sum(os.stat(p).st_size for p in sources)
+    assert max_running == 2  # every job reads from and writes to the same device
+    assert prepared == [dest for _src, dest in pairs]
+
+
+def test_transfer_error(tmp_path):
+    def fn(src, dest):
+        if src == "3":
+            raise ValueError(src)
+
+    with pytest.raises(ValueError):
+        copy_utils.transfer(fn, ((str(i), str(tmp_path / str(i))) for i in range(100)), threads=2)
+
+
+def test_copy_file_methods(tmp_path, monkeypatch):
+    monkeypatch.setattr(copy_utils, "COPY_METHODS", [("unsupported", unsupported_method)])
+    monkeypatch.setattr(copy_utils, "unsupported", set())
+
+    src = tmp_path / "src.bin"
+    src.write_bytes(b"data")
+
+    with pytest.raises(OSError):
+        copy_utils.copy_file(src, tmp_path / "dest.bin", methods=["unsupported"])
+    assert not (tmp_path / "dest.bin").exists()
+
+    assert copy_utils.copy_file(src, tmp_path / "dest.bin", methods=["unsupported", "buffered"]) == "buffered"
+    assert (tmp_path / "dest.bin").read_bytes() == b"data"
+
+
+def test_copy_file_keeps_unopened_destination(tmp_path, monkeypatch):
+    src = tmp_path / "src.bin"
+    src.write_bytes(b"new")
+    dest = tmp_path / "dest.bin"
+    dest.write_bytes(b"old")
+
+    def readonly_open(path, mode="r", *args, **kwargs):
+        if "w" in mode and os.fspath(path) == os.fspath(dest):
+            raise PermissionError(errno.EACCES, "Permission denied", path)
+        return open(path, mode, *args, **kwargs)
+
+    monkeypatch.setattr(copy_utils, "open", readonly_open, raising=False)
+    with pytest.raises(PermissionError):
+        copy_utils.copy_file(src, dest)
+    assert dest.read_bytes() == b"old"
@@ -1,6 +1,9 @@
-import unittest
+import concurrent.futures, sqlite3, threading, unittest
 from unittest.mock import patch
 
+import pytest
+
+from tests.utils import NoneSpace
 from xklb.utils import consts, db_utils, sql_utils
 
 
@@ -84,3 +87,43 @@ class TestMostSimilarSchema(unittest.TestCase):
         keys = []
         result = db_utils.most_similar_schema(keys, existing_tables)
         self.assertIsNone(result)
+
+
+def test_db_writer(temp_db):
+    db1 = temp_db()
+    args = NoneSpace(database=db1, verbose=0)
+    args.db = db_utils.connect(args)
+    args.db_writer = db_utils.DBWriter(args)
+
+    def insert(args, i):
+        args.db["t"].insert({"i": i, "thread": threading.current_thread().name})
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda i: db_utils.write(args, insert, i), range(20)))
+    db_utils.flush_writes(args)
+    assert args.db.pop("select count(*) from t") == 20
+    assert {d["thread"] for d in args.db.query("select distinct thread from t")} == {"db_writer_0"}
+
+    db_utils.write(args, lambda args: args.db.execute("select * from missing_table"))
+    with pytest.raises(sqlite3.OperationalError):
+        args.db_writer.close()
+
+
+def test_profile_sql(temp_db, monkeypatch):
+    profiler = db_utils.SQLProfiler()
+    monkeypatch.setattr(db_utils, "_profiler", profiler)
+
+    args = NoneSpace(database=temp_db(), verbose=0, profile_sql=True)
+    args.db = db_utils.connect(args)
+    args.db["media"].insert_all([{"id": i, "path": f"/{i}", "size": i} for i in range(10)], pk="id")
+    args.db["media"].create_index(["path"])
+
+    assert len(list(args.db.query("SELECT * FROM media m WHERE m.size > 5"))) == 4
+    assert len(list(args.db.query("WITH m AS (SELECT * FROM media) SELECT * FROM m WHERE path = '/1'"))) == 1
+
+    q1, q2 = [q for q in profiler.queries.values() if q["sql"].startswith(("SELECT", "WITH"))]
+    assert q1["calls"] == 1
+    assert q1["rows"] == 4
+    assert q1["full_scans"] == ["media"]
+    assert q1["suggestions"] == ["CREATE INDEX idx_media_size ON media(size)"]
+    assert q2["full_scans"] == []
@@ -0,0 +1,16 @@
+import os, tempfile
+
+import pytest
+
+from xklb.utils import file_utils
+
+
+@pytest.mark.skipif(not os.path.exists("/proc"), reason="requires procfs")
+def test_is_file_open():
+    with tempfile.NamedTemporaryFile() as f:
+        open_path = os.path.realpath(f.name)
+        file_utils.open_files.get(refresh=True)
+        assert file_utils.is_file_open(open_path)
+
+        closed_path = tempfile.mktemp()
+        assert file_utils.are_files_open([open_path, closed_path]) == [True, False]
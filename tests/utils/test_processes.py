@@ -0,0 +1,49 @@
+import os, shutil, threading, time
+
+from xklb.utils import processes
+
+
+def test_ffprobe_cache(tmp_path):
+    cache = processes.FFProbeCache(str(tmp_path / "ffprobe.db"), max_entries=1)
+    path = str(tmp_path / "test.mp4")
+    shutil.copy("tests/data/test.mp4", path)
+    stat = os.stat(path)
+
+    assert cache.get(path, stat) is None
+    d = processes.ffprobe_json(path)
+    cache.set(path, stat, d)
+    assert cache.get(path, stat) == d
+
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert cache.get(path, os.stat(path)) is None
+
+
+def test_ffprobe_cached():
+    probe = processes.FFProbe("tests/data/test.mp4")
+    cached_probe = processes.FFProbe("tests/data/test.mp4")
+    assert cached_probe.streams == probe.streams
+    assert cached_probe.duration == probe.duration
+
+
+def test_schedule_jobs():
+    lock = threading.Lock()
+    running = []
+    peaks = {"cost": 0, "key": 0}
+
+    def fn(job):
+        with lock:
+            running.append(job)
+            peaks["cost"] = max(peaks["cost"], sum(min(d["cost"], 4) for d in running))
+            peaks["key"] = max(peaks["key"], sum(d["key"] == "a" for d in running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(job)
+        return job["i"]
+
+    jobs = [{"i": i, "cost": i % 3 + 1, "work": i, "key": "a" if i % 2 else "b"} for i in range(20)]
+    jobs.append({"i": 20, "cost": 10, "work": 1, "key": "c"})  # more than the whole budget
+    results = [future.result() for _job, future in processes.schedule_jobs(fn, jobs, cpu_budget=4, key_limit=2)]
+
+    assert sorted(results) == list(range(21))
+    assert peaks["cost"] <= 4
+    assert peaks["key"] <= 2
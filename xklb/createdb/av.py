@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
@@ -17,13 +18,21 @@ def get_subtitle_tags(path, streams, scan_subtitles=False) -> dict:
         internal_subtitles = subtitle.externalize_internal_subtitles(path, streams)
         external_subtitles = subtitle.get_external(path)
 
-        for subtitle_path in internal_subtitles + external_subtitles:
+        def read_sub(subtitle_path):
             try:
-                captions = subtitle.read_sub(subtitle_path)
+                return subtitle.read_sub(subtitle_path)
             except UnicodeDecodeError:
                 log.warning(f"Could not decode subtitle {subtitle_path} for {path}")
-            else:
-                subtitles.extend(captions)
+                return []
+
+        subtitle_paths = internal_subtitles + external_subtitles
+        if len(subtitle_paths) > 1:
+            with ThreadPoolExecutor(max_workers=min(len(subtitle_paths), 4)) as pool:
+                for captions in pool.map(read_sub, subtitle_paths):
+                    subtitles.extend(captions)
+        else:
+            for subtitle_path in subtitle_paths:
+                subtitles.extend(read_sub(subtitle_path))
     else:
         external_subtitles = []
 
@@ -128,7 +137,7 @@ def munge_av_tags(args, path) -> dict:
     except processes.UnplayableFile as e:
         log.error(f"Failed reading header. {path}")
         log.debug(e)
-        if getattr(args, "delete_unplayable", False) and not file_utils.is_file_open(path):
+        if getattr(args, "delete_unplayable", False) and not file_utils.is_file_open(path, refresh=True):
             file_utils.trash(args, path, detach=False)
             media["time_deleted"] = consts.APPLICATION_START
         media["error"] = "Metadata check failed"
@@ -170,7 +179,7 @@ def munge_av_tags(args, path) -> dict:
 
         if media_check.corruption_threshold_exceeded(
             args.delete_corrupt, corruption, duration
-        ) and not file_utils.is_file_open(path):
+        ) and not file_utils.is_file_open(path, refresh=True):
             threshold_str = (
                 strings.safe_percent(args.delete_corrupt)
                 if 0 < args.delete_corrupt < 1
@@ -1,6 +1,8 @@
-import argparse, json, math, os, re, sys
+import argparse, json, os, queue, re, sqlite3, sys, threading
+from collections import deque
+from collections.abc import Iterable, Iterator
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
-from functools import partial
+from fnmatch import fnmatch
 from multiprocessing import TimeoutError as mp_TimeoutError
 from pathlib import Path
 from shutil import which
@@ -25,6 +27,7 @@ from xklb.utils import (
     path_utils,
     printing,
     processes,
+    sql_utils,
     strings,
 )
 from xklb.utils.consts import SC, DBType
@@ -56,6 +59,11 @@ def parse_args(action, usage):
         "--force", "-f", action="store_true", help="Mark all subpath files as deleted if no files found"
     )
     parser.add_argument("--move")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Skip folders whose modification time has not changed since the last scan",
+    )
 
     arggroups.debug(parser)
 
@@ -171,12 +179,6 @@ def extract_metadata(mp_args, path) -> dict[str, str | int | None] | None:
     if getattr(mp_args, "hash", False) and media["type"] != "directory" and media["size"] > 0:
         media["hash"] = sample_hash.sample_hash_file(path)
 
-    if getattr(mp_args, "move", False) and not file_utils.is_file_open(path):
-        dest_path = rel_mv.gen_rel_path(path, mp_args.move)
-        dest_path = path_utils.clean_path(bytes(dest_path))
-        file_utils.rename_move_file(path, dest_path, simulate=mp_args.simulate)
-        path = media["path"] = dest_path
-
     if getattr(mp_args, "process", False):
         if objects.is_profile(mp_args, DBType.audio) and Path(path).suffix not in [".opus", ".mka"]:
             result = process_ffmpeg.process_path(
@@ -340,6 +342,17 @@ def extract_image_metadata_chunk(metadata: list[dict]) -> list[dict]:
     return exif_enriched
 
 
+def move_chunk(args, media) -> None:
+    # one /proc scan per chunk instead of one per file
+    for d, is_open in zip(media, file_utils.are_files_open([d["path"] for d in media])):
+        if is_open or not d["size"] or not os.path.exists(d["path"]):
+            continue
+        dest_path = rel_mv.gen_rel_path(d["path"], args.move)
+        dest_path = path_utils.clean_path(bytes(dest_path))
+        file_utils.rename_move_file(d["path"], dest_path, simulate=args.simulate)
+        d["path"] = dest_path
+
+
 def extract_chunk(args, media) -> None:
     if objects.is_profile(args, DBType.image):
         media = extract_image_metadata_chunk(media)
@@ -368,109 +381,278 @@ def extract_chunk(args, media) -> None:
     media = [{"playlists_id": args.playlists_id, **d} for d in media]
     args.db["media"].insert_all(media, pk="id", alter=True, replace=True)
 
-    for d in captions:
-        media_id = args.db.pop("select id from media where path = ?", [d["path"]])
-        if len(d["chapters"]) > 0:
-            args.db["captions"].insert_all([{**d, "media_id": media_id} for d in d["chapters"]], alter=True)
-        if len(d["subtitles"]) > 0:
-            args.db["captions"].insert_all([{**d, "media_id": media_id} for d in d["subtitles"]], alter=True)
-        if d.get("caption_t0"):
-            args.db["captions"].insert({**d["caption_t0"], "media_id": media_id}, alter=True)
+    captions = [d for d in captions if d["chapters"] or d["subtitles"] or d.get("caption_t0")]
+    if captions:
+        path_ids = db_media.get_ids(args, [d["path"] for d in captions])
+        args.db["captions"].insert_all(
+            [
+                {**caption, "media_id": path_ids.get(d["path"])}
+                for d in captions
+                for caption in [*d["chapters"], *d["subtitles"], *([d["caption_t0"]] if d.get("caption_t0") else [])]
+            ],
+            alter=True,
+        )
 
 
-def find_new_files(args, path) -> list[str]:
-    if path.is_file():
-        scanned_set = {str(path)}
-    else:
-        for s in args.profiles:
-            if getattr(DBType, s, None) is None:
-                msg = f"fs_extract for profile {s}"
-                raise NotImplementedError(msg)
-
-        exts = args.ext
-        if not exts:
-            exts = set()
-            if args.scan_all_files or DBType.filesystem in args.profiles:
-                exts = None
-            else:
-                if DBType.audio in args.profiles:
-                    exts |= consts.AUDIO_ONLY_EXTENSIONS
-                if DBType.video in args.profiles:
-                    exts |= consts.VIDEO_EXTENSIONS
+def scan_extensions(args) -> set[str] | None:
+    exts = set(args.ext)
+    if not exts:
+        if args.scan_all_files or DBType.filesystem in args.profiles:
+            return None
 
-                if DBType.image in args.profiles:
-                    exts |= consts.IMAGE_EXTENSIONS
+        if DBType.audio in args.profiles:
+            exts |= consts.AUDIO_ONLY_EXTENSIONS
+        if DBType.video in args.profiles:
+            exts |= consts.VIDEO_EXTENSIONS
 
-                if DBType.text in args.profiles:
-                    exts |= consts.TEXTRACT_EXTENSIONS
-                if args.ocr:
-                    exts |= consts.OCR_EXTENSIONS
-                if args.speech_recognition:
-                    exts |= consts.SPEECH_RECOGNITION_EXTENSIONS
+        if DBType.image in args.profiles:
+            exts |= consts.IMAGE_EXTENSIONS
 
-        scanned_set = file_utils.rglob(path, exts or None, args.exclude)[0]
+        if DBType.text in args.profiles:
+            exts |= consts.TEXTRACT_EXTENSIONS
+        if args.ocr:
+            exts |= consts.OCR_EXTENSIONS
+        if args.speech_recognition:
+            exts |= consts.SPEECH_RECOGNITION_EXTENSIONS
+
+    return exts or None
 
-    m_columns = db_utils.columns(args, "media")
 
+def get_media_sets(args, path) -> tuple[set[str], set[str]] | None:
+    m_columns = db_utils.columns(args, "media")
     try:
-        deleted_set = {
-            d["path"]
-            for d in args.db.query(
-                f"""select path from media
+        media = list(
+            args.db.query(
+                f"""select path, time_deleted from media
                 where 1=1
-                    and time_deleted > 0
-                    and path like '{path}%'
+                    and path >= ? and path < ?
                     {'AND time_downloaded > 0' if 'time_downloaded' in m_columns else ''}
                 """,
+                sql_utils.prefix_range(str(path)),
             )
-        }
+        )
     except Exception as e:
         log.debug(e)
+        return None
+
+    existing_set = {d["path"] for d in media if not d["time_deleted"]}
+    deleted_set = {d["path"] for d in media if d["time_deleted"]}
+    return existing_set, deleted_set
+
+
+def mark_scanned_media(args, path, scanned_set, existing_set, deleted_set) -> bool:
+    undeleted_files = list(deleted_set.intersection(scanned_set))
+    undeleted_count = db_media.mark_media_undeleted(args, undeleted_files)
+    if undeleted_count > 0:
+        print(f"[{path}] Marking", undeleted_count, "metadata records as undeleted")
+
+    deleted_files = list(existing_set - scanned_set)
+    if not scanned_set and len(deleted_files) >= len(existing_set) and not args.force:
+        print(f"[{path}] Path empty or device not mounted. Rerun with -f to mark all subpaths as deleted.")
+        return False  # if path not mounted or all files deleted
+    deleted_count = db_media.mark_media_deleted(args, deleted_files)
+    if deleted_count > 0:
+        print(f"[{path}] Marking", deleted_count, "orphaned metadata records as deleted")
+    return True
+
+
+def check_profiles(args) -> None:
+    for s in args.profiles:
+        if getattr(DBType, s, None) is None:
+            msg = f"fs_extract for profile {s}"
+            raise NotImplementedError(msg)
+
+
+def find_new_files(args, path) -> list[str]:
+    if path.is_file():
+        scanned_set = {str(path)}
     else:
-        undeleted_files = list(deleted_set.intersection(scanned_set))
-        undeleted_count = db_media.mark_media_undeleted(args, undeleted_files)
-        if undeleted_count > 0:
-            print(f"[{path}] Marking", undeleted_count, "metadata records as undeleted")
+        check_profiles(args)
+        scanned_set = file_utils.rglob(path, scan_extensions(args), args.exclude)[0]
+
+    media_sets = get_media_sets(args, path)
+    if media_sets is None:
+        new_files = list(scanned_set)
+    else:
+        existing_set, deleted_set = media_sets
+        if not mark_scanned_media(args, path, scanned_set, existing_set, deleted_set):
+            return []
+        new_files = list(scanned_set - existing_set)
+
+    new_files.sort(key=len, reverse=True)
+    return new_files
+
 
+def gen_new_files(args, path, existing_set: set[str], scanned_set: set[str]) -> Iterator[str]:
+    check_profiles(args)
+    for p in file_utils.rglob_gen(path, scan_extensions(args), args.exclude):
+        scanned_set.add(p)
+        if p not in existing_set:
+            yield p
+
+
+def scan_filters(args) -> str:
+    extensions = scan_extensions(args)
+    return json.dumps(
+        {
+            "extensions": None if extensions is None else sorted(extensions),
+            "exclude": sorted(args.exclude or []),
+            "profiles": sorted(args.profiles),
+        }
+    )
+
+
+def get_scan_manifest(args, path) -> dict[str, tuple[int, int]]:
+    # folders scanned with different filters might contain files which were skipped so they are scanned again
     try:
-        existing_set = {
-            d["path"]
+        return {
+            d["path"]: (d["mtime"], d["inode"])
             for d in args.db.query(
-                f"""select path from media
-                where 1=1
-                    and path like ?
-                    and coalesce(time_deleted, 0) = 0
-                    {'AND time_downloaded > 0' if 'time_downloaded' in m_columns else ''}
-                """,
-                [str(path) + "%"],
+                """SELECT path, mtime, inode FROM scan_manifest
+                WHERE (path = ? OR (path >= ? AND path < ?))
+                    AND filters = ?""",
+                [str(path), *sql_utils.prefix_range(str(path) + os.sep), scan_filters(args)],
             )
         }
-    except Exception as e:
+    except sqlite3.OperationalError as e:
         log.debug(e)
-        new_files = list(scanned_set)
-    else:
-        new_files = list(scanned_set - existing_set)
+        return {}
+
+
+def save_scan_manifest(args, folders: dict[str, tuple[int, int]], removed_folders: list[str]) -> None:
+    if folders:
+        filters = scan_filters(args)
+        args.db["scan_manifest"].upsert_all(
+            [
+                {
+                    "path": k,
+                    "mtime": mtime,
+                    "inode": inode,
+                    "filters": filters,
+                    "time_scanned": consts.APPLICATION_START,
+                }
+                for k, (mtime, inode) in folders.items()
+            ],
+            pk="path",
+            alter=True,
+        )
+    for chunk_paths in iterables.chunks(removed_folders, consts.SQLITE_PARAM_LIMIT):
+        with args.db.conn:
+            args.db.conn.execute(
+                "DELETE FROM scan_manifest WHERE path IN (" + ",".join(["?"] * len(chunk_paths)) + ")",
+                chunk_paths,
+            )
 
-        deleted_files = list(existing_set - scanned_set)
-        if not scanned_set and len(deleted_files) >= len(existing_set) and not args.force:
-            print(f"[{path}] Path empty or device not mounted. Rerun with -f to mark all subpaths as deleted.")
-            return []  # if path not mounted or all files deleted
-        deleted_count = db_media.mark_media_deleted(args, deleted_files)
-        if deleted_count > 0:
-            print(f"[{path}] Marking", deleted_count, "orphaned metadata records as deleted")
 
-    new_files.sort(key=len, reverse=True)
-    return new_files
+def scan_changed_folders(path, manifest, extensions=None, exclude=None):
+    known_subfolders = {}
+    for folder in manifest:
+        known_subfolders.setdefault(os.path.dirname(folder), []).append(folder)
 
+    changed_folders = {}  # folder -> files directly inside
+    folder_stats = {}
+    stack = [str(path)]
+    while stack:
+        current_dir = stack.pop()
+        try:
+            stat = os.stat(current_dir)  # before scandir so that concurrent changes are picked up next time
+        except OSError:
+            continue
 
-def scan_path(args, path_str: str) -> int:
-    path = Path(path_str).expanduser().resolve()
-    if not path.exists():
-        print(f"[{path}] Path does not exist")
-        if args.force:
-            playlists.delete_playlists(args, [str(path)])
-        return 0
+        folder_stats[current_dir] = (stat.st_mtime_ns, stat.st_ino)
+        if manifest.get(current_dir) == folder_stats[current_dir]:
+            # the folder listing has not changed so the known subfolders are still its subfolders
+            stack.extend(known_subfolders.get(current_dir, []))
+            continue
+
+        files = set()
+        try:
+            scanned_dir = os.scandir(current_dir)
+        except (FileNotFoundError, PermissionError):
+            pass
+        else:
+            for entry in scanned_dir:
+                if entry.is_dir(follow_symlinks=False):
+                    if not any(entry.name == pattern or fnmatch(entry.path, pattern) for pattern in exclude or []):
+                        stack.append(entry.path)
+                elif entry.is_symlink():
+                    pass
+                elif extensions is None or entry.path.rsplit(".", 1)[-1].lower() in extensions:
+                    files.add(entry.path)
+        changed_folders[current_dir] = files
+
+    removed_folders = [s for s in manifest if s not in folder_stats]
+    for folder in removed_folders:
+        changed_folders[folder] = set()
+
+    return changed_folders, folder_stats, removed_folders
+
+
+def get_folder_media(args, folder, m_columns) -> list[dict]:
+    prefix = folder + os.sep
+    return list(
+        args.db.query(
+            f"""select path, time_deleted from media
+            where 1=1
+                and path >= ? and path < ?
+                and instr(substr(path, ?), ?) = 0
+                {'AND time_downloaded > 0' if 'time_downloaded' in m_columns else ''}
+            """,
+            [*sql_utils.prefix_range(prefix), len(prefix) + 1, os.sep],
+        )
+    )
+
+
+def find_new_files_incremental(args, path) -> tuple[list[str], dict[str, tuple[int, int]], list[str]]:
+    manifest = get_scan_manifest(args, path)
+    changed_folders, folder_stats, removed_folders = scan_changed_folders(
+        path, manifest, scan_extensions(args), args.exclude
+    )
+    log.info("[%s] %s of %s folders changed", path, len(changed_folders), len(folder_stats))
+
+    m_columns = db_utils.columns(args, "media")
+    if not m_columns:
+        new_files = [s for files in changed_folders.values() for s in files]
+        new_files.sort(key=len, reverse=True)
+        return new_files, folder_stats, removed_folders
+
+    if manifest:
+        folder_media = [d for folder in changed_folders for d in get_folder_media(args, folder, m_columns)]
+    else:  # first scan: one query for the whole subtree is cheaper than one per folder
+        folder_media = list(
+            args.db.query(
+                f"""select path, time_deleted from media
+                where path >= ? and path < ?
+                {'AND time_downloaded > 0' if 'time_downloaded' in m_columns else ''}
+                """,
+                sql_utils.prefix_range(str(path) + os.sep),
+            )
+        )
+        folder_media = [d for d in folder_media if os.path.dirname(d["path"]) in changed_folders]
 
+    scanned_set = set().union(*changed_folders.values())
+    existing_set = {d["path"] for d in folder_media if not d["time_deleted"]}
+    deleted_set = {d["path"] for d in folder_media if d["time_deleted"]}
+
+    is_root_empty = str(path) in changed_folders and len(folder_stats) == 1 and not scanned_set
+    if is_root_empty and existing_set and not args.force:
+        print(f"[{path}] Path empty or device not mounted. Rerun with -f to mark all subpaths as deleted.")
+        return [], {}, []
+
+    undeleted_count = db_media.mark_media_undeleted(args, list(deleted_set.intersection(scanned_set)))
+    if undeleted_count > 0:
+        print(f"[{path}] Marking", undeleted_count, "metadata records as undeleted")
+
+    deleted_count = db_media.mark_media_deleted(args, list(existing_set - scanned_set))
+    if deleted_count > 0:
+        print(f"[{path}] Marking", deleted_count, "orphaned metadata records as deleted")
+
+    new_files = list(scanned_set - existing_set)
+    new_files.sort(key=len, reverse=True)
+    return new_files, folder_stats, removed_folders
+
+
+def extract_new_files(args, path, new_files: Iterable[str]) -> int:
     n_jobs = None
     if args.verbose >= consts.LOG_DEBUG:
         n_jobs = 1
@@ -478,6 +660,99 @@ def scan_path(args, path_str: str) -> int:
         n_jobs = args.threads
 
     threadsafe = [DBType.audio, DBType.video, DBType.filesystem]
+    if all(s in threadsafe for s in args.profiles):
+        pool_fn = ThreadPoolExecutor
+    else:
+        pool_fn = ProcessPoolExecutor
+
+    if DBType.text in args.profiles:
+        batch_count = int(os.cpu_count() or 4)
+    elif DBType.image in args.profiles:
+        batch_count = consts.SQLITE_PARAM_LIMIT // 20
+    else:
+        batch_count = consts.SQLITE_PARAM_LIMIT // 100
+
+    mp_args = argparse.Namespace(playlist_path=path, **{k: v for k, v in args.__dict__.items() if k not in {"db"}})
+
+    # the file walk and job submission run in a feeder thread and database writes run in a writer thread
+    # so that this thread only moves results between them
+    results = queue.Queue()
+    slots = threading.Semaphore((n_jobs or os.cpu_count() or 4) * 4)
+    stop = threading.Event()
+
+    def on_done(future):
+        slots.release()
+        results.put(future)
+
+    def submit_all(parallel) -> int:
+        submitted = 0
+        for p in new_files:
+            slots.acquire()
+            if stop.is_set():
+                break
+            parallel.submit(extract_metadata, mp_args, p).add_done_callback(on_done)
+            submitted += 1
+        return submitted
+
+    def write_chunk(w_args, chunk) -> int:
+        if getattr(w_args, "move", False):
+            move_chunk(w_args, chunk)
+        extract_chunk(w_args, chunk)
+        return len(chunk)
+
+    writer = db_utils.DBWriter(args)
+    writes = deque()
+    written = 0
+
+    def wait_for_writes(max_pending) -> None:
+        nonlocal written
+        while len(writes) > max_pending:
+            written += writes.popleft().result()
+
+    received = 0
+    metadata = []
+    try:
+        with pool_fn(n_jobs) as parallel, ThreadPoolExecutor(1) as feeder_pool:
+            feeder = feeder_pool.submit(submit_all, parallel)
+            try:
+                while not (feeder.done() and received == feeder.result()):
+                    try:
+                        future = results.get(timeout=0.5)
+                    except queue.Empty:
+                        continue
+                    received += 1
+
+                    m = future.result()
+                    if m:
+                        metadata.append(m)
+                    if len(metadata) >= batch_count:
+                        writes.append(writer.submit(write_chunk, metadata))
+                        metadata = []
+                        wait_for_writes(1)  # don't let extracted metadata pile up if writing is slower
+                        printing.print_overwrite(f"[{path}] Added {written} new media")
+
+                if metadata:
+                    writes.append(writer.submit(write_chunk, metadata))
+                wait_for_writes(0)
+            except BaseException:
+                stop.set()
+                slots.release()  # wake up the feeder if it is waiting for a slot
+                raise
+    finally:
+        writer.close()
+
+    if written:
+        print(f"\r[{path}] Added {written} new media")
+    return written
+
+
+def scan_path(args, path_str: str) -> int:
+    path = Path(path_str).expanduser().resolve()
+    if not path.exists():
+        print(f"[{path}] Path does not exist")
+        if args.force:
+            playlists.delete_playlists(args, [str(path)])
+        return 0
 
     info = {
         "extractor_key": "Local",
@@ -487,41 +762,24 @@ def scan_path(args, path_str: str) -> int:
     args.playlists_id = db_playlists.add(args, str(path), info, check_subpath=True)
 
     print(f"[{path}] Building file list...")
-    new_files = find_new_files(args, path)
-    if new_files:
-        print(f"[{path}] Adding {len(new_files)} new media")
-        # log.debug(new_files)
-
-        if DBType.text in args.profiles:
-            batch_count = int(os.cpu_count() or 4)
-        elif DBType.image in args.profiles:
-            batch_count = consts.SQLITE_PARAM_LIMIT // 20
-        else:
-            batch_count = consts.SQLITE_PARAM_LIMIT // 100
-        chunks_count = math.ceil(len(new_files) / batch_count)
-        files_chunked = iterables.chunks(new_files, batch_count)
-
-        if all(s in threadsafe for s in args.profiles):
-            pool_fn = ThreadPoolExecutor
-        else:
-            pool_fn = ProcessPoolExecutor
-
-        with pool_fn(n_jobs) as parallel:
-            for idx, chunk_paths in enumerate(files_chunked):
-                percent = ((batch_count * idx) + len(chunk_paths)) / len(new_files) * 100
-                printing.print_overwrite(
-                    f"[{path}] Extracting metadata chunk {idx + 1} of {chunks_count} ({percent:3.1f}%)"
-                )
-
-                mp_args = argparse.Namespace(
-                    playlist_path=path, **{k: v for k, v in args.__dict__.items() if k not in {"db"}}
-                )
-                metadata = parallel.map(partial(extract_metadata, mp_args), chunk_paths)
-                metadata = list(filter(None, metadata))
-                extract_chunk(args, metadata)
-            print()
-
-    return len(new_files)
+    if path.is_file():
+        return extract_new_files(args, path, find_new_files(args, path))
+
+    if args.incremental:
+        new_files, folder_stats, removed_folders = find_new_files_incremental(args, path)
+        new_files_count = extract_new_files(args, path, new_files)
+        # only save after media is saved so that interrupted scans are retried
+        save_scan_manifest(args, folder_stats, removed_folders)
+        return new_files_count
+
+    # stream new files to metadata extraction while the folder walk is still running
+    media_sets = get_media_sets(args, path)
+    existing_set, deleted_set = media_sets or (set(), set())
+    scanned_set = set()
+    new_files_count = extract_new_files(args, path, gen_new_files(args, path, existing_set, scanned_set))
+    if media_sets is not None:
+        mark_scanned_media(args, path, scanned_set, existing_set, deleted_set)
+    return new_files_count
 
 
 def extractor(args, paths) -> None:
@@ -158,6 +158,7 @@ def consolidate_media(args, path: str) -> dict:
 
 
 def add_media(args, variadic):
+    media = []
     for path_or_dict in variadic:
         if isinstance(path_or_dict, str):
             path = strings.strip_enclosing_quotes(path_or_dict)
@@ -165,8 +166,9 @@ def add_media(args, variadic):
         else:
             d = consolidate_media(args, strings.strip_enclosing_quotes(path_or_dict.pop("path")))
             d = objects.dict_filter_bool({**d, **path_or_dict})
+        media.append(d)
 
-        db_media.add(args, d)
+    db_media.add_many(args, media)
 
 
 def set_page(input_string, page_key, page_number):
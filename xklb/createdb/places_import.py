@@ -58,8 +58,7 @@ def places_import() -> None:
         df["time_created"] = int(file_stats.st_mtime) or int(file_stats.st_ctime)
 
         data = df.to_dict(orient="records")
-        for d in data:
-            db_media.add(args, objects.dict_filter_bool(d))
+        db_media.add_many(args, [objects.dict_filter_bool(d) for d in data])
 
 
 if __name__ == "__main__":
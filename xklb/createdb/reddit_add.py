@@ -174,7 +174,7 @@ def slim_post_data(d: dict, subreddit=None) -> dict:
     }
 
 
-def save_post(args, post_dict, subreddit_path) -> None:
+def save_post(args, post_dict, subreddit_path) -> dict | None:
     slim_dict = objects.dict_filter_bool(slim_post_data(post_dict, subreddit_path))
 
     if slim_dict:
@@ -197,7 +197,8 @@ def save_post(args, post_dict, subreddit_path) -> None:
         elif "selftext" in slim_dict:
             args.db["reddit_posts"].upsert(slim_dict, pk=["path"], alter=True)
         else:
-            db_media.add(args, slim_dict)
+            return slim_dict  # media entries are written in batches by the caller
+    return None
 
 
 def since_last_created(args, playlist_path):
@@ -233,9 +234,11 @@ def redditor_new(args, redditor_dict) -> None:
     _takewhile = since_last_created(args, user_path)
     log.info("[%s]: Getting new posts", user_path)
 
+    media = []
     for s in takewhile(_takewhile, user.submissions.new(limit=args.limit)):
         s.time_created = s.created_utc
-        save_post(args, saveable(s), user_path)
+        media.append(save_post(args, saveable(s), user_path))
+    db_media.add_many(args, filter(None, media))
 
 
 def subreddit_new(args, subreddit_dict) -> None:
@@ -244,6 +247,7 @@ def subreddit_new(args, subreddit_dict) -> None:
 
     _takewhile = since_last_created(args, subreddit_path)
     log.info("[%s]: Getting new posts", subreddit_path)
+    media = []
     for idx, post in enumerate(takewhile(_takewhile, subreddit.new(limit=args.limit))):
         post_dict = saveable(post)
 
@@ -260,7 +264,8 @@ def subreddit_new(args, subreddit_dict) -> None:
                 ),
             )
 
-        save_post(args, post_dict, subreddit_path)
+        media.append(save_post(args, post_dict, subreddit_path))
+    db_media.add_many(args, filter(None, media))
 
 
 def subreddit_top(args, subreddit_dict) -> None:
@@ -276,8 +281,10 @@ def subreddit_top(args, subreddit_dict) -> None:
     _takewhile = since_last_created(args, subreddit_path)
     for time_filter in time_filters:
         log.info("[%s]: Getting top posts for time_filter '%s'", subreddit, time_filter)
+        media = []
         for post in takewhile(_takewhile, subreddit.top(time_filter, limit=args.limit)):
-            save_post(args, saveable(post), subreddit_path)
+            media.append(save_post(args, saveable(post), subreddit_path))
+        db_media.add_many(args, filter(None, media))
 
 
 skip_errors = (prawcore.exceptions.NotFound, prawcore.exceptions.Forbidden, prawcore.exceptions.Redirect)
@@ -21,7 +21,7 @@ def parse_args() -> argparse.Namespace:
     return args
 
 
-def save_page(args, url):
+def save_page(args, url) -> dict | None:
     response = web.get(args, url)
     if response:
         soup = BeautifulSoup(response.text, "lxml")
@@ -42,13 +42,14 @@ def save_page(args, url):
             "text": soup.select_one("div.body").prettify(),  # type: ignore
         }
 
-        db_media.add(args, article)
+        return article
+    return None
 
 
 def substack():
     args = parse_args()
-    for path in args.paths:
-        save_page(args, path)
+    articles = [save_page(args, path) for path in args.paths]
+    db_media.add_many(args, filter(None, articles))
 
 
 if __name__ == "__main__":
@@ -31,6 +31,32 @@ def extract_from_video(path, stream_index) -> str | None:
     return temp_srt
 
 
+def extract_all_from_video(path, stream_indexes) -> list[str]:
+    # one demux pass for every subtitle stream instead of re-reading the whole container for each stream
+    if len(stream_indexes) <= 1:
+        return iterables.conform([extract_from_video(path, stream_index) for stream_index in stream_indexes])
+
+    Path(SUB_TEMP_DIR).mkdir(parents=True, exist_ok=True)
+    temp_srts = [tempfile.mktemp(".srt", dir=SUB_TEMP_DIR) for _ in stream_indexes]
+
+    input_file = ffmpeg.input(path)
+    try:
+        ffmpeg.merge_outputs(
+            *[
+                input_file.output(temp_srt, map="0:" + str(stream_index))
+                for stream_index, temp_srt in zip(stream_indexes, temp_srts)
+            ]
+        ).global_args("-nostdin").run(quiet=True)
+    except ffmpeg.Error as e:
+        log.info("Could not extract subtitles in one pass. Retrying each stream separately %s", path)
+        log.debug(e.stderr.decode())
+        for temp_srt in temp_srts:
+            Path(temp_srt).unlink(missing_ok=True)
+        return iterables.conform([extract_from_video(path, stream_index) for stream_index in stream_indexes])
+
+    return temp_srts
+
+
 def convert_to_srt(path) -> str:
     Path(SUB_TEMP_DIR).mkdir(parents=True, exist_ok=True)
     temp_srt = tempfile.mktemp(".srt", dir=SUB_TEMP_DIR)
@@ -100,11 +126,7 @@ def externalize_internal_subtitles(path, streams=None) -> list[str]:
     if streams is None:
         streams = processes.FFProbe(path).streams
 
-    external_paths = iterables.conform(
-        [extract_from_video(path, s["index"]) for s in streams if is_text_subtitle_stream(s)],
-    )
-
-    return external_paths
+    return extract_all_from_video(path, [s["index"] for s in streams if is_text_subtitle_stream(s)])
 
 
 def get_external(file) -> list[str]:
@@ -52,11 +52,7 @@ def get_new_paths(args, paths) -> list[str]:
     else:
         if existing:
             print(f"Updating frequency for {len(existing)} existing paths")
-            with args.db.conn:  # type: ignore
-                for p in list(existing):
-                    args.db.conn.execute(  # type: ignore
-                        "DELETE from history WHERE media_id = (select id from media where path = ?)", [p]
-                    )
+            db_history.remove(args, list(existing))
             db_media.mark_media_deleted(args, list(existing))
 
     paths = iterables.conform([path.strip() for path in paths])
@@ -85,8 +81,7 @@ def tabs_add(args=None) -> None:
     paths = list(gen_paths(args))
 
     tabs = iterables.list_dict_filter_bool([consolidate_url(args, path) for path in get_new_paths(args, paths)])
-    for tab in tabs:
-        db_media.add(args, tab)
+    db_media.add_many(args, tabs)
     if not args.allow_immediate and args.frequency != "daily":
         # prevent immediately opening -- pick a random day within the week
         min_date = datetime.today() - timedelta(days=get_days(args.frequency) - 2)  # at least two days away
@@ -95,9 +90,9 @@ def tabs_add(args=None) -> None:
         min_time = int(min_date.replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
         max_time = int(max_date.replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
 
-        for d in tabs:
-            time_played = randint(min_time, max_time)
-            db_history.add(args, [d["path"]], time_played=time_played, mark_done=True)
+        db_history.add_many(
+            args, [{"path": d["path"], "time_played": randint(min_time, max_time), "done": True} for d in tabs]
+        )
 
 
 def tabs_shuffle() -> None:
@@ -145,6 +140,7 @@ def tabs_shuffle() -> None:
         )
     )
 
+    history = []
     for d in tabs:
         # pick a random day within the same week
         date_last_played = datetime.fromtimestamp(d["time_last_played"])
@@ -152,10 +148,11 @@ def tabs_shuffle() -> None:
 
         min_time = int(min_date.replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
         max_time = d["time_last_played"]
-        time_played = randint(min_time, max_time)
+        history.append({"media_id": d["id"], "time_played": randint(min_time, max_time), "done": True})
 
-        with args.db.conn:  # type: ignore
-            args.db.conn.execute(  # type: ignore
-                "DELETE from history WHERE media_id = ? and time_played = ?", [d["id"], d["time_last_played"]]
-            )
-        db_history.add(args, [d["path"]], time_played=time_played, mark_done=True)
+    with args.db.conn:  # type: ignore
+        args.db.conn.executemany(  # type: ignore
+            "DELETE from history WHERE media_id = ? and time_played = ?",
+            [[d["id"], d["time_last_played"]] for d in tabs],
+        )
+    db_history.add_many(args, history)
@@ -27,6 +27,7 @@ def parse_args() -> argparse.Namespace:
 def save_page(args, text):
     soup = BeautifulSoup(text, "lxml")
 
+    comments = []
     comment_elements = soup.find_all("article", class_="comment")
     for comment_element in comment_elements:
         edited_time_element = comment_element.find("time", class_="comment-edited-time")
@@ -46,8 +47,10 @@ def save_page(args, text):
             "score": int(score_element.text.split()[0]) if score_element else 0,
             "text": "".join(str(el) for el in comment_element.find("div", class_="comment-text").contents),
         }
-        db_media.add(args, comment)
+        comments.append(comment)
+    db_media.add_many(args, comments)
 
+    topics = []
     topic_elements = soup.find_all("article", class_="topic")
     for topic_element in topic_elements:
         topic_title_element = topic_element.find("h1", class_="topic-title")
@@ -109,7 +112,8 @@ def save_page(args, text):
             "title": topic_title_element.get_text("\n", strip=True),
             "text": "".join(str(el) for el in text_element.contents) if text_element else None,
         }
-        db_media.add(args, topic)
+        topics.append(topic)
+    db_media.add_many(args, topics)
 
     main_element = soup.find("main")
     if main_element:
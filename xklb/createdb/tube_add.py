@@ -1,9 +1,12 @@
-import argparse, sys
+import argparse, sys, threading, time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 
 from xklb import usage
 from xklb.createdb import tube_backend
+from xklb.data.http_errors import HTTPTooManyRequests
 from xklb.mediadb import db_media, db_playlists
+from xklb.mediadb.download import HostScheduler, hostname
 from xklb.utils import arg_utils, arggroups, argparse_utils, consts, db_utils
 from xklb.utils.consts import SC
 from xklb.utils.log_utils import log
@@ -18,6 +21,27 @@ def parse_args(action, usage) -> argparse.Namespace:
 
     arggroups.debug(parser)
 
+    if action == SC.tube_update:
+        parser.add_argument(
+            "--same-extractor-threads",
+            type=int,
+            default=2,
+            help="Update at most x playlists from the same extractor in parallel (see --threads for the global limit)",
+        )
+        parser.add_argument(
+            "--same-extractor-interval",
+            type=float,
+            default=1.0,
+            metavar="SECONDS",
+            help="Start at most one playlist update per x seconds for each extractor",
+        )
+        parser.add_argument(
+            "--rate-limit-retries",
+            type=int,
+            default=10,
+            help="Skip the remaining playlists of an extractor after x 429 Too Many Requests responses in a row",
+        )
+
     arggroups.database(parser)
     if action == SC.tube_add:
         arggroups.paths_or_stdin(parser)
@@ -84,26 +108,94 @@ def tube_add(args=None) -> None:
         db_utils.optimize(args)
 
 
+def update_playlist(args, d) -> None:
+    tube_backend.get_playlist_metadata(
+        args,
+        d["path"],
+        tube_backend.tube_opts(
+            args,
+            playlist_opts=d.get("extractor_config", "{}"),
+            func_opts={"ignoreerrors": "only_download"},
+        ),
+    )
+
+    if args.extra or args.subs or args.auto_subs:
+        log.warning("[%s]: Getting extra metadata", d["path"])
+        tube_backend.get_extra_metadata(args, d["path"], playlist_dl_opts=d.get("extractor_config", "{}"))
+
+
+def update_playlists_parallel(args, tube_playlists) -> None:
+    # workers only read from their own connection; writes are applied in order by a single writer thread
+    writer = db_utils.DBWriter(args)
+    scheduler = HostScheduler(
+        args,
+        tube_playlists,
+        key=lambda d: d.get("extractor_key") or hostname(d),
+        limit=max(1, args.same_extractor_threads),
+        interval=args.same_extractor_interval,
+        retries=args.rate_limit_retries,
+        backoff=args.same_extractor_interval or 1,
+    )
+    thread_state = threading.local()
+
+    def run(d) -> bool:
+        worker_args = getattr(thread_state, "args", None)
+        if worker_args is None:
+            worker_args = argparse.Namespace(**{k: v for k, v in args.__dict__.items() if k not in {"db"}})
+            worker_args.db = db_utils.connect(worker_args)
+            worker_args.db_writer = writer
+            worker_args.raise_rate_limited = True
+            thread_state.args = worker_args
+
+        try:
+            update_playlist(worker_args, d)
+        except HTTPTooManyRequests:
+            return False
+        return True
+
+    futures = {}
+    try:
+        with ThreadPoolExecutor(max_workers=args.threads, thread_name_prefix="tube_update") as executor:
+            while True:
+                while len(futures) < args.threads:
+                    item = scheduler.next()
+                    if item is None:
+                        break
+                    extractor_key, d = item
+                    futures[executor.submit(run, d)] = (extractor_key, d)
+
+                if not futures:
+                    wait_time = scheduler.wait_time()
+                    if wait_time is None:
+                        break
+                    time.sleep(wait_time)
+                    continue
+
+                done, _not_done = wait(futures, timeout=scheduler.wait_time(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    extractor_key, d = futures.pop(future)
+                    scheduler.done(extractor_key, d, rate_limited=not future.result())
+    finally:
+        writer.close()
+
+
 def tube_update(args=None) -> None:
     if args:
         sys.argv = ["tubeupdate", *args]
 
     args = parse_args(SC.tube_update, usage=usage.tube_update)
+
+    parallel = args.threads is not None and args.threads > 1
+    pl_columns = db_utils.columns(args, "playlists")
     tube_playlists = db_playlists.get_all(
         args,
+        cols="path, extractor_config, extractor_key",
         sql_filters=["AND extractor_key NOT IN ('Local', 'reddit_praw_redditor', 'reddit_praw_subreddit')"],
+        # most active playlists first
+        order_by="hours_update_delay, random()" if parallel and "hours_update_delay" in pl_columns else "random()",
     )
-    for d in tube_playlists:
-        tube_backend.get_playlist_metadata(
-            args,
-            d["path"],
-            tube_backend.tube_opts(
-                args,
-                playlist_opts=d.get("extractor_config", "{}"),
-                func_opts={"ignoreerrors": "only_download"},
-            ),
-        )
-
-        if args.extra or args.subs or args.auto_subs:
-            log.warning("[%s]: Getting extra metadata", d["path"])
-            tube_backend.get_extra_metadata(args, d["path"], playlist_dl_opts=d.get("extractor_config", "{}"))
+    if parallel:
+        update_playlists_parallel(args, tube_playlists)
+    else:
+        for d in tube_playlists:
+            update_playlist(args, d)
@@ -6,9 +6,11 @@ from subprocess import CalledProcessError
 from types import ModuleType
 
 from xklb.createdb import subtitle
+from xklb.data.http_errors import HTTPTooManyRequests
 from xklb.data.yt_dlp_errors import (
     environment_errors,
     yt_meaningless_errors,
+    yt_rate_limit_errors,
     yt_recoverable_errors,
     yt_unrecoverable_errors,
 )
@@ -94,9 +96,20 @@ playlists_of_playlists = set()
 added_media_count = 0
 
 
-def get_playlist_metadata(args, playlist_path, ydl_opts, playlist_root=True) -> None:
+def insert_captions(args, captions) -> None:
+    args.db["captions"].insert_all(captions, alter=True)
+
+
+def playlist_media_add(args, playlist_path, webpath, entry, info=None, extractor_key=None) -> None:
+    if info is not None:  # add sub-playlist
+        entry["playlists_id"] = db_playlists.add(args, playlist_path, info, extractor_key=extractor_key)
+    db_media.playlist_media_add(args, webpath, entry)
+
+
+def get_playlist_metadata(args, playlist_path, ydl_opts, playlist_root=True) -> int:
     yt_dlp = load_module_level_yt_dlp()
     t = Timer()
+    playlist_added_count = 0  # added_media_count is shared by all threads
 
     class ExistingPlaylistVideoReached(yt_dlp.DownloadCancelled):
         pass
@@ -104,6 +117,7 @@ def get_playlist_metadata(args, playlist_path, ydl_opts, playlist_root=True) ->
     class AddToArchivePP(yt_dlp.postprocessor.PostProcessor):
         def run(self, info) -> tuple[list, dict]:  # pylint: disable=arguments-renamed
             global added_media_count
+            nonlocal playlist_added_count
 
             if info:
                 webpath = iterables.safe_unpack(info.get("webpage_url"), info.get("url"), info.get("original_url"))
@@ -115,7 +129,9 @@ def get_playlist_metadata(args, playlist_path, ydl_opts, playlist_root=True) ->
                     if playlist_root:
                         if not info.get("playlist_id") or webpath == playlist_path:
                             log.warning("Importing playlist-less media %s", playlist_path)
-                        db_playlists.add(args, playlist_path, info, extractor_key=extractor_key)
+                        db_utils.write(
+                            args, db_playlists.add, playlist_path, objects.dumbcopy(info), extractor_key=extractor_key
+                        )
                         log.debug("playlists.add %s", t.elapsed())
 
                     if args.ignore_errors:
@@ -125,7 +141,7 @@ def get_playlist_metadata(args, playlist_path, ydl_opts, playlist_root=True) ->
                         if webpath in playlists_of_playlists:
                             raise ExistingPlaylistVideoReached  # prevent infinite bug
 
-                    get_playlist_metadata(args, webpath, ydl_opts, playlist_root=False)
+                    playlist_added_count += get_playlist_metadata(args, webpath, ydl_opts, playlist_root=False)
                     log.debug("get_playlist_metadata %s", t.elapsed())
                     playlists_of_playlists.add(webpath)
                     return [], info
@@ -137,15 +153,21 @@ def get_playlist_metadata(args, playlist_path, ydl_opts, playlist_root=True) ->
 
                     if not info.get("playlist_id") or webpath == playlist_path:
                         log.warning("Importing playlist-less media %s", playlist_path)
+                        db_utils.write(args, playlist_media_add, playlist_path, webpath, entry)
                     else:
-                        # add sub-playlist
-                        entry["playlists_id"] = db_playlists.add(args, playlist_path, info, extractor_key=extractor_key)
-                        log.debug("playlists.add2 %s", t.elapsed())
-
-                    db_media.playlist_media_add(args, webpath, entry)  # type: ignore
+                        db_utils.write(
+                            args,
+                            playlist_media_add,
+                            playlist_path,
+                            webpath,
+                            entry,
+                            info=objects.dumbcopy(info),
+                            extractor_key=extractor_key,
+                        )
                     log.debug("media.playlist_media_add %s", t.elapsed())
 
                     added_media_count += 1
+                    playlist_added_count += 1
                     if added_media_count > 1:
                         printing.print_overwrite(f"[{playlist_path}] Added {added_media_count} media")
 
@@ -155,28 +177,31 @@ def get_playlist_metadata(args, playlist_path, ydl_opts, playlist_root=True) ->
         ydl.add_post_processor(AddToArchivePP(), when="pre_process")
 
         log.debug("yt-dlp initialized %s", t.elapsed())
-        count_before_extract = added_media_count
         try:
             pl = ydl.extract_info(playlist_path, download=False, process=True)
             log.debug("ydl.extract_info done %s", t.elapsed())
-        except yt_dlp.DownloadError:
+        except yt_dlp.DownloadError as e:
+            if getattr(args, "raise_rate_limited", False) and yt_rate_limit_errors.search(str(e)):
+                raise HTTPTooManyRequests(str(e)) from e  # the caller backs off and retries the playlist
             log.error("[%s] DownloadError skipping", playlist_path)
-            return
+            return playlist_added_count
         except ExistingPlaylistVideoReached:
-            db_playlists.log_problem(args, playlist_path)
+            db_utils.write(args, db_playlists.log_problem, playlist_path)
         else:
             if not pl and not args.safe:
                 log.warning("Logging undownloadable media")
-                db_playlists.save_undownloadable(args, playlist_path)
+                db_utils.write(args, db_playlists.save_undownloadable, playlist_path)
 
-        if added_media_count > count_before_extract:
+        if playlist_added_count > 0:
             sys.stdout.write("\n")
 
         if args.action == consts.SC.tube_update:
-            if added_media_count > count_before_extract:
-                db_playlists.decrease_update_delay(args, playlist_path)
+            if playlist_added_count > 0:
+                db_utils.write(args, db_playlists.decrease_update_delay, playlist_path)
             else:
-                db_playlists.increase_update_delay(args, playlist_path)
+                db_utils.write(args, db_playlists.increase_update_delay, playlist_path)
+
+    return playlist_added_count
 
 
 def yt_subs_config(args):
@@ -190,6 +215,7 @@ def yt_subs_config(args):
 def get_extra_metadata(args, playlist_path, playlist_dl_opts=None) -> list[dict] | None:
     yt_dlp = load_module_level_yt_dlp()
 
+    db_utils.flush_writes(args)  # read the media which was just added
     tables = args.db.table_names()
     m_columns = db_utils.columns(args, "media")
 
@@ -260,7 +286,7 @@ def get_extra_metadata(args, playlist_path, playlist_dl_opts=None) -> list[dict]
                     if d.get("title") and not strings.is_generic_title(d)
                 ]
                 if len(chapters) > 0:
-                    args.db["captions"].insert_all(chapters, alter=True)
+                    db_utils.write(args, insert_captions, chapters)
 
             if entry["requested_subtitles"]:
                 downloaded_subtitles = [d["filepath"] for d in entry["requested_subtitles"].values()]
@@ -274,13 +300,13 @@ def get_extra_metadata(args, playlist_path, playlist_dl_opts=None) -> list[dict]
                     else:
                         captions.extend([{"media_id": id, **d} for d in file_captions])
                 if len(captions) > 0:
-                    args.db["captions"].insert_all(captions, alter=True)
+                    db_utils.write(args, insert_captions, captions)
 
             entry["id"] = id
             entry["playlists_id"] = playlists_id
             entry["chapter_count"] = chapter_count
 
-            db_media.playlist_media_add(args, path, entry)
+            db_utils.write(args, db_media.playlist_media_add, path, entry)
 
             current_video_count += 1
             printing.print_overwrite(f"[{playlist_path}] {current_video_count} of {len(videos)} extra metadata fetched")
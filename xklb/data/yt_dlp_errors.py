@@ -255,3 +255,11 @@ environment_errors = re.compile(
 .*Permission denied""".splitlines(),
     ),
 )
+
+
+yt_rate_limit_errors = re.compile(
+    "|".join(
+        r""".*HTTP Error 429
+.*Too Many Requests""".splitlines(),
+    ),
+)
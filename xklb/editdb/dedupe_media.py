@@ -1,7 +1,8 @@
-import argparse, difflib, os, re, shlex, tempfile
+import argparse, difflib, mimetypes, os, re, shlex, tempfile
 from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
+from functools import partial
 from pathlib import Path
 
 from xklb import usage
@@ -15,6 +16,8 @@ from xklb.utils import (
     db_utils,
     devices,
     file_utils,
+    image_utils,
+    iterables,
     path_utils,
     processes,
     sql_utils,
@@ -80,8 +83,7 @@ def parse_args() -> argparse.Namespace:
         action="store_const",
         dest="profile",
         const=DBType.image,
-        help=argparse.SUPPRESS,
-        # "Dedupe image database",
+        help="Dedupe image database by perceptual hash",
     )
 
     parser.set_defaults(limit="100")
@@ -89,6 +91,20 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--dedupe-cmd", help=argparse.SUPPRESS)
     parser.add_argument("--force", "-f", action="store_true")
 
+    parser.add_argument(
+        "--hash-algorithm",
+        default="sha256",
+        choices=["sha256", "blake2b", "fast"],
+        help="Full-file hash algorithm for --fs. fast uses xxhash or blake3 when installed, otherwise blake2b",
+    )
+
+    parser.add_argument(
+        "--hamming-distance",
+        type=int,
+        default=4,
+        help="For --image, treat images whose perceptual hashes differ by at most x bits (of 64) as duplicates",
+    )
+
     parser.add_argument("--compare-dirs", action="store_true")
     parser.add_argument("--basename", action="store_true")
     parser.add_argument("--dirname", action="store_true")
@@ -300,6 +316,21 @@ def get_duration_duplicates(args) -> list[dict]:
     return media
 
 
+def get_media_hashes(args, paths) -> dict[str, dict]:
+    if "media_hashes" not in args.db.table_names():
+        return {}
+
+    media_hashes = {}
+    for chunk_paths in iterables.chunks(list(paths), consts.SQLITE_PARAM_LIMIT):
+        media_hashes.update(
+            (d["path"], d)
+            for d in args.db.query(
+                "SELECT * FROM media_hashes WHERE path IN (" + ",".join(["?"] * len(chunk_paths)) + ")", chunk_paths
+            )
+        )
+    return media_hashes
+
+
 def get_fs_duplicates(args) -> list[dict]:
     m_columns = db_utils.columns(args, "media")
 
@@ -307,6 +338,7 @@ def get_fs_duplicates(args) -> list[dict]:
     SELECT
         path
         , size
+        {', time_modified' if 'time_modified' in m_columns else ''}
         {', hash' if 'hash' in m_columns else ''}
     FROM
         {args.table} m1
@@ -339,9 +371,29 @@ def get_fs_duplicates(args) -> list[dict]:
         len(size_groups),
     )
 
-    path_media_map = {d["path"]: d for d in media}
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        path_stats = {path: stat for path, stat in zip(size_paths, pool.map(file_utils.safe_stat, size_paths))}
+
+    # reuse hashes of files which have not changed size or mtime since they were hashed
+    media_hashes = {}
+    for path, d in get_media_hashes(args, size_paths).items():
+        stat = path_stats[path]
+        if stat and (d["size"], d["mtime"]) == (stat.st_size, stat.st_mtime_ns):
+            media_hashes[path] = d
+
+    path_media_map = {}
+    for d in media:
+        stat = path_stats[d["path"]]
+        if stat is None:  # file no longer exists
+            continue
+
+        if d["path"] in media_hashes and media_hashes[d["path"]]["sample_hash"]:
+            d["hash"] = media_hashes[d["path"]]["sample_hash"]
+        elif d.get("time_modified") and (d["size"], d["time_modified"]) != (stat.st_size, int(stat.st_mtime)):
+            d["hash"] = None  # the sample-hash saved by fs_add --hash might be stale
+        path_media_map[d["path"]] = d
 
-    need_sample_hash_paths = [d["path"] for d in media if not d.get("hash") and d["path"] is not None]
+    need_sample_hash_paths = [path for path, d in path_media_map.items() if not d.get("hash")]
     if need_sample_hash_paths:
         with ThreadPoolExecutor(max_workers=20) as pool:
             hash_results = list(pool.map(sample_hash.sample_hash_file, need_sample_hash_paths))
@@ -351,10 +403,12 @@ def get_fs_duplicates(args) -> list[dict]:
                 del path_media_map[path]
             else:
                 path_media_map[path]["hash"] = hash
-                args.db["media"].upsert(path_media_map[path], pk=["path"], alter=True)  # save sample-hash back to db
-        media = [
-            path_media_map[d["path"]] for d in media if d["path"] in path_media_map
-        ]  # replace media with path_media_map in original order (args.sort)
+                args.db["media"].upsert(
+                    {k: path_media_map[path][k] for k in ["path", "size", "hash"]}, pk=["path"], alter=True
+                )  # save sample-hash back to db
+    media = [
+        path_media_map[d["path"]] for d in media if d["path"] in path_media_map
+    ]  # replace media with path_media_map in original order (args.sort)
 
     sample_hash_groups = defaultdict(set)
     for m in media:
@@ -368,11 +422,42 @@ def get_fs_duplicates(args) -> list[dict]:
         len(sample_hash_groups),
     )
 
+    algorithm = sample_compare.get_hash_algorithm(args.hash_algorithm)
+    path_hash_map = {}
+    need_full_hash_paths = []
+    for path in sample_hash_paths:
+        d = media_hashes.get(path)
+        if d and d["full_hash"] and d["algorithm"] == algorithm and d["sample_hash"] == path_media_map[path]["hash"]:
+            path_hash_map[path] = d["full_hash"]
+        else:
+            need_full_hash_paths.append(path)
+    log.info("Reusing %s full hashes. Hashing %s files...", len(path_hash_map), len(need_full_hash_paths))
+
     with ThreadPoolExecutor(max_workers=20) as pool:
-        path_hash_map = {
-            k: v for k, v in zip(sample_hash_paths, pool.map(sample_compare.full_hash_file, sample_hash_paths))
+        path_hash_map |= {
+            k: v
+            for k, v in zip(
+                need_full_hash_paths,
+                pool.map(partial(sample_compare.full_hash_file, algorithm=algorithm), need_full_hash_paths),
+            )
         }
 
+    args.db["media_hashes"].upsert_all(
+        [
+            {
+                "path": path,
+                "size": path_stats[path].st_size,
+                "mtime": path_stats[path].st_mtime_ns,
+                "sample_hash": d["hash"],
+                "full_hash": path_hash_map.get(path) or (media_hashes.get(path) or {}).get("full_hash"),
+                "algorithm": algorithm if path in path_hash_map else (media_hashes.get(path) or {}).get("algorithm"),
+            }
+            for path, d in path_media_map.items()
+        ],
+        pk="path",
+        alter=True,
+    )
+
     full_hash_groups = defaultdict(list)
     for path, hash in path_hash_map.items():
         if hash is not None:
@@ -393,6 +478,61 @@ def get_fs_duplicates(args) -> list[dict]:
     return dup_media
 
 
+def get_image_duplicates(args) -> list[dict]:
+    m_columns = db_utils.columns(args, "media")
+
+    query = f"""
+    SELECT
+        path
+        , size
+        {', type' if 'type' in m_columns else ''}
+    FROM
+        {args.table} m1
+    WHERE 1=1
+        and coalesce(m1.time_deleted,0) = 0
+        and m1.size > 0
+        {"and (type LIKE 'image/%' OR type IS NULL)" if 'type' in m_columns else ''}
+        {" ".join(args.filter_sql)}
+    ORDER BY 1=1
+        {', m1.width * m1.height DESC' if 'width' in m_columns and 'height' in m_columns else ''}
+        , m1.size DESC
+        , length(m1.path)
+        , m1.path DESC
+    """
+    media = list(args.db.query(query, args.filter_bindings))
+    # only decode images; rows without a type are guessed from the file extension
+    media = [
+        d
+        for d in media
+        if (d.get("type") or mimetypes.guess_type(d["path"], strict=False)[0] or "").startswith("image/")
+    ]
+
+    fingerprints = image_utils.image_hashes(args, [d["path"] for d in media], threads=args.threads)
+    media = [d for d in media if (fingerprints.get(d["path"]) or {}).get("phash") is not None]
+    log.info("Got %s image fingerprints. Doing perceptual hash comparison...", len(media))
+
+    tree = image_utils.BKTree()
+    for d in media:
+        tree.add(fingerprints[d["path"]]["phash"], d["path"])
+
+    path_media_map = {d["path"]: d for d in media}
+    seen = set()
+    dup_media = []
+    for d in media:  # earlier (larger) images are kept
+        if d["path"] in seen:
+            continue
+        seen.add(d["path"])
+
+        for _distance, path in sorted(tree.search(fingerprints[d["path"]]["phash"], args.hamming_distance)):
+            if path not in seen:
+                seen.add(path)
+                dup_media.append(
+                    {"keep_path": d["path"], "duplicate_path": path, "duplicate_size": path_media_map[path]["size"]}
+                )
+
+    return dup_media
+
+
 def filter_split_files(paths):
     pattern = r"\.\d{3,5}\."
     return filter(lambda x: not re.search(pattern, x), paths)
@@ -412,22 +552,11 @@ def dedupe_media() -> None:
     elif args.profile == DBType.filesystem:
         duplicates = get_fs_duplicates(args)
     elif args.profile == DBType.image:
-        print(
-            """
-        You should use `czkawka` or `cbird` instead:
-
-            $ czkawka image -d (pwd) > dupes.txt
-            $ wget https://raw.githubusercontent.com/chapmanjacobd/computer/main/bin/czkawka_output_dupdelete.py
-            $ python czkawka_output_dupdelete.py dupes.txt
-
-            $ cbird -i.algos 1 -update
-            $ cbird -dups -select-result -sort-rev resolution -chop -nuke  # exact duplicates
-            $ cbird -p.dht 1 -similar -select-result -sort-rev resolution -chop -nuke  # similar photos
-        """,
-        )
-        return
+        duplicates = get_image_duplicates(args)
     else:
-        raise argparse.ArgumentError(args.profile, "Profile not set. Use --audio OR --id OR --title OR --filesystem")
+        raise argparse.ArgumentError(
+            args.profile, "Profile not set. Use --audio OR --id OR --title OR --filesystem OR --image"
+        )
 
     deletion_candidates = []
     deletion_paths = []
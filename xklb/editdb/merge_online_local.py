@@ -83,6 +83,7 @@ def merge_online_local() -> None:
         log.info("Merging...")
 
         merged = []
+        entries = []
         for d in duplicates:
             fspath = d["keep_path"]
             webpath = d["duplicate_path"]
@@ -100,12 +101,13 @@ def merge_online_local() -> None:
             if fs_tags["time_downloaded"] is None or fs_tags["time_downloaded"] == 0:
                 fs_tags["time_downloaded"] = consts.APPLICATION_START
 
-            entry = {**tube_entry, **fs_tags, "webpath": webpath}
-            db_media.add(args, objects.dict_filter_bool(entry))  # type: ignore
-            with args.db.conn:
-                args.db.conn.execute("DELETE from media WHERE path = ?", [webpath])
+            entries.append(objects.dict_filter_bool({**tube_entry, **fs_tags, "webpath": webpath}))
             merged.append(webpath)
 
+        db_media.add_many(args, entries)
+        with args.db.conn:
+            args.db.conn.executemany("DELETE from media WHERE path = ?", [[webpath] for webpath in merged])
+
         print(len(merged), "merged")
 
 
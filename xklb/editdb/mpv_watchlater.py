@@ -34,10 +34,12 @@ def scan_and_import(args, media) -> None:
     ]
 
     # create two records if first played and last played time are different
+    history = []
     for m in previously_watched:
-        db_history.add(args, media_ids=[m["id"]], time_played=m["time_first_played"], playhead=m["playhead"])
+        history.append({"media_id": m["id"], "time_played": m["time_first_played"], "playhead": m["playhead"]})
         if m["time_first_played"] != m["time_last_played"]:
-            db_history.add(args, media_ids=[m["id"]], time_played=m["time_last_played"], playhead=m["playhead"])
+            history.append({"media_id": m["id"], "time_played": m["time_last_played"], "playhead": m["playhead"]})
+    db_history.add_many(args, history)
 
 
 def mpv_watchlater():
@@ -56,6 +56,7 @@ def reddit_selftext() -> None:
         ),
     )
 
+    media = []
     for d in reddit_posts:
         html_data = markdown(d["selftext"])
         internal_links, external_links = get_page_links(d["path"], html_data)
@@ -63,8 +64,8 @@ def reddit_selftext() -> None:
             for i_link in internal_links:
                 log.info(i_link)
 
-        for e_link in external_links:
-            db_media.add(args, {**d, "path": e_link, "webpage": d["path"]})
+        media.extend({**d, "path": e_link, "webpage": d["path"]} for e_link in external_links)
+    db_media.add_many(args, media)
 
 
 if __name__ == "__main__":
@@ -25,17 +25,42 @@ def parse_args():
     return args
 
 
-def full_hash_file(path):
-    sha256_hash = hashlib.sha256()
+def get_hash_algorithm(name="sha256") -> str:
+    if name != "fast":
+        return name
+
+    for module_name, algorithm in [("xxhash", "xxh3_128"), ("blake3", "blake3")]:
+        try:
+            __import__(module_name)
+            return algorithm
+        except ModuleNotFoundError:
+            pass
+    return "blake2b"
+
+
+def new_hasher(algorithm):
+    if algorithm == "xxh3_128":
+        import xxhash
+
+        return xxhash.xxh3_128()
+    elif algorithm == "blake3":
+        from blake3 import blake3
+
+        return blake3()
+    return hashlib.new(algorithm)
+
+
+def full_hash_file(path, algorithm="sha256"):
+    file_hash = new_hasher(algorithm)
 
     try:
         with open(path, "rb") as file:
             for byte_block in iter(lambda: file.read(1048576), b""):
-                sha256_hash.update(byte_block)
+                file_hash.update(byte_block)
     except FileNotFoundError:
         return None
 
-    return sha256_hash.hexdigest()
+    return file_hash.hexdigest()
 
 
 def full_hash_compare(paths):
@@ -1,5 +1,5 @@
 from xklb import usage
-from xklb.folders.similar_folders import cluster_folders, map_and_name
+from xklb.folders.similar_folders import cluster_by_percentage, cluster_folders, map_and_name
 from xklb.utils import arg_utils, arggroups, argparse_utils, file_utils, nums, printing, strings
 from xklb.utils.log_utils import log
 
@@ -50,26 +50,18 @@ def is_same_size_group(args, m0, m):
 
 
 def cluster_by_size(args, media):
-    group_id = 0
-    temp_groups = []
-    media_groups = []
-    for m in media:
-        grouped = False
-        for i, group in enumerate(temp_groups):
-            m0 = group[0]
-            if is_same_size_group(args, m0, m):
-                group.append(m)
-                media_groups.append(i)
-                grouped = True
-                break
-
-        if not grouped:
-            temp_groups.append([m])
-            media_groups.append(group_id)
-            group_id += 1
-
-    assert len(media_groups) == len(media)
-    return media_groups
+    if args.filter_sizes:
+        return cluster_by_percentage(
+            media, lambda m0, m: is_same_size_group(args, m0, m), key=lambda m: m["size"], delta=args.sizes_delta
+        )
+    else:
+        return cluster_by_percentage(
+            media,
+            lambda m0, m: is_same_size_group(args, m0, m),
+            key=lambda m: m.get("duration"),
+            delta=args.durations_delta,
+            constrains=lambda m: m.get("duration"),
+        )
 
 
 def filter_group_by_size(args, group):
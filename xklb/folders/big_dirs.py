@@ -3,9 +3,10 @@ from collections import Counter, defaultdict
 from pathlib import Path
 
 from xklb import usage
+from xklb.mediadb import db_folder_stats
 from xklb.playback import media_printer
 from xklb.tablefiles import mcda
-from xklb.utils import arg_utils, arggroups, argparse_utils, file_utils, iterables, nums
+from xklb.utils import arg_utils, arggroups, argparse_utils, db_utils, file_utils, iterables, nums, processes
 
 
 def parse_args() -> argparse.Namespace:
@@ -29,6 +30,38 @@ def parse_args() -> argparse.Namespace:
     return args
 
 
+def aggregate_media(media) -> dict:
+    size, duration, exists, deleted, deleted_size, deleted_duration, played = 0, 0, 0, 0, 0, 0, 0
+    sizes, durations = [], []
+    for m in media:
+        if m.get("time_last_played"):
+            played += 1
+
+        if m.get("time_deleted"):
+            deleted += 1
+            deleted_size += m.get("size") or 0
+            deleted_duration += m.get("duration") or 0
+        else:
+            exists += 1
+            size += m.get("size") or 0
+            duration += m.get("duration") or 0
+            sizes.append(m.get("size"))
+            durations.append(m.get("duration"))
+
+    return {
+        "total": len(media),
+        "duration": duration,
+        "median_duration": nums.safe_median(durations),
+        "size": size,
+        "median_size": nums.safe_median(sizes),
+        "played": played,
+        "exists": exists,
+        "deleted": deleted,
+        "deleted_size": deleted_size,
+        "deleted_duration": deleted_duration,
+    }
+
+
 def group_files_by_parents(args, media) -> list[dict]:
     p_media = {}
     min_parts = 10
@@ -46,23 +79,26 @@ def group_files_by_parents(args, media) -> list[dict]:
 
     d = {}
     for parent, media in list(p_media.items()):
+        if len(parent.split(os.sep)) < min_parts:
+            continue
+
+        stats = aggregate_media(media)
         d[parent] = {
-            "size": sum(m.get("size") or 0 for m in media if not bool(m.get("time_deleted"))),
-            "median_size": nums.safe_median(m.get("size") for m in media if not bool(m.get("time_deleted"))),
-            "duration": sum(m.get("duration") or 0 for m in media if not bool(m.get("time_deleted"))),
-            "median_duration": nums.safe_median(m.get("duration") for m in media if not bool(m.get("time_deleted"))),
-            "total": len(media),
-            "exists": sum(not bool(m.get("time_deleted")) for m in media),
-            "deleted": sum(bool(m.get("time_deleted")) for m in media),
-            "deleted_size": sum(m.get("size") or 0 for m in media if bool(m.get("time_deleted"))),
-            "deleted_duration": sum(m.get("duration") or 0 for m in media if bool(m.get("time_deleted"))),
-            "played": sum(bool(m.get("time_last_played")) for m in media),
+            k: stats[k]
+            for k in (
+                "size",
+                "median_size",
+                "duration",
+                "median_duration",
+                "total",
+                "exists",
+                "deleted",
+                "deleted_size",
+                "deleted_duration",
+                "played",
+            )
         }
 
-    for parent, _ in list(d.items()):
-        if len(parent.split(os.sep)) < min_parts:
-            d.pop(parent)
-
     parent_counts = Counter(str(Path(p).parent) for p in d.keys())
     for parent, data in d.items():
         data["folders"] = parent_counts[parent]
@@ -75,20 +111,7 @@ def group_files_by_parent(args, media) -> list[dict]:
     for m in media:
         p_media[str(Path(m["path"]).parent)].append(m)
 
-    d = {}
-    for parent, media in list(p_media.items()):
-        d[parent] = {
-            "total": len(media),
-            "duration": sum(m.get("duration") or 0 for m in media if not bool(m.get("time_deleted"))),
-            "median_duration": nums.safe_median(m.get("duration") for m in media if not bool(m.get("time_deleted"))),
-            "size": sum(m.get("size") or 0 for m in media if not bool(m.get("time_deleted"))),
-            "median_size": nums.safe_median(m.get("size") for m in media if not bool(m.get("time_deleted"))),
-            "played": sum(bool(m.get("time_last_played")) for m in media),
-            "exists": sum(not bool(m.get("time_deleted")) for m in media),
-            "deleted": sum(bool(m.get("time_deleted")) for m in media),
-            "deleted_size": sum(m.get("size") or 0 for m in media if bool(m.get("time_deleted"))),
-            "deleted_duration": sum(m.get("duration") or 0 for m in media if bool(m.get("time_deleted"))),
-        }
+    d = {parent: aggregate_media(media) for parent, media in p_media.items()}
 
     parent_counts = Counter(str(Path(p).parent) for p in d.keys())
     for parent, data in d.items():
@@ -97,6 +120,13 @@ def group_files_by_parent(args, media) -> list[dict]:
     return [{"path": k, **v} for k, v in d.items()]
 
 
+def media_by_parent(media) -> dict[str, list[dict]]:
+    p_media = defaultdict(list)
+    for m in media:
+        p_media[os.path.dirname(m["path"]) + os.sep].append(m)
+    return p_media
+
+
 def reaggregate_at_depth(args, folders) -> list[dict]:
     d = {}
     for f in folders:
@@ -138,57 +168,80 @@ def process_big_dirs(args, folders) -> list[dict]:
     return folders
 
 
+def group_folder_stats(args) -> list[dict]:
+    if not db_folder_stats.ensure(args):
+        processes.no_media_found()
+
+    folders = db_folder_stats.get_folders(args)
+    played = db_folder_stats.get_played_counts(args)
+    if args.parents:
+        min_depth = min((f["depth"] for f in folders), default=0)
+        folders = [{"path": k, **v} for k, v in db_folder_stats.rollup(folders).items() if k.count(os.sep) >= min_depth]
+        played = db_folder_stats.rollup([{"path": k, "count": v} for k, v in played.items()], columns=["count"])
+        played = {k: v["count"] for k, v in played.items()}
+
+    child_counts = db_folder_stats.child_folder_counts(f["path"] for f in folders)
+    return [
+        {
+            "path": f["path"] if args.parents else f["path"].rstrip(os.sep),
+            "size": f["size"],
+            "duration": f["duration"],
+            "total": f["count"] + f["deleted"],
+            "exists": f["count"],
+            "deleted": f["deleted"],
+            "deleted_size": f["deleted_size"],
+            "deleted_duration": f["deleted_duration"],
+            "played": played.get(f["path"], 0),
+            "folders": child_counts[f["path"]],
+        }
+        for f in folders
+    ]
+
+
+def uses_medians(args) -> bool:
+    return any("median" in s for s in [args.sort_groups_by or "", *(getattr(args, "cols", None) or [])])
+
+
+def get_db_media(args) -> list[dict]:
+    m_columns = db_utils.columns(args, "media")
+    if not m_columns:
+        processes.no_media_found()
+
+    select = ["m.path", *(f"m.{k}" for k in ("size", "duration", "time_deleted") if k in m_columns)]
+    if "history" in args.db.table_names():
+        select.append("(SELECT MAX(h.time_played) FROM history h WHERE h.media_id = m.id) AS time_last_played")
+    return list(args.db.query(f"SELECT {', '.join(select)} FROM media m"))
+
+
 def big_dirs() -> None:
     args = parse_args()
 
-    media: list[dict] = list(arg_utils.gen_d(args))
-    media = [d if "size" in d else file_utils.get_filesize(d) for d in media]
-    if args.cluster_sort and len(media) > 2:
-        from xklb.text.cluster_sort import cluster_paths
-
-        groups = cluster_paths([d["path"] for d in media], n_clusters=getattr(args, "clusters", None))
-        groups = sorted(groups, key=lambda d: (-len(d["grouped_paths"]), -len(d["common_path"])))
-
-        media_keyed = {d["path"]: d for d in media}
-        folders = [
-            {
-                "path": group["common_path"],
-                "total": len(group["grouped_paths"]),
-                "played": sum(bool(media_keyed[s].get("time_played")) for s in group["grouped_paths"]),
-                "exists": sum(not bool(media_keyed[s].get("time_deleted")) for s in group["grouped_paths"]),
-                "deleted": sum(bool(media_keyed[s].get("time_deleted")) for s in group["grouped_paths"]),
-                "deleted_size": sum(
-                    media_keyed[s].get("size") or 0
-                    for s in group["grouped_paths"]
-                    if bool(media_keyed[s].get("time_deleted"))
-                ),
-                "size": sum(
-                    media_keyed[s].get("size") or 0
-                    for s in group["grouped_paths"]
-                    if not bool(media_keyed[s].get("time_deleted"))
-                ),
-                "median_size": nums.safe_median(
-                    media_keyed[s].get("size")
-                    for s in group["grouped_paths"]
-                    if not bool(media_keyed[s].get("time_deleted"))
-                ),
-                "duration": sum(
-                    media_keyed[s].get("duration") or 0
-                    for s in group["grouped_paths"]
-                    if not bool(media_keyed[s].get("time_deleted"))
-                ),
-                "median_duration": nums.safe_median(
-                    media_keyed[s].get("duration")
-                    for s in group["grouped_paths"]
-                    if not bool(media_keyed[s].get("time_deleted"))
-                ),
-            }
-            for group in groups
-        ]
-    elif args.parents:
-        folders = group_files_by_parents(args, media)
+    if args.paths and len(args.paths) == 1 and file_utils.is_sqlite(args.paths[0]) and not args.cluster_sort:
+        args.database = args.paths[0]
+        args.db = db_utils.connect(args)
+        if uses_medians(args):  # folder_stats only stores totals; medians need every media row
+            media = get_db_media(args)
+            folders = group_files_by_parents(args, media) if args.parents else group_files_by_parent(args, media)
+        else:  # read precomputed folder aggregates instead of every media row
+            folders = group_folder_stats(args)
     else:
-        folders = group_files_by_parent(args, media)
+        media: list[dict] = list(arg_utils.gen_d(args))
+        media = [d if "size" in d else file_utils.get_filesize(d) for d in media]
+        if args.cluster_sort and len(media) > 2:
+            from xklb.text.cluster_sort import cluster_paths
+
+            groups = cluster_paths([d["path"] for d in media], n_clusters=getattr(args, "clusters", None))
+            groups = sorted(groups, key=lambda d: (-len(d["grouped_paths"]), -len(d["common_path"])))
+
+            media_keyed = {d["path"]: d for d in media}
+            folders = [
+                {"path": group["common_path"], **aggregate_media([media_keyed[s] for s in group["grouped_paths"]])}
+                for group in groups
+            ]
+        elif args.parents:
+            folders = group_files_by_parents(args, media)
+        else:
+            folders = group_files_by_parent(args, media)
 
     folders = mcda.group_sort_by(args, folders)
     media = process_big_dirs(args, folders)
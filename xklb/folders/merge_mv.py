@@ -1,12 +1,13 @@
-import concurrent.futures, os, shutil, sys
+import os, sys
 
 from xklb import usage
-from xklb.utils import arggroups, argparse_utils, devices, file_utils, path_utils
+from xklb.utils import arggroups, argparse_utils, copy_utils, devices, file_utils, path_utils
 
 
 def parse_args():
     parser = argparse_utils.ArgumentParser(usage=usage.merge_mv)
     parser.add_argument("--copy", "--cp", "-c", action="store_true", help="Copy instead of move")
+    arggroups.same_device_threads(parser)
     arggroups.clobber(parser)
     arggroups.debug(parser)
 
@@ -30,10 +31,11 @@ def mcp_file(args, source, destination):
         print(source)
         print("==>", destination)
     else:
-        shutil.copy2(source, destination)
+        copy_utils.copy_file(source, destination)
 
 
 def gen_src_dest(args, sources, destination):
+    # destinations before clobber handling
     for source in sources:
         if os.path.isdir(source):
             for p in file_utils.rglob_gen(source, args.ext or None):
@@ -41,10 +43,7 @@ def gen_src_dest(args, sources, destination):
                 if args.parent or (args.bsd and not source.endswith(os.sep)):  # use BSD behavior
                     file_dest = os.path.join(file_dest, os.path.basename(source))
                 file_dest = os.path.join(file_dest, os.path.relpath(p, source))
-
-                src, dest = devices.clobber(args, p, file_dest)
-                if src:
-                    yield src, dest
+                yield p, file_dest
 
         else:
             file_dest = destination
@@ -52,10 +51,7 @@ def gen_src_dest(args, sources, destination):
                 file_dest = os.path.join(file_dest, path_utils.parent(source))
             if path_utils.is_folder_dest(source, file_dest):
                 file_dest = os.path.join(file_dest, os.path.basename(source))
-
-            src, dest = devices.clobber(args, source, file_dest)
-            if src:
-                yield src, dest
+            yield source, file_dest
 
 
 def mmv_folders(args, mv_fn, sources, destination):
@@ -67,9 +63,13 @@ def mmv_folders(args, mv_fn, sources, destination):
     else:
         sources = (os.path.realpath(s) for s in sources)
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=args.threads) as ex:
-        for f in (ex.submit(mv_fn, args, src, dest) for src, dest in gen_src_dest(args, sources, destination)):
-            f.result()
+    copy_utils.transfer(
+        lambda src, dest: mv_fn(args, src, dest),
+        gen_src_dest(args, sources, destination),
+        prepare=lambda src, dest: devices.clobber(args, src, dest),
+        threads=1 if args.simulate else args.threads,
+        device_threads=getattr(args, "same_device_threads", None),
+    )
 
 
 def merge_mv():
@@ -19,13 +19,15 @@ import os
 
 from xklb import usage
 from xklb.folders import merge_mv
-from xklb.utils import arggroups, argparse_utils, consts, processes
+from xklb.utils import arggroups, argparse_utils, consts, copy_utils, processes
+from xklb.utils.log_utils import log
 
 
 def parse_args():
     parser = argparse_utils.ArgumentParser(usage=usage.mergerfs_cp)
     arggroups.clobber(parser)
     parser.set_defaults(file_over_file="delete-dest-hash rename-dest")
+    arggroups.same_device_threads(parser)
     arggroups.debug(parser)
 
     arggroups.paths_or_stdin(parser, destination=True)
@@ -73,26 +75,30 @@ def mergerfs_cp_file(args, merger_fs_src, destination):
         source = os.path.join(srcmount, relative_to_mount)
         if os.path.exists(source):
             found_file = True
-            destination = os.path.join(srcmount, os.path.relpath(destination, args.mergerfs_mount))
-            processes.cmd(*args.cp_args, source, destination, strict=False, quiet=False, error_verbosity=2)
+            srcmount_destination = os.path.join(srcmount, os.path.relpath(destination, args.mergerfs_mount))
+            if args.simulate:
+                print(source)
+                print("==>", srcmount_destination)
+                continue
+
+            # create the folder on the same srcmount so that the copy can be a reflink
+            os.makedirs(os.path.dirname(srcmount_destination), exist_ok=True)
+            try:
+                copy_utils.copy_file(source, srcmount_destination, overwrite=False, methods=args.copy_methods)
+            except FileExistsError:
+                log.info("Destination already exists %s", srcmount_destination)
+            except OSError as e:
+                log.error("Could not copy %s to %s: %s", source, srcmount_destination, e)
 
     if not found_file:
         print(f"Could not find srcmount of {merger_fs_src}")
 
 
-def cp_args(args):
-    cmd_args = ["cp"]
-    cmd_args.append("--no-clobber")
-
-    if not consts.PYTEST_RUNNING:
-        cmd_args.append("--reflink=always")
-    return cmd_args
-
-
 def mergerfs_cp():
     args = parse_args()
 
-    args.cp_args = cp_args(args)
+    # like cp --reflink=always: a full copy would use twice the space on the srcmount
+    args.copy_methods = None if consts.PYTEST_RUNNING else ["reflink"]
     args.mergerfs_mount = get_destination_mount(args.destination)
     if args.mergerfs_mount == "":
         processes.exit_error("Could not detect any mergerfs mounts")
@@ -3,7 +3,8 @@ from copy import deepcopy
 from pathlib import Path
 
 from xklb import usage
-from xklb.utils import arggroups, argparse_utils, consts, devices, iterables, printing, sqlgroups, strings
+from xklb.mediadb import db_folder_stats
+from xklb.utils import arggroups, argparse_utils, consts, devices, iterables, printing, sql_utils, sqlgroups, strings
 
 
 def parse_args() -> argparse.Namespace:
@@ -53,10 +54,32 @@ def group_by_folder(args, media) -> list[dict]:
     return [{**v, "path": k} for k, v in d.items()]
 
 
+def group_folder_stats(args) -> list[dict]:
+    include_deleted = not args.filter_sql
+    if args.include:
+        folders = db_folder_stats.get_folders(args, prefix=args.include[0].rstrip("/") + "/")
+    else:
+        folders = db_folder_stats.get_folders(args)
+
+    d = []
+    for path, stats in db_folder_stats.rollup(folders).items():
+        if path.startswith("http") or path.count("/") < 2:
+            continue
+
+        count = stats["count"] + (stats["deleted"] if include_deleted else 0)
+        size = stats["size"] + (stats["deleted_size"] if include_deleted else 0)
+        if count and (not args.folder_counts or args.folder_counts(count)):
+            d.append({"size": size, "count": count, "path": path})
+    return d
+
+
 def get_table(args) -> list[dict]:
-    media = list(args.db.query(*sqlgroups.fs_sql(args, limit=None)))
+    if db_folder_stats.can_use(args):
+        folders = group_folder_stats(args)
+    else:
+        media = list(args.db.query(*sqlgroups.fs_sql(args, limit=None)))
+        folders = group_by_folder(args, media)
 
-    folders = group_by_folder(args, media)
     return sorted(folders, key=lambda x: x["size"] / x["count"])
 
 
@@ -85,8 +108,8 @@ def mark_media_deleted_like(args, paths) -> int:
                 cursor = args.db.conn.execute(
                     f"""update media
                     set time_deleted={consts.APPLICATION_START}
-                    where path like ?""",
-                    [p + "%"],
+                    where path >= ? and path < ?""",
+                    sql_utils.prefix_range(p),
                 )
                 modified_row_count += cursor.rowcount
 
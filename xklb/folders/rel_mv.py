@@ -1,10 +1,10 @@
-import argparse, errno, os.path, shlex, shutil
+import argparse, errno, os.path, shlex
 from os.path import commonprefix
 from pathlib import Path
 
 from xklb import usage
 from xklb.files import sample_compare
-from xklb.utils import arggroups, argparse_utils, devices, file_utils, path_utils
+from xklb.utils import arggroups, argparse_utils, copy_utils, devices, file_utils, path_utils
 from xklb.utils.log_utils import log
 
 
@@ -185,7 +185,7 @@ def rel_move(sources, dest, simulate=False, relative_from=None, replace=False):
                 log.error("%s not found", abspath)
             elif e.errno == errno.EXDEV:  # cross-device move
                 log.debug("%s ->d %s", abspath, target_dir)
-                shutil.move(str(abspath), str(new_path))  # fallback to shutil
+                copy_utils.move_file(abspath, new_path)
                 new_paths.append(new_path)
             else:
                 raise
@@ -1,11 +1,23 @@
-import argparse, math, os, random, sys, tempfile
+import argparse, math, os, sys, tempfile
 from collections import Counter
 from pathlib import Path
 
 from humanize import naturalsize
 
 from xklb import usage
-from xklb.utils import arggroups, argparse_utils, consts, db_utils, devices, file_utils, iterables, nums, printing
+from xklb.mediadb import db_folder_stats
+from xklb.utils import (
+    arggroups,
+    argparse_utils,
+    consts,
+    db_utils,
+    devices,
+    file_utils,
+    iterables,
+    nums,
+    printing,
+    sql_utils,
+)
 from xklb.utils.log_utils import log
 
 
@@ -58,9 +70,19 @@ def parse_args() -> argparse.Namespace:
 
 def get_table(args) -> list[dict]:
     m_columns = db_utils.columns(args, "media")
-    or_paths = [f"path like :path_{i}" for i, _path in enumerate(args.relative_paths)]
+    or_paths = [
+        f"(path >= :path_{i} and path < :path_{i}_end)" if path.startswith(os.sep) else f"path like :path_{i}"
+        for i, path in enumerate(args.relative_paths)
+    ]
     or_paths_sql = f"and ({' or '.join(or_paths)})"
 
+    path_params = {}
+    for i, path in enumerate(args.relative_paths or []):
+        if path.startswith(os.sep):
+            path_params[f"path_{i}"], path_params[f"path_{i}_end"] = sql_utils.prefix_range(path)
+        else:
+            path_params[f"path_{i}"] = f"%{path}%"
+
     media = list(
         args.db.query(
             f"""
@@ -79,30 +101,59 @@ def get_table(args) -> list[dict]:
         order by {args.sort}
         {'limit :limit' if args.limit else ''}
         """,
-            {
-                "limit": args.limit,
-                **{
-                    f"path_{i}": f"{path}%" if path.startswith(os.sep) else f"%{path}%"
-                    for i, path in enumerate(args.relative_paths)
-                    if args.relative_paths
-                },
-            },
+            {"limit": args.limit, **path_params},
         ),
     )
 
     return media
 
 
+def get_read_only_mounts(args) -> list[str]:
+    return [s for s in args.relative_paths if Path(s).is_absolute() and not any(m in s for m in args.targets)]
+
+
+def mount_trie(mounts) -> dict:
+    trie = {}
+    for mount in mounts:
+        node = trie
+        for part in mount.rstrip(os.sep).split(os.sep):
+            node = node.setdefault(part, {})
+        node[None] = mount
+    return trie
+
+
+def find_mount(trie, path) -> str | None:
+    # the deepest mount which contains path
+    mount = None
+    node = trie
+    for part in path.split(os.sep):
+        node = node.get(part)
+        if node is None:
+            break
+        mount = node.get(None, mount)
+    return mount
+
+
+def group_by_mount(mounts, files) -> dict[str, list[dict]]:
+    trie = mount_trie(mounts)
+    mount_files = {mount: [] for mount in mounts}
+    for d in files:
+        mount = find_mount(trie, d["path"])
+        if mount is not None:
+            mount_files[mount].append(d)
+    return mount_files
+
+
 def get_path_stats(args, data) -> list[dict]:
-    read_only_mounts = [
-        s for s in args.relative_paths if Path(s).is_absolute() and not any(m in s for m in args.targets)
-    ]
+    read_only_mounts = get_read_only_mounts(args)
     if read_only_mounts:
         log.info("Treating as depletion targets: %s", read_only_mounts)
 
+    mount_files = group_by_mount(args.targets + read_only_mounts, data)
+
     result = []
     for srcmount in args.targets + read_only_mounts:
-        disk_files = [d for d in data if d["path"].startswith(srcmount)]
+        disk_files = mount_files[srcmount]
         if disk_files:
             result.append(
                 {
@@ -128,6 +179,82 @@ def print_path_stats(tbl) -> None:
     printing.table(tbl)
 
 
+def policy_weights(policy, disk_stats) -> dict[str, float]:
+    if policy in ["free", "pfrd"]:
+        return {d["mount"]: d["free"] for d in disk_stats}
+    elif policy in ["used", "purd"]:
+        return {d["mount"]: d["used"] for d in disk_stats}
+    elif policy in ["total", "ptrd"]:
+        return {d["mount"]: d["total"] for d in disk_stats}
+    return {d["mount"]: 1 for d in disk_stats}
+
+
+def plan_moves(args, disk_stats, to_rebin, full_disks=None) -> tuple[list, list]:
+    """Assign files to new mounts (first-fit decreasing)
+
+    Files are grouped by their folder relative to the source mount and the largest groups are placed first.
+    Each group goes to the target with the lowest planned load (relative to its policy weight) which still has room;
+    a group which does not fit anywhere whole is split into files and files which do not fit anywhere are not moved
+    """
+    full_disks = full_disks or []
+    weights = policy_weights(args.policy, disk_stats)
+    remaining = {d["mount"]: d.get("free_bytes") for d in disk_stats}  # None means unknown capacity
+    load = {d["mount"]: 0 for d in disk_stats}
+
+    groups = {}
+    for file in to_rebin:
+        rel_parent = os.path.dirname(file["path"][len(file["mount"]) :])
+        groups.setdefault((file["mount"], rel_parent), []).append(file)
+
+    def place(files, size):
+        src_mount = files[0]["mount"]
+        amount = len(files) if args.group == "count" else size
+
+        best_mount = None
+        best_score = None
+        for mount, weight in weights.items():
+            if mount == src_mount or mount in full_disks or weight <= 0:
+                continue
+            if remaining[mount] is not None and remaining[mount] < size:
+                continue
+            score = (load[mount] + amount) / weight
+            if best_score is None or score < best_score:
+                best_mount, best_score = mount, score
+
+        if best_mount is None:
+            return False
+
+        load[best_mount] += amount
+        if remaining[best_mount] is not None:
+            remaining[best_mount] -= size
+        for file in files:
+            file["from_path"] = file["path"]
+            file["path"] = best_mount + file["path"][len(file["mount"]) :]
+        return True
+
+    rebinned = []
+    unplaced = []
+    sized_groups = [(sum(d["size"] or 0 for d in files), files) for files in groups.values()]
+    for size, files in sorted(sized_groups, key=lambda t: t[0], reverse=True):
+        if place(files, size):
+            rebinned.extend(files)
+            continue
+
+        for file in sorted(files, key=lambda d: d["size"] or 0, reverse=True):
+            if place([file], file["size"] or 0):
+                rebinned.append(file)
+            else:
+                unplaced.append(file)
+
+    if unplaced:
+        log.warning(
+            "%s files (%s) do not fit on any target and will not be moved",
+            len(unplaced),
+            naturalsize(sum(d["size"] or 0 for d in unplaced)),
+        )
+    return rebinned, unplaced
+
+
 def rebin_files(args, disk_stats, all_files) -> tuple[list, list]:
     total_size = sum(d["size"] or 0 for d in all_files)
 
@@ -135,15 +262,13 @@ def rebin_files(args, disk_stats, all_files) -> tuple[list, list]:
     to_rebin = []
     full_disks = []
 
-    read_only_mounts = [
-        s for s in args.relative_paths if Path(s).is_absolute() and not any(m in s for m in args.targets)
-    ]
-    for disk_stat in devices.get_mount_stats(read_only_mounts):
-        disk_files = [d for d in all_files if d["path"].startswith(disk_stat["mount"])]
-        to_rebin.extend({"mount": disk_stat["mount"], **file} for file in disk_files)
+    read_only_mounts = get_read_only_mounts(args)
+    mount_files = group_by_mount([d["mount"] for d in disk_stats] + read_only_mounts, all_files)
+    for mount in read_only_mounts:
+        to_rebin.extend({"mount": mount, **file} for file in mount_files[mount])
 
     for disk_stat in disk_stats:
-        disk_files = [d for d in all_files if d["path"].startswith(disk_stat["mount"])]
+        disk_files = mount_files[disk_stat["mount"]]
 
         disk_rebin = []
         if disk_files:
@@ -152,7 +277,7 @@ def rebin_files(args, disk_stats, all_files) -> tuple[list, list]:
 
                 size = 0
                 for file in disk_files:
-                    size += file["size"]
+                    size += file["size"] or 0
                     if size < ideal_allocation_size:
                         untouched.append(file)
                     else:
@@ -175,32 +300,23 @@ def rebin_files(args, disk_stats, all_files) -> tuple[list, list]:
         )
         full_disks = []
 
-    rebinned = []
-    for file in to_rebin:
-        valid_targets = [d for d in disk_stats if d["mount"] not in [*full_disks, file["mount"]]]
-
-        mount_list = [d["mount"] for d in valid_targets]
-        if args.policy in ["free", "pfrd"]:
-            new_mount = random.choices(mount_list, weights=[stat["free"] for stat in valid_targets], k=1)[0]
-        elif args.policy in ["used", "purd"]:
-            new_mount = random.choices(mount_list, weights=[stat["used"] for stat in valid_targets], k=1)[0]
-        elif args.policy in ["total", "ptrd"]:
-            new_mount = random.choices(mount_list, weights=[stat["total"] for stat in valid_targets], k=1)[0]
-        else:
-            new_mount = random.choices(mount_list, k=1)[0]
-
-        file["from_path"] = file["path"]
-        file["path"] = file["path"].replace(file["mount"], new_mount)
-        rebinned.append(file)
+    rebinned, unplaced = plan_moves(args, disk_stats, to_rebin, full_disks)
+    untouched.extend({k: v for k, v in d.items() if k != "mount"} for d in unplaced)
 
     return untouched, rebinned
 
 
-def get_rel_stats(parents, files) -> list[dict[str, float | str]]:
+def get_rel_stats(args, parents, files) -> list[dict[str, float | str]]:
+    # without --limit, files covers every row under the parents so the folder totals are equivalent
+    use_folder_stats = not args.limit and all(os.path.isabs(p) for p in parents) and db_folder_stats.ensure(args)
+
     mount_space = []
     total_used = 1
     for parent in parents:
-        used = sum([file["size"] for file in files if file["path"].startswith(parent)])
+        if use_folder_stats:
+            used = db_folder_stats.get_size(args, parent)
+        else:
+            used = sum([file["size"] for file in files if file["path"].startswith(parent)])
         total_used += used
         mount_space.append([parent, used])
 
@@ -267,7 +383,7 @@ def scatter() -> None:
             "targets were not provided (-m) so provided paths will only be compared with each other. This might not be what you want!!",
         )
         args.targets = args.relative_paths
-        disk_stats = get_rel_stats(args.targets, files)
+        disk_stats = get_rel_stats(args, args.targets, files)
 
     if len(disk_stats) < 2:
         log.error(
@@ -289,11 +405,10 @@ def scatter() -> None:
     print(len(untouched), "files would not be moved", "(" + naturalsize(sum(d["size"] or 0 for d in untouched)) + ")")
 
     print("\n######### Commands to run #########")
+    dest_files = group_by_mount([d["mount"] for d in disk_stats], rebinned)
     for disk_stat in sorted(disk_stats, key=lambda d: d["free"], reverse=True):
         dest_disk_files = [
-            d["from_path"].replace(d["mount"], d["mount"] + "/.")
-            for d in rebinned
-            if d["path"].startswith(disk_stat["mount"])
+            d["from_path"].replace(d["mount"], d["mount"] + "/.") for d in dest_files[disk_stat["mount"]]
         ]
 
         if len(dest_disk_files) == 0:
@@ -1,3 +1,5 @@
+import math
+from collections import defaultdict
 from pathlib import Path
 
 from xklb import usage
@@ -107,29 +109,65 @@ def is_same_group(args, m0, m):
     return all(bools)
 
 
-def cluster_by_numbers(args, media):
-    group_id = 0
-    temp_groups = []
+def cluster_by_percentage(media, is_same, key, delta, constrains=None) -> list[int]:
+    # each item joins the first group whose first member is_same, otherwise it starts a new group.
+    # group leaders are bucketed by log(key) so items are only compared with leaders that could be within delta percent
+    k = delta / 200
+    bucket_width = math.log((1 + k) / (1 - k)) * (1 + 1e-9) if k < 1 else None
+
+    def get_bucket(value):
+        if bucket_width is None:
+            return 0
+        elif not value or value <= 0:
+            return None
+        return math.floor(math.log(value) / bucket_width)
+
+    leaders = []
+    leader_buckets = defaultdict(list)
     media_groups = []
     for m in media:
-        grouped = False
-        for i, group in enumerate(temp_groups):
-            m0 = group[0]
-            if is_same_group(args, m0, m):
-                group.append(m)
-                media_groups.append(i)
-                grouped = True
-                break
-
-        if not grouped:
-            temp_groups.append([m])
-            media_groups.append(group_id)
-            group_id += 1
+        value = key(m) or 0
+        if constrains and not constrains(m):
+            candidates = range(len(leaders))
+        else:
+            bucket = get_bucket(value)
+            if bucket is None or bucket_width is None:
+                candidates = leader_buckets[bucket]
+            else:
+                candidates = sorted(leader_buckets[bucket - 1] + leader_buckets[bucket] + leader_buckets[bucket + 1])
+
+        group_id = next((i for i in candidates if is_same(leaders[i], m)), None)
+        if group_id is None:
+            group_id = len(leaders)
+            leaders.append(m)
+            leader_buckets[get_bucket(value)].append(group_id)
+        media_groups.append(group_id)
 
     assert len(media_groups) == len(media)
     return media_groups
 
 
+def cluster_by_numbers(args, media):
+    if args.filter_sizes:
+        size_key = "size" if args.total_sizes else "median_size"
+        return cluster_by_percentage(
+            media, lambda m0, m: is_same_group(args, m0, m), key=lambda m: m[size_key], delta=args.sizes_delta
+        )
+    elif args.filter_counts:
+        return cluster_by_percentage(
+            media, lambda m0, m: is_same_group(args, m0, m), key=lambda m: m["exists"], delta=args.counts_delta
+        )
+    else:
+        duration_key = "duration" if args.total_durations else "median_duration"
+        return cluster_by_percentage(
+            media,
+            lambda m0, m: is_same_group(args, m0, m),
+            key=lambda m: m[duration_key],
+            delta=args.durations_delta,
+            constrains=lambda m: m.get("duration"),
+        )
+
+
 def filter_group_by_numbers(args, group):
     media = group["grouped_paths"]
 
@@ -1,8 +1,9 @@
 import argparse, os
 
 from xklb import usage
+from xklb.mediadb import db_folder_stats
 from xklb.playback import media_printer
-from xklb.utils import arggroups, argparse_utils, processes, sqlgroups
+from xklb.utils import arggroups, argparse_utils, db_utils, processes, sql_utils, sqlgroups
 
 
 def parse_args() -> argparse.Namespace:
@@ -34,7 +35,18 @@ def sort_by(args):
     return lambda x: (x.get("size") or 0 / (x.get("count") or 1), x.get("size") or 0, x.get("count") or 1)
 
 
+def sort_subset(args, d) -> list[dict]:
+    reverse = True
+    if args.sort_groups_by and " desc" in args.sort_groups_by:
+        reverse = False
+
+    return sorted(d, key=sort_by(args), reverse=reverse)
+
+
 def get_subset(args, level=None, prefix=None) -> list[dict]:
+    if getattr(args, "folder_stats", False):
+        return get_folder_stats_subset(args, level=level, prefix=prefix)
+
     d = {}
     excluded_files = set()
 
@@ -60,20 +72,47 @@ def get_subset(args, level=None, prefix=None) -> list[dict]:
             d[parent]["size"] += m.get("size") or 0
             d[parent]["count"] += 1
 
-    reverse = True
-    if args.sort_groups_by and " desc" in args.sort_groups_by:
-        reverse = False
-
-    return sorted(
-        [{"path": k, **v} for k, v in d.items() if k not in excluded_files],
-        key=sort_by(args),
-        reverse=reverse,
-    )
+    return sort_subset(args, [{"path": k, **v} for k, v in d.items() if k not in excluded_files])
+
+
+def get_folder_stats_subset(args, level, prefix=None) -> list[dict]:
+    include_deleted = not args.filter_sql
+
+    d = []
+    for f in db_folder_stats.get_rollup(args, level, prefix=prefix):
+        count = f["count"] + (f["deleted"] if include_deleted else 0)
+        size = f["size"] + (f["deleted_size"] if include_deleted else 0)
+        if count and f["path"] != os.sep:
+            d.append({"path": f["path"], "size": size, "count": count})
+
+    m_columns = db_utils.columns(args, "media")
+    table, bindings = "media", {}
+    fts_table = args.db["media"].detect_fts()
+    if fts_table and args.fts and args.include:  # files get the same rank column as the media scan
+        table, bindings = sql_utils.fts_search_sql(
+            "media", fts_table=fts_table, include=args.include, flexible=args.flexible_search
+        )
+        m_columns = {**m_columns, "rank": int}
+    select_sql = ", ".join(c for c in args.cols or ["path", "title", "duration", "size", "rank"] if c in m_columns)
+    for f in db_folder_stats.get_folders(args, prefix=prefix, depth=level - 1):
+        if f["count"] or (include_deleted and f["deleted"]):
+            d.extend(
+                db_folder_stats.get_folder_media(
+                    args,
+                    f["path"],
+                    select_sql=select_sql,
+                    filter_sql=" ".join(args.filter_sql),
+                    table=table,
+                    bindings=bindings,
+                )
+            )
+
+    return sort_subset(args, d)
 
 
 def load_subset(args):
     if args.depth == 0:
-        while len(args.subset) < 2:
+        while len(args.subset) < 2 and args.depth <= args.max_depth:
             args.depth += 1
             args.subset = get_subset(args, level=args.depth, prefix=args.cwd)
     else:
@@ -96,10 +135,24 @@ def get_data(args) -> list[dict]:
 
 def disk_usage():
     args = parse_args()
-    args.data = get_data(args)
     args.subset = []
     args.cwd = None
 
+    args.folder_stats = db_folder_stats.can_use(args)
+    if args.folder_stats:
+        if args.include:
+            args.cwd = args.include[0].rstrip(os.sep) + os.sep
+        args.max_depth = db_folder_stats.get_max_depth(args, prefix=args.cwd)
+        if args.max_depth is None:  # prefix is not a folder; search instead
+            args.folder_stats = False
+            args.cwd = None
+        else:
+            args.max_depth += 1
+
+    if not args.folder_stats:
+        args.data = get_data(args)
+        args.max_depth = max(d["path"].count(os.sep) for d in args.data) + 1
+
     load_subset(args)
 
     num_folders = sum(1 for d in args.subset if d.get("count"))
@@ -1,6 +1,4 @@
-import argparse, importlib, sys, textwrap
-
-from tabulate import tabulate
+import argparse, functools, importlib, sys, textwrap
 
 from xklb import __version__
 from xklb.utils import argparse_utils, iterables
@@ -119,6 +117,8 @@ progs = {
 
 
 def usage() -> str:
+    from tabulate import tabulate
+
     subcommands_list = []
     for category, category_progs in progs.items():
         subcommands_list.append(f"\n    {category}:\n")
@@ -233,15 +233,8 @@ modules = {
 }
 
 
-def create_subcommands_parser() -> argparse.ArgumentParser:
-    parser = argparse_utils.ArgumentParser(
-        prog="library",
-        description="xk media library",
-        epilog="Report bugs here: https://github.com/chapmanjacobd/library/issues/new/choose",
-        add_help=False,
-    )
-    subparsers = parser.add_subparsers()
-
+@functools.cache
+def subcommand_names() -> dict[str, list[str]]:
     # this needs to stay inside the function to prevent side-effects during testing
     known_subcommands = ["fs", "media", "open", "tabs", "du", "search", "links"]
 
@@ -250,19 +243,10 @@ def create_subcommands_parser() -> argparse.ArgumentParser:
         known_subcommands.extend(prefixes)
         return prefixes
 
-    def set_func(subparser, module_name: str, function_name: str):
-        def import_func():
-            module = importlib.import_module(module_name)
-            return getattr(module, function_name)()
-
-        subparser.set_defaults(func=import_func)
-
-    def add_parser(subparsers, func, aliases=None):
-        if aliases is None:
-            aliases = []
-
-        module_name, function_name = func.rsplit(".", 1)
-        name = function_name.replace("_", "-")
+    names = {}
+    for func, aliases in modules.items():
+        name = func.rsplit(".", 1)[1].replace("_", "-")
+        aliases = list(aliases)
 
         aliases += [
             s.replace("-", "") for s in [name] + aliases if "-" in s and s.replace("-", "") not in known_subcommands
@@ -273,26 +257,53 @@ def create_subcommands_parser() -> argparse.ArgumentParser:
         known_subcommands.extend([name, *aliases])
 
         aliases += consecutive_prefixes(name) + iterables.conform([consecutive_prefixes(a) for a in aliases])
-        subp = subparsers.add_parser(name, aliases=aliases, add_help=False)
+        names[func] = [name, *aliases]
+    return names
 
-        set_func(subp, module_name, function_name)
-        return subp
 
-    for module, aliases in modules.items():
-        add_parser(subparsers, module, aliases)
+@functools.cache
+def subcommand_table() -> dict[str, str]:
+    # lookup of every subcommand name and alias without building the argparse tree
+    return {alias: func for func, names in subcommand_names().items() for alias in names}
 
-    parser.add_argument("--version", "-V", action="store_true")
 
-    return parser
+def run_subcommand(func: str):
+    module_name, function_name = func.rsplit(".", 1)
+    module = importlib.import_module(module_name)
+    return getattr(module, function_name)()
 
 
-parser = create_subcommands_parser()
+def create_subcommands_parser() -> argparse.ArgumentParser:
+    parser = argparse_utils.ArgumentParser(
+        prog="library",
+        description="xk media library",
+        epilog="Report bugs here: https://github.com/chapmanjacobd/library/issues/new/choose",
+        add_help=False,
+    )
+    subparsers = parser.add_subparsers()
+
+    for func, (name, *aliases) in subcommand_names().items():
+        subp = subparsers.add_parser(name, aliases=aliases, add_help=False)
+        subp.set_defaults(func=functools.partial(run_subcommand, func))
+
+    parser.add_argument("--version", "-V", action="store_true")
+
+    return parser
 
 
 def library(args=None) -> None:
     if args:
         sys.argv = ["lb", *args]
 
+    func = subcommand_table().get(sys.argv[1]) if len(sys.argv) >= 2 else None
+    if func:  # fast path: no need to build the full parser
+        log.info("library v%s", __version__)
+        log.info(sys.argv)
+
+        del sys.argv[1]
+        return run_subcommand(func)
+
+    parser = create_subcommands_parser()
     parser.exit_on_error = False  # type: ignore
     try:
         args, _unk = parser.parse_known_args(args)
@@ -0,0 +1,269 @@
+import os
+from collections import Counter
+
+from xklb.utils import db_utils, sql_utils
+from xklb.utils.log_utils import log
+
+TRIGGERS = ["folder_stats_media_insert", "folder_stats_media_delete", "folder_stats_media_update"]
+STAT_COLUMNS = ["count", "size", "duration", "deleted", "deleted_size", "deleted_duration"]
+
+
+def parent_sql(path_sql) -> str:
+    # everything up to and including the last separator
+    return f"rtrim({path_sql}, replace({path_sql}, '{os.sep}', ''))"
+
+
+def grandparent_sql(folder_sql) -> str:
+    without_sep = f"substr({folder_sql}, 1, length({folder_sql}) - 1)"
+    return parent_sql(without_sep)
+
+
+def depth_sql(folder_sql) -> str:
+    return f"(length({folder_sql}) - length(replace({folder_sql}, '{os.sep}', '')))"
+
+
+def stat_values_sql(m_columns, row="NEW") -> dict[str, str]:
+    exists = f"(COALESCE({row}.time_deleted, 0) = 0)" if "time_deleted" in m_columns else "1"
+    size = f"COALESCE({row}.size, 0)" if "size" in m_columns else "0"
+    duration = f"COALESCE({row}.duration, 0)" if "duration" in m_columns else "0"
+    return {
+        "count": exists,
+        "size": f"{exists} * {size}",
+        "duration": f"{exists} * {duration}",
+        "deleted": f"(1 - {exists})",
+        "deleted_size": f"(1 - {exists}) * {size}",
+        "deleted_duration": f"(1 - {exists}) * {duration}",
+    }
+
+
+def trigger_sql(m_columns) -> dict[str, str]:
+    is_file = "COALESCE({row}.is_dir, 0) = 0 AND " if "is_dir" in m_columns else ""
+    is_file += f"{parent_sql('{row}.path')} != ''"
+
+    def add(row):
+        folder = parent_sql(f"{row}.path")
+        values = stat_values_sql(m_columns, row)
+        return f"""
+            INSERT INTO folder_stats (path, parent, depth, {', '.join(STAT_COLUMNS)})
+            SELECT {folder}, {grandparent_sql(folder)}, {depth_sql(folder)}, {', '.join(values[k] for k in STAT_COLUMNS)}
+            WHERE {is_file.format(row=row)}
+            ON CONFLICT(path) DO UPDATE SET {', '.join(f'{k} = {k} + excluded.{k}' for k in STAT_COLUMNS)};"""
+
+    def remove(row):
+        folder = parent_sql(f"{row}.path")
+        values = stat_values_sql(m_columns, row)
+        return f"""
+            UPDATE folder_stats SET {', '.join(f'{k} = {k} - {values[k]}' for k in STAT_COLUMNS)}
+            WHERE path = {folder} AND {is_file.format(row=row)};
+            DELETE FROM folder_stats WHERE path = {folder} AND count = 0 AND deleted = 0;"""
+
+    update_of = ", ".join(c for c in ["path", "size", "duration", "time_deleted", "is_dir"] if c in m_columns)
+    return {
+        "folder_stats_media_insert": f"CREATE TRIGGER folder_stats_media_insert AFTER INSERT ON media BEGIN{add('NEW')}\nEND",
+        "folder_stats_media_delete": f"CREATE TRIGGER folder_stats_media_delete AFTER DELETE ON media BEGIN{remove('OLD')}\nEND",
+        "folder_stats_media_update": f"CREATE TRIGGER folder_stats_media_update AFTER UPDATE OF {update_of} ON media BEGIN{remove('OLD')}{add('NEW')}\nEND",
+    }
+
+
+def create(args) -> None:
+    """(Re)build the folder_stats table from media
+
+    Each row holds the totals of the files directly inside one folder; triggers on media keep it up to date
+    """
+    m_columns = db_utils.columns(args, "media")
+    values = stat_values_sql(m_columns, row="m")
+    is_file = "COALESCE(m.is_dir, 0) = 0" if "is_dir" in m_columns else "1=1"
+
+    log.info("Building folder_stats...")
+    with args.db.conn:
+        for trigger in TRIGGERS:
+            args.db.conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        args.db.conn.execute("DROP TABLE IF EXISTS folder_stats")
+        args.db.conn.execute(
+            f"""CREATE TABLE folder_stats (
+                path TEXT PRIMARY KEY,
+                parent TEXT,
+                depth INTEGER,
+                {', '.join(f'{k} INTEGER' for k in STAT_COLUMNS)}
+            )"""
+        )
+        args.db.conn.execute(
+            f"""
+            INSERT INTO folder_stats
+            SELECT folder, {grandparent_sql('folder')}, {depth_sql('folder')}, {', '.join(STAT_COLUMNS)}
+            FROM (
+                SELECT
+                    {parent_sql('m.path')} AS folder
+                    , {', '.join(f'SUM({values[k]}) AS {k}' for k in STAT_COLUMNS)}
+                FROM media m
+                WHERE {is_file}
+                GROUP BY 1
+            )
+            WHERE folder != ''
+            """
+        )
+        args.db.conn.execute("CREATE INDEX idx_folder_stats_depth ON folder_stats(depth)")
+        args.db.conn.execute("CREATE INDEX idx_folder_stats_parent ON folder_stats(parent)")
+        for sql in trigger_sql(m_columns).values():
+            args.db.conn.execute(sql)
+
+
+def ensure(args) -> bool:
+    """Make sure folder_stats exists and that its triggers match the current media columns
+
+    Returns False when there is nothing to aggregate
+    """
+    tables = args.db.table_names()
+    if "media" not in tables:
+        return False
+
+    expected = trigger_sql(db_utils.columns(args, "media"))
+    existing = dict(
+        args.db.execute(
+            f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({','.join(['?'] * len(TRIGGERS))})",
+            TRIGGERS,
+        ).fetchall()
+    )
+    # a missing or outdated trigger means that writes might have been missed
+    if "folder_stats" not in tables or existing != expected:
+        create(args)
+    return True
+
+
+def can_use(args) -> bool:
+    # folder_stats only stores totals so any filter other than a path prefix needs a scan of media
+    return (
+        not args.exclude
+        and not args.aggregate_filter_sql
+        and all(s.strip() == "AND COALESCE(m.time_deleted,0) = 0" for s in args.filter_sql)
+        and (not args.include or (len(args.include) == 1 and os.path.isabs(args.include[0])))
+        and ensure(args)
+    )
+
+
+def get_folders(args, prefix=None, depth=None, min_depth=None) -> list[dict]:
+    where = []
+    bindings = {}
+    if prefix:
+        where.append("AND path >= :prefix AND path < :prefix_end")
+        bindings["prefix"], bindings["prefix_end"] = sql_utils.prefix_range(prefix)
+    if depth is not None:
+        where.append("AND depth = :depth")
+        bindings["depth"] = depth
+    if min_depth is not None:
+        where.append("AND depth >= :min_depth")
+        bindings["min_depth"] = min_depth
+
+    return list(
+        args.db.query(
+            f"""
+            SELECT *
+            FROM folder_stats
+            WHERE 1=1
+                {' '.join(where)}
+            """,
+            bindings,
+        )
+    )
+
+
+def ancestor(path, depth) -> str:
+    return os.sep.join(path.split(os.sep, depth)[:depth]) + os.sep
+
+
+def get_rollup(args, depth, prefix=None) -> list[dict]:
+    """Subtree totals of the folders at depth"""
+    args.db.conn.create_function("folder_ancestor", 2, ancestor, deterministic=True)
+
+    where = ""
+    bindings = {"depth": depth}
+    if prefix:
+        where = "AND path >= :prefix AND path < :prefix_end"
+        bindings["prefix"], bindings["prefix_end"] = sql_utils.prefix_range(prefix)
+
+    return list(
+        args.db.query(
+            f"""
+            SELECT
+                folder_ancestor(path, :depth) AS path
+                , {', '.join(f'SUM({k}) AS {k}' for k in STAT_COLUMNS)}
+            FROM folder_stats
+            WHERE depth >= :depth
+                {where}
+            GROUP BY 1
+            """,
+            bindings,
+        )
+    )
+
+
+def get_max_depth(args, prefix=None) -> int | None:
+    if prefix:
+        return args.db.pop(
+            "SELECT MAX(depth) FROM folder_stats WHERE path >= ? AND path < ?", sql_utils.prefix_range(prefix)
+        )
+    return args.db.pop("SELECT MAX(depth) FROM folder_stats")
+
+
+def get_size(args, prefix) -> int:
+    return (
+        args.db.pop("SELECT SUM(size) FROM folder_stats WHERE path >= ? AND path < ?", sql_utils.prefix_range(prefix))
+        or 0
+    )
+
+
+def ancestors(folder) -> list[str]:
+    p = folder.rstrip(os.sep).split(os.sep)
+    return [os.sep.join(p[:i]) + os.sep for i in range(1, len(p) + 1)]
+
+
+def rollup(folders, columns=None) -> dict[str, dict]:
+    """Subtree totals: every folder's stats are added to each of its ancestors"""
+    columns = columns or STAT_COLUMNS
+
+    d = {}
+    for f in folders:
+        for ancestor in ancestors(f["path"]):
+            if ancestor not in d:
+                d[ancestor] = {k: 0 for k in columns}
+            for k in columns:
+                d[ancestor][k] += f[k] or 0
+    return d
+
+
+def child_folder_counts(folder_paths) -> Counter:
+    return Counter(os.path.dirname(p.rstrip(os.sep)) + os.sep for p in folder_paths)
+
+
+def get_played_counts(args) -> dict[str, int]:
+    if "history" not in args.db.table_names():
+        return {}
+
+    return {
+        d["path"]: d["played"]
+        for d in args.db.query(
+            f"""
+            SELECT {parent_sql('m.path')} AS path, COUNT(DISTINCT h.media_id) AS played
+            FROM history h
+            JOIN media m ON m.id = h.media_id
+            GROUP BY 1
+            """
+        )
+    }
+
+
+def get_folder_media(args, folder, select_sql="path, size", filter_sql="", table="media", bindings=None) -> list[dict]:
+    # files directly inside folder
+    start, end = sql_utils.prefix_range(folder)
+    return list(
+        args.db.query(
+            f"""
+            SELECT {select_sql}
+            FROM {table} m
+            WHERE m.path >= :start AND m.path < :end
+                AND instr(substr(m.path, :offset), '{os.sep}') = 0
+                {filter_sql}
+            """,
+            {**(bindings or {}), "start": start, "end": end, "offset": len(folder) + 1},
+        )
+    )
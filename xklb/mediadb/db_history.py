@@ -1,5 +1,6 @@
 import sqlite3
 
+from xklb.mediadb import db_media
 from xklb.utils import consts, iterables
 from xklb.utils.log_utils import log
 
@@ -18,6 +19,27 @@ def exists(args, media_id) -> bool:
     return True
 
 
+def existing_media_ids(args, media_ids) -> set[int]:
+    media_ids = list(media_ids)
+
+    known = set()
+    for chunk_ids in iterables.chunks(media_ids, consts.SQLITE_PARAM_LIMIT):
+        try:
+            known.update(
+                media_id
+                for (media_id,) in args.db.execute(
+                    "select distinct media_id from history where media_id in ("
+                    + ",".join(["?"] * len(chunk_ids))
+                    + ")",
+                    chunk_ids,
+                )
+            )
+        except sqlite3.OperationalError as e:
+            log.debug(e)
+            return set()
+    return known
+
+
 def create(args):
     args.db.create_table(
         "history",
@@ -27,29 +49,39 @@ def create(args):
     )
 
 
-def add(args, paths=None, media_ids=None, time_played=None, playhead=None, mark_done=None):
-    media_ids = media_ids or []
-    if paths:
-        media_ids.extend([args.db.pop("select id from media where path = ?", [path]) for path in paths])
+def add_many(args, entries) -> int:
+    entries = list(entries)
+    path_ids = db_media.get_ids(args, [d["path"] for d in entries if not d.get("media_id") and d.get("path")])
 
     rows = [
         {
-            "media_id": media_id,
-            "time_played": time_played or consts.now(),
-            "playhead": playhead,
-            "done": mark_done,
+            "media_id": d.get("media_id") or path_ids.get(d.get("path")),
+            "time_played": d.get("time_played") or consts.now(),
+            "playhead": d.get("playhead"),
+            "done": d.get("done"),
         }
-        for media_id in media_ids
-        if media_id
+        for d in entries
     ]
+    rows = [d for d in rows if d["media_id"]]
     args.db["history"].insert_all(iterables.list_dict_filter_bool(rows), pk="id", alter=True)
+    return len(rows)
+
+
+def add(args, paths=None, media_ids=None, time_played=None, playhead=None, mark_done=None) -> int:
+    entries = [{"media_id": media_id} for media_id in media_ids or []]
+    entries.extend({"path": path} for path in paths or [])
+
+    return add_many(
+        args,
+        ({**d, "time_played": time_played, "playhead": playhead, "done": mark_done} for d in entries),
+    )
 
 
 def remove(args, paths=None, media_ids=None):
     media_ids = media_ids or []
     if paths:
-        media_ids.extend([args.db.pop("SELECT id from media WHERE path = ?", [path]) for path in paths])
+        path_ids = db_media.get_ids(args, paths)
+        media_ids.extend(path_ids.get(path) for path in paths)
 
     with args.db.conn:
-        for media_id in media_ids:
-            args.db.conn.execute("DELETE from history WHERE media_id = ?", [media_id])
+        args.db.conn.executemany("DELETE from history WHERE media_id = ?", [[media_id] for media_id in media_ids])
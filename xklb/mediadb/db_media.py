@@ -1,5 +1,6 @@
 import argparse, os, sqlite3
 from collections.abc import Collection
+from itertools import groupby
 from pathlib import Path
 
 from xklb.createdb import fs_add
@@ -160,40 +161,86 @@ def consolidate(v: dict) -> dict | None:
     return objects.dict_filter_bool(cv)
 
 
-def add(args, entry):
-    if "path" not in entry:
-        entry["path"] = entry.get("webpath")
-    if not entry.get("path"):
-        log.warning('Skipping insert: no "path" in entry %s', entry)
-        return
+def get_ids(args, paths) -> dict[str, int]:
+    paths = list(paths)
 
-    tags = entry.pop("tags", None) or ""
-    chapters = entry.pop("chapters", None) or []
-    subtitles = entry.pop("subtitles", None) or []
-    entry.pop("description", None)
+    path_ids = {}
+    for chunk_paths in iterables.chunks(paths, consts.SQLITE_PARAM_LIMIT):
+        try:
+            path_ids.update(
+                args.db.execute(
+                    "select path, id from media where path in (" + ",".join(["?"] * len(chunk_paths)) + ")",
+                    chunk_paths,
+                ).fetchall()
+            )
+        except sqlite3.OperationalError as e:  # no such table: media
+            log.debug(e)
+            return {}
+    return path_ids
+
+
+def add_many(args, entries) -> None:
+    media = {}
+    media_captions = {}
+    for entry in entries:
+        if "path" not in entry:
+            entry["path"] = entry.get("webpath")
+        if not entry.get("path"):
+            log.warning('Skipping insert: no "path" in entry %s', entry)
+            continue
+
+        tags = entry.pop("tags", None) or ""
+        chapters = entry.pop("chapters", None) or []
+        subtitles = entry.pop("subtitles", None) or []
+        entry.pop("description", None)
+
+        captions = media_captions.setdefault(entry["path"], [])
+        if tags:
+            captions.append({"time": 0, "text": tags})
+        captions.extend(chapters)
+        captions.extend(subtitles)
+
+        # later entries for the same path update the earlier ones
+        media[entry["path"]] = {**media.get(entry["path"], {}), **objects.dict_filter_bool(entry)}
+
+    if not media:
+        return
 
-    media_id = args.db.pop("select id from media where path = ?", [entry["path"]])
-    if not media_id and "webpath" in entry and not entry.get("error"):
-        media_id = args.db.pop("select id from media where path = ?", [entry["webpath"]])
+    path_ids = get_ids(
+        args,
+        [*media, *(d["webpath"] for d in media.values() if "webpath" in d and not d.get("error"))],
+    )
 
-    try:
+    for path, d in media.items():
+        media_id = path_ids.get(path)
+        if not media_id and "webpath" in d and not d.get("error"):
+            media_id = path_ids.get(d["webpath"])
         if media_id:
-            entry["id"] = media_id
+            d["id"] = media_id
 
-            args.db["media"].upsert(objects.dict_filter_bool(entry), pk="id", alter=True)
-        else:
-            args.db["media"].insert(objects.dict_filter_bool(entry), pk="id", alter=True)
-            media_id = args.db.pop("select id from media where path = ?", [entry["path"]])
+    try:
+        with args.db.conn:
+            # batch runs of entries with the same columns so that upsert does not set unrelated columns to NULL
+            for (is_existing, _columns), group in groupby(media.values(), key=lambda d: ("id" in d, tuple(d))):
+                if is_existing:
+                    args.db["media"].upsert_all(group, pk="id", alter=True)
+                else:
+                    args.db["media"].insert_all(group, pk="id", alter=True)
     except sqlite3.IntegrityError:
-        log.error("media_id %s: %s", media_id, entry)
+        log.error("media: %s", media)
         raise
 
-    if tags:
-        args.db["captions"].insert({"media_id": media_id, "time": 0, "text": tags}, alter=True)
-    for chapter in chapters:
-        args.db["captions"].insert({"media_id": media_id, **chapter}, alter=True)
-    if len(subtitles) > 0:
-        args.db["captions"].insert_all([{**d, "media_id": media_id} for d in subtitles], alter=True)
+    captions_paths = [path for path, captions in media_captions.items() if captions]
+    if captions_paths:
+        path_ids = get_ids(args, captions_paths)
+        args.db["captions"].insert_all(
+            [{**caption, "media_id": path_ids[path]} for path in captions_paths for caption in media_captions[path]],
+            alter=True,
+        )
+
+
+def add(args, entry):
+    add_many(args, [entry])
 
 
 def mark_media_undeleted(args, paths) -> int:
@@ -415,13 +462,19 @@ def get_dir_media(args, dirs: Collection, include_subdirs=False, limit=2_000) ->
     if len(dirs) == 0:
         return processes.no_media_found()
 
+    # prefix ranges can use the path index unlike `path LIKE subpath || '%'`
     if include_subdirs:
-        filter_paths = "AND (" + " OR ".join([f"path LIKE :subpath{i}" for i in range(len(dirs))]) + ")"
+        filter_paths = (
+            "AND (" + " OR ".join([f"(path >= :subpath{i} and path < :subpath{i}_end)" for i in range(len(dirs))]) + ")"
+        )
     else:
         filter_paths = (
             "AND ("
             + " OR ".join(
-                [f"(path LIKE :subpath{i} and path not like :subpath{i} || '%{os.sep}%')" for i in range(len(dirs))]
+                [
+                    f"(path >= :subpath{i} and path < :subpath{i}_end and instr(substr(path, length(:subpath{i}) + 1), :sep) = 0)"
+                    for i in range(len(dirs))
+                ]
             )
             + ")"
         )
@@ -460,7 +513,9 @@ def get_dir_media(args, dirs: Collection, include_subdirs=False, limit=2_000) ->
         LIMIT {limit}
     """
 
-    subpath_params = {f"subpath{i}": value + "%" for i, value in enumerate(dirs)}
+    subpath_params = {"sep": os.sep}
+    for i, value in enumerate(dirs):
+        subpath_params[f"subpath{i}"], subpath_params[f"subpath{i}_end"] = sql_utils.prefix_range(value)
 
     bindings = {**subpath_params}
     bindings = {**bindings, **{k: v for k, v in args.filter_bindings.items() if k.startswith("FTS")}}
@@ -1,7 +1,11 @@
-import os, sys
+import argparse, os, sys, threading, time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
 
 from xklb import usage
 from xklb.createdb import gallery_backend, tube_backend
+from xklb.data.http_errors import HTTPTooManyRequests
 from xklb.mediadb import db_media
 from xklb.mediafiles import process_ffmpeg, process_image
 from xklb.playback import media_printer
@@ -69,6 +73,12 @@ def parse_args():
     parser.add_argument("--prefix", default=os.getcwd())
 
     parser.add_argument("--same-domain", action="store_true", help="Choose a random domain to focus on")
+    parser.add_argument(
+        "--same-host-threads",
+        type=int,
+        default=1,
+        help="Download from the same hostname x times in parallel (see --threads for the global limit)",
+    )
 
     parser.add_argument("--live", action="store_true", help="Video: Allow live streams to be downloaded")
 
@@ -102,7 +112,12 @@ def parse_args():
     arggroups.sql_fs_post(args)
     arggroups.filter_links_post(args)
     web.requests_session(args)  # prepare requests session
+    args.threads = max(1, args.threads or 1)
+    args.same_host_threads = max(1, args.same_host_threads)
     arggroups.selenium_post(args)
+    if args.selenium and args.threads > 1:
+        log.warning("Selenium is not thread-safe. Using --threads 1")
+        args.threads = 1
     arggroups.process_ffmpeg_post(args)
     return args
 
@@ -128,6 +143,264 @@ def mark_download_attempt(args, paths) -> int:
     return modified_row_count
 
 
+def is_download_skipped(args, m) -> bool:
+    if args.blocklist_rules and sql_utils.is_blocked_dict_like_sql(m, args.blocklist_rules):
+        return True
+
+    if args.safe:
+        if (args.profile in (DBType.audio, DBType.video) and not tube_backend.is_supported(m["path"])) or (
+            args.profile in (DBType.image) and not gallery_backend.is_supported(args, m["path"])
+        ):
+            log.info("[%s]: Skipping unsupported URL (safe_mode)", m["path"])
+            return True
+
+    return False
+
+
+def claim_download(args, m, m_columns, attempted: list) -> bool:
+    if args.force or "time_modified" not in m_columns:
+        return True
+
+    # mark the download as attempted in the same statement which checks that no other process
+    # attempted it recently so that multiple processes can drain the same queue without overlap
+    previous_time_attempted = m.get("time_modified") or consts.APPLICATION_START  # 0 is nullified
+    with args.db.conn:
+        cursor = args.db.conn.execute(
+            f"""
+            UPDATE media SET time_modified = {consts.now()}
+            WHERE path = ?
+            AND COALESCE(time_modified, 0) <= {previous_time_attempted}
+            AND COALESCE(time_deleted, 0) = 0
+            """,
+            [m["path"]],
+        )
+    if cursor.rowcount:
+        return True
+
+    d = args.db.pop_dict("SELECT time_modified, time_deleted from media WHERE path = ?", [m["path"]])
+    log.debug(d)
+    if not d:  # not in the media table yet
+        return True
+
+    if d["time_deleted"]:
+        log.info(
+            "[%s]: Download marked deleted (%s ago). Skipping!",
+            m["path"],
+            strings.duration(consts.now() - d["time_deleted"]),
+        )
+        attempted.append(m["path"])
+    else:
+        log.info(
+            "[%s]: Download already attempted recently (%s ago). Skipping!",
+            m["path"],
+            strings.duration(consts.now() - d["time_modified"]),
+        )
+    return False
+
+
+def download_media(args, m, get_inner_urls) -> None:
+    log.debug(m)
+
+    if args.profile in (DBType.audio, DBType.video):
+        tube_backend.download(args, m)
+    elif args.profile == DBType.image:
+        gallery_backend.download(args, m)
+    elif args.profile == DBType.filesystem:
+        original_path = m["path"]
+
+        dl_paths = [original_path]
+        if args.links:
+            dl_paths = []
+            for link_dict in get_inner_urls(args, original_path):
+                dl_paths.append(link_dict["link"])
+
+        if not dl_paths:
+            log.info("No relevant links in page. Recording download attempt: %s", original_path)
+            db_media.download_add(args, original_path, error="No relevant links in page")
+
+        any_error = False
+        for i, dl_path in enumerate(dl_paths):
+            error = None
+            try:
+                local_path = web.download_url(args, dl_path)
+            except RuntimeError as e:
+                local_path = None
+                error = str(e)
+
+            if local_path and args.process:
+                extension = local_path.rsplit(".", 1)[-1].lower()
+                if extension in consts.AUDIO_ONLY_EXTENSIONS | consts.VIDEO_EXTENSIONS:
+                    result = process_ffmpeg.process_path(args, local_path)
+                elif extension in consts.IMAGE_EXTENSIONS:
+                    result = process_image.process_path(args, local_path)
+
+                if result is not None:
+                    local_path = str(result)
+
+            is_not_found = error is not None and "HTTPNotFound" in error
+            if error is not None and "HTTPNotFound" not in error:
+                any_error = True
+
+            db_media.download_add(
+                args,
+                original_path,
+                m,
+                local_path,
+                error=error,
+                mark_deleted=is_not_found,
+                delete_webpath_entry=(
+                    not any_error if i == len(dl_paths) - 1 else False
+                ),  # only check if last download link
+            )
+    else:
+        raise NotImplementedError
+
+
+def hostname(m) -> str:
+    return urlparse(m["path"]).hostname or ""
+
+
+class HostScheduler:
+    def __init__(self, args, media: list[dict], key=hostname, limit=None, interval=0.0, retries=None, backoff=None):
+        self.args = args
+        self.limit = limit or args.same_host_threads
+        self.interval = interval  # minimum seconds between starts for the same host
+        self.retries = args.http_download_retries if retries is None else retries
+        self.backoff = backoff or args.sleep_interval or 1
+        # one queue per hostname; the sequence number keeps the original (sorted) order across hosts
+        self.queues: dict[str, deque] = {}
+        for seq, m in enumerate(media):
+            self.queues.setdefault(key(m), deque()).append((seq, m))
+        self.active = Counter()
+        self.rate_limited = Counter()
+        self.backoff_until: dict[str, float] = {}
+        self.last_start: dict[str, float] = {}
+
+    def ready_time(self, host) -> float:
+        return max(self.backoff_until.get(host, 0), self.last_start.get(host, -self.interval) + self.interval)
+
+    def next(self) -> tuple[str, dict] | None:
+        now = time.monotonic()
+        next_host = None
+        for host, q in self.queues.items():
+            if not q or self.active[host] >= self.limit or self.ready_time(host) > now:
+                continue
+            if next_host is None or q[0][0] < self.queues[next_host][0][0]:
+                next_host = host
+
+        if next_host is None:
+            return None
+        _seq, m = self.queues[next_host].popleft()
+        self.active[next_host] += 1
+        self.last_start[next_host] = now
+        return next_host, m
+
+    def wait_time(self) -> float | None:
+        now = time.monotonic()
+        waits = [self.ready_time(host) - now for host, q in self.queues.items() if q and self.active[host] < self.limit]
+        return min((s for s in waits if s > 0), default=None)
+
+    def done(self, host, m, rate_limited=False) -> bool:
+        # returns True when m was put back in the queue to be retried
+        self.active[host] -= 1
+        if not rate_limited:
+            self.rate_limited[host] = 0
+            return False
+
+        self.rate_limited[host] += 1
+        q = self.queues[host]
+        if self.rate_limited[host] > self.retries:
+            log.error("[%s]: Too many 429 Too Many Requests responses. Skipping %s jobs", host, len(q) + 1)
+            q.clear()
+            return False
+
+        delay = min(2 ** self.rate_limited[host] * self.backoff, 60 * 60)
+        log.warning("[%s]: 429 Too Many Requests. Pausing jobs for this host for %s", host, strings.duration(delay))
+        self.backoff_until[host] = time.monotonic() + delay
+        if getattr(self.args, "links", False):  # inner links are only yielded once per run
+            return False
+        q.appendleft((-1, m))  # retry first
+        return True
+
+
+def schedule_downloads(args, media, m_columns, get_inner_urls) -> None:
+    scheduler = HostScheduler(args, media)
+    attempted = []  # skipped media is marked as attempted in batches
+    claimed = {}  # path -> time_modified before the download was claimed
+    thread_state = threading.local()
+
+    def run(m) -> bool:
+        # sqlite connections can't be shared between threads
+        worker_args = getattr(thread_state, "args", None)
+        if worker_args is None:
+            worker_args = argparse.Namespace(**{k: v for k, v in args.__dict__.items() if k not in {"db"}})
+            worker_args.db = db_utils.connect(worker_args)
+            thread_state.args = worker_args
+
+        try:
+            download_media(worker_args, m, get_inner_urls)
+        except HTTPTooManyRequests:
+            return False
+        except Exception as e:
+            if "too many 429 error" in str(e):  # requests Retry adapter gave up
+                return False
+            raise
+        return True
+
+    futures = {}
+    executor = ThreadPoolExecutor(max_workers=args.threads, thread_name_prefix="download")
+    try:
+        while True:
+            while len(futures) < args.threads:
+                item = scheduler.next()
+                if item is None:
+                    break
+                host, m = item
+
+                if m["path"] not in claimed:
+                    if is_download_skipped(args, m):
+                        attempted.append(m["path"])
+                        scheduler.done(host, m)
+                        continue
+                    if not claim_download(args, m, m_columns, attempted):
+                        scheduler.done(host, m)
+                        continue
+                    claimed[m["path"]] = m.get("time_modified")
+
+                futures[executor.submit(run, m)] = (host, m)
+
+            if len(attempted) >= consts.SQLITE_PARAM_LIMIT:
+                mark_download_attempt(args, attempted)
+                attempted.clear()
+
+            if not futures:
+                wait_time = scheduler.wait_time()
+                if wait_time is None:
+                    break
+                time.sleep(wait_time)
+                continue
+
+            done, _not_done = wait(futures, timeout=scheduler.wait_time(), return_when=FIRST_COMPLETED)
+            for future in done:
+                host, m = futures.pop(future)
+                rate_limited = not future.result()
+                if scheduler.done(host, m, rate_limited=rate_limited):
+                    continue  # keep the claim for the retry
+                if rate_limited:
+                    # give up on this media for now without using up the retry delay
+                    with args.db.conn:
+                        args.db.conn.execute(
+                            "UPDATE media SET time_modified = ? WHERE path = ?", [claimed[m["path"]], m["path"]]
+                        )
+                del claimed[m["path"]]
+    except Exception:
+        print("db:", args.database)
+        raise
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        mark_download_attempt(args, attempted)
+
+
 def download(args=None) -> None:
     if args:
         sys.argv = ["lb", *args]
@@ -165,105 +438,4 @@ def download(args=None) -> None:
         return
 
     get_inner_urls = iterables.return_unique(extract_links.get_inner_urls, lambda d: d["link"])
-    for m in media:
-        if args.blocklist_rules and sql_utils.is_blocked_dict_like_sql(m, args.blocklist_rules):
-            mark_download_attempt(args, [m["path"]])
-            continue
-
-        if args.safe:
-            if (args.profile in (DBType.audio, DBType.video) and not tube_backend.is_supported(m["path"])) or (
-                args.profile in (DBType.image) and not gallery_backend.is_supported(args, m["path"])
-            ):
-                log.info("[%s]: Skipping unsupported URL (safe_mode)", m["path"])
-                mark_download_attempt(args, [m["path"]])
-                continue
-
-        # check if download already attempted recently by another process
-        previous_time_attempted = m.get("time_modified") or consts.APPLICATION_START  # 0 is nullified
-        if not args.force and "time_modified" in m_columns:
-            d = args.db.pop_dict(
-                f"""
-                SELECT time_modified, time_deleted from media m
-                WHERE 1=1
-                AND path=?
-                AND (time_modified > {str(previous_time_attempted)} OR time_deleted > 0)
-                """,
-                [m["path"]],
-            )
-            log.debug(d)
-            if d:
-                if d["time_deleted"]:
-                    log.info(
-                        "[%s]: Download marked deleted (%s ago). Skipping!",
-                        m["path"],
-                        strings.duration(consts.now() - d["time_deleted"]),
-                    )
-                    mark_download_attempt(args, [m["path"]])
-                    continue
-                elif d["time_modified"]:
-                    log.info(
-                        "[%s]: Download already attempted recently (%s ago). Skipping!",
-                        m["path"],
-                        strings.duration(consts.now() - d["time_modified"]),
-                    )
-                    continue
-
-        try:
-            log.debug(m)
-
-            if args.profile in (DBType.audio, DBType.video):
-                tube_backend.download(args, m)
-            elif args.profile == DBType.image:
-                gallery_backend.download(args, m)
-            elif args.profile == DBType.filesystem:
-                original_path = m["path"]
-
-                dl_paths = [original_path]
-                if args.links:
-                    dl_paths = []
-                    for link_dict in get_inner_urls(args, original_path):
-                        dl_paths.append(link_dict["link"])
-
-                if not dl_paths:
-                    log.info("No relevant links in page. Recording download attempt: %s", original_path)
-                    db_media.download_add(args, original_path, error="No relevant links in page")
-
-                any_error = False
-                for i, dl_path in enumerate(dl_paths):
-                    error = None
-                    try:
-                        local_path = web.download_url(args, dl_path)
-                    except RuntimeError as e:
-                        local_path = None
-                        error = str(e)
-
-                    if local_path and args.process:
-                        extension = local_path.rsplit(".", 1)[-1].lower()
-                        if extension in consts.AUDIO_ONLY_EXTENSIONS | consts.VIDEO_EXTENSIONS:
-                            result = process_ffmpeg.process_path(args, local_path)
-                        elif extension in consts.IMAGE_EXTENSIONS:
-                            result = process_image.process_path(args, local_path)
-
-                        if result is not None:
-                            local_path = str(result)
-
-                    is_not_found = error is not None and "HTTPNotFound" in error
-                    if error is not None and "HTTPNotFound" not in error:
-                        any_error = True
-
-                    db_media.download_add(
-                        args,
-                        original_path,
-                        m,
-                        local_path,
-                        error=error,
-                        mark_deleted=is_not_found,
-                        delete_webpath_entry=(
-                            not any_error if i == len(dl_paths) - 1 else False
-                        ),  # only check if last download link
-                    )
-            else:
-                raise NotImplementedError
-        except Exception:
-            print("db:", args.database)
-            raise
+    schedule_downloads(args, media, m_columns, get_inner_urls)
@@ -1,6 +1,6 @@
 from xklb import usage
-from xklb.mediadb import db_history
-from xklb.utils import arg_utils, arggroups, argparse_utils, consts, printing
+from xklb.mediadb import db_history, db_media
+from xklb.utils import arg_utils, arggroups, argparse_utils, consts, iterables, printing
 
 
 def parse_args(**kwargs):
@@ -25,19 +25,29 @@ def history_add() -> None:
     history_exists = set()
     history_new = set()
     media_unknown = set()
-    for p in arg_utils.gen_paths(args):
-        media_id = args.db.pop("select id from media where path = ?", [p])
-        if media_id is None:
-            media_unknown.add(p)
-            if not args.force:
-                continue
-
-        if db_history.exists(args, media_id):
-            history_exists.add(p)
-        else:
-            history_new.add(p)
-
-        db_history.add(args, media_ids=[media_id], time_played=consts.APPLICATION_START, mark_done=True)
+    paths = list(arg_utils.gen_paths(args))
+    for chunk_paths in iterables.chunks(paths, consts.SQLITE_PARAM_LIMIT):
+        path_ids = db_media.get_ids(args, chunk_paths)
+        known_ids = db_history.existing_media_ids(args, path_ids.values())
+
+        media_ids = []
+        for p in chunk_paths:
+            media_id = path_ids.get(p)
+            if media_id is None:
+                media_unknown.add(p)
+                if not args.force:
+                    continue
+
+            if media_id in known_ids:
+                history_exists.add(p)
+            else:
+                history_new.add(p)
+                if media_id is not None:
+                    known_ids.add(media_id)
+
+            media_ids.append(media_id)
+
+        db_history.add(args, media_ids=media_ids, time_played=consts.APPLICATION_START, mark_done=True)
 
         printing.print_overwrite(
             f"History: {len(history_new)} new [{len(history_exists)} known {len(media_unknown)} skipped]"
@@ -1,4 +1,5 @@
 from xklb import usage
+from xklb.mediadb import db_folder_stats
 from xklb.utils import arggroups, argparse_utils, db_utils
 
 
@@ -13,3 +14,5 @@ def optimize_db() -> None:
     arggroups.args_post(args, parser)
 
     db_utils.optimize(args)
+    if "folder_stats" in args.db.table_names():
+        db_folder_stats.create(args)
@@ -2,7 +2,7 @@ import argparse, os, sqlite3
 
 from xklb import usage
 from xklb.playback import media_printer
-from xklb.utils import arggroups, argparse_utils, db_utils
+from xklb.utils import arggroups, argparse_utils, db_utils, sql_utils
 from xklb.utils.sqlgroups import construct_playlists_query
 
 
@@ -56,7 +56,9 @@ def delete_playlists(args, playlists) -> None:
     local_media = [p.rstrip(os.sep) for p in playlists if not p.startswith("http")]
     for folder in local_media:
         with args.db.conn:
-            cursor = args.db.conn.execute("delete from media where path like ?", (folder + "%",))
+            cursor = args.db.conn.execute(
+                "delete from media where path >= ? and path < ?", sql_utils.prefix_range(folder)
+            )
             deleted_media_count += cursor.rowcount
 
     print(f"Deleted {deleted_playlist_count} playlists ({deleted_media_count} media records)")
@@ -4,7 +4,7 @@ from pathlib import Path
 from shutil import which
 
 from xklb import usage
-from xklb.utils import arggroups, argparse_utils, consts, file_utils, nums, printing, processes, strings
+from xklb.utils import arggroups, argparse_utils, consts, file_utils, iterables, nums, printing, processes, strings
 from xklb.utils.arg_utils import gen_paths
 from xklb.utils.log_utils import log
 
@@ -24,21 +24,10 @@ def parse_args():
     return args
 
 
-def decode_quick_scan(path, scans, scan_duration=3, audio_scan=False):
+def decode_quick_scan(path, scans, scan_duration=3, audio_scan=False, scans_per_process=10):
     assert which("ffmpeg")
 
-    def decode(scan):
-        opts = []
-        if audio_scan:
-            opts += [
-                "-map",
-                "0:a",
-                "-c:a",
-                "copy",
-                "-map_metadata",
-                "-1",
-            ]
-
+    def decode(batch) -> bool:
         cmd = []
         if which("systemd-run"):
             cmd += ["systemd-run"]
@@ -66,35 +55,40 @@ def decode_quick_scan(path, scans, scan_duration=3, audio_scan=False):
             "-xerror",
             "-v",
             "16",
-            "-err_detect",
-            "explode",
-            "-ss",
-            f"{scan:.2f}",
-            "-i",
-            path,
-            "-t",
-            str(scan_duration),
-            *opts,
-            "-f",
-            "null",
-            os.devnull,
         ]
+        for scan in batch:
+            # -err_detect is an input option so every segment needs its own
+            cmd += ["-err_detect", "explode", "-ss", f"{scan:.2f}", "-t", str(scan_duration), "-i", path]
+
+        # each segment is a separate input so the default stream selection would only pick streams from one of them
+        for input_idx in range(len(batch)):
+            if audio_scan:
+                cmd += ["-map", f"{input_idx}:a"]
+            elif len(batch) > 1:
+                cmd += ["-map", f"{input_idx}:v:0?", "-map", f"{input_idx}:a:0?"]
+        if audio_scan:
+            cmd += ["-c:a", "copy", "-map_metadata", "-1"]
+        cmd += ["-f", "null", os.devnull]
 
-        proc = processes.cmd(*cmd)
+        try:
+            proc = processes.cmd(*cmd)
+        except subprocess.CalledProcessError:
+            return False
         # I wonder if something like this would be faster: -map 0:v:0 -filter:v "select=eq(pict_type\,I)" -frames:v 1
-        if proc.stderr != "":
-            raise RuntimeError
+        return proc.stderr == ""
 
-    with ThreadPoolExecutor(max_workers=4) as pool:
-        futures = [pool.submit(decode, scan) for scan in scans]
+    def count_failures(batch) -> int:
+        if decode(batch):
+            return 0
+        elif len(batch) == 1:
+            return 1
+        # -xerror stops at the first error so decode each segment of the failed batch separately
+        return sum(not decode([scan]) for scan in batch)
 
-    fail_count = 0
-    for future in futures:
-        try:
-            future.result()
-        except (RuntimeError, subprocess.CalledProcessError):
-            fail_count += 1
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(count_failures, batch) for batch in iterables.chunks(scans, scans_per_process)]
 
+    fail_count = sum(future.result() for future in futures)
     return fail_count / len(scans)
 
 
@@ -123,7 +117,7 @@ def decode_full_scan(path, audio_scan=False, frames="frames", threads=None):
                     "-y",
                     temp_output.name,
                 )
-                actual_duration = processes.FFProbe(temp_output.name).duration or 0
+                actual_duration = processes.FFProbe(temp_output.name, cache=False).duration or 0
         except subprocess.CalledProcessError:
             actual_duration = 0
     else:
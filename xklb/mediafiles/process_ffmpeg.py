@@ -1,4 +1,5 @@
 import argparse, os, shlex, subprocess, sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from xklb import usage
@@ -12,6 +13,7 @@ from xklb.utils.log_utils import log
 def parse_args() -> argparse.Namespace:
     parser = argparse_utils.ArgumentParser(usage=usage.process_ffmpeg)
     arggroups.process_ffmpeg(parser)
+    arggroups.process_jobs(parser)
     arggroups.debug(parser)
 
     arggroups.paths_or_stdin(parser)
@@ -323,18 +325,33 @@ def process_path(args, path, **kwargs):
     return output_path
 
 
+def ffmpeg_job(args, path) -> dict:
+    job = process_image.image_job(path)
+    try:
+        probe = processes.FFProbe(path)
+    except Exception:  # process_path will deal with it
+        return job
+
+    duration = probe.duration or 1
+    video_stream = next((s for s in probe.video_streams), None)
+    if video_stream and not args.audio_only and not args.keyframes and video_stream["codec_name"] != "av1":
+        width = nums.safe_int(video_stream.get("width")) or args.max_width
+        height = nums.safe_int(video_stream.get("height")) or args.max_height
+        scale = min(1, args.max_width / width, args.max_height / height)
+        # SVT-AV1 keeps roughly one core busy per 250k pixels (~8 cores for 1080p)
+        job["cost"] = max(1, round(width * height * scale**2 / 250_000))
+
+    job["work"] = job["cost"] * duration
+    return job
+
+
 def process_ffmpeg():
     args = parse_args()
 
-    for path in gen_paths(args):
-        if not path.startswith("http"):
-            path = str(Path(path).resolve())
-
-        try:
-            process_path(args, path)
-        except Exception:
-            print(path)
-            raise
+    paths = [path if path.startswith("http") else str(Path(path).resolve()) for path in gen_paths(args)]
+    with ThreadPoolExecutor(max_workers=args.same_device_threads * 4) as pool:
+        jobs = list(pool.map(lambda path: ffmpeg_job(args, path), paths))
+    process_image.run_jobs(args, jobs, process_path)
 
 
 def process_audio():
@@ -1,5 +1,6 @@
 import argparse, os, shlex, subprocess
 from pathlib import Path
+from urllib.parse import urlparse
 
 from xklb import usage
 from xklb.data import imagemagick_errors
@@ -13,6 +14,7 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--delete-unplayable", action="store_true")
     parser.add_argument("--max-image-height", type=int, default=2400)
     parser.add_argument("--max-image-width", type=int, default=2400)
+    arggroups.process_jobs(parser)
     arggroups.debug(parser)
 
     arggroups.paths_or_stdin(parser)
@@ -98,19 +100,46 @@ def process_path(args, path):
     return output_path
 
 
-def process_image():
-    args = parse_args()
+def source_device(path):
+    if path.startswith("http"):
+        return urlparse(path).hostname
+
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return None
 
-    for path in gen_paths(args):
-        if not path.startswith("http"):
-            path = str(Path(path).resolve())
 
+def image_job(path) -> dict:
+    try:
+        size = os.stat(path).st_size
+    except OSError:
+        size = 0
+    return {"path": path, "cost": 1, "work": max(size, 1), "key": source_device(path)}
+
+
+def run_jobs(args, jobs, process_fn) -> None:
+    threads = None if args.threads == -1 else args.threads
+    for job, future in processes.schedule_jobs(
+        lambda job: process_fn(args, job["path"]),
+        jobs,
+        cpu_budget=args.cpu_budget,
+        key_limit=args.same_device_threads,
+        max_jobs=1 if args.simulate else threads,
+    ):
         try:
-            process_path(args, path)
+            future.result()
         except Exception:
-            print(path)
+            print(job["path"])
             raise
 
 
+def process_image():
+    args = parse_args()
+
+    paths = [path if path.startswith("http") else str(Path(path).resolve()) for path in gen_paths(args)]
+    run_jobs(args, [image_job(path) for path in paths], process_path)
+
+
 if __name__ == "__main__":
     process_image()
@@ -1,9 +1,10 @@
 import argparse
+from pathlib import Path
 
 from xklb import usage
 from xklb.editdb import dedupe_db
 from xklb.mediadb import db_history
-from xklb.utils import arggroups, argparse_utils, db_utils
+from xklb.utils import arggroups, argparse_utils, consts, db_utils
 from xklb.utils.log_utils import log
 
 
@@ -22,38 +23,35 @@ def parse_args() -> argparse.Namespace:
 
 
 def copy_play_count(args, source_db) -> None:
-    s_db = db_utils.connect(argparse.Namespace(database=source_db, verbose=args.verbose))
-    m_columns = s_db["media"].columns_dict
-
-    copy_counts = list(
-        s_db.query(
-            """
-            SELECT
-                path
-                , h.time_played
-                , h.playhead
-                , done
-            FROM
-                media m
-            JOIN history h on h.media_id = m.id
-            WHERE
-                h.time_played > 0
-                OR
-                h.playhead > 0
-            """,
-        ),
-    )
-
-    log.info(len(copy_counts))
-    for d in copy_counts:
-        renamed_path = d["path"].replace(args.source_prefix, args.target_prefix, 1)
-        db_history.add(
-            args,
-            [renamed_path],
-            time_played=d.get("time_played"),
-            playhead=d.get("playhead"),
-            mark_done=d["done"],
-        )
+    # rewrite the source paths and look up the target media in the same statement
+    with db_utils.attach(args, Path(source_db).resolve()) as source_schema:
+        with args.db.conn:
+            cursor = args.db.conn.execute(
+                f"""
+                INSERT INTO history (media_id, time_played, playhead, done)
+                SELECT
+                    m.id
+                    , COALESCE(NULLIF(h.time_played, 0), :now)
+                    , h.playhead
+                    , h.done
+                FROM
+                    {source_schema}.media s_m
+                JOIN {source_schema}.history h on h.media_id = s_m.id
+                JOIN main.media m on m.path = (
+                    CASE WHEN instr(s_m.path, :source_prefix) > 0
+                    THEN substr(s_m.path, 1, instr(s_m.path, :source_prefix) - 1)
+                        || :target_prefix
+                        || substr(s_m.path, instr(s_m.path, :source_prefix) + length(:source_prefix))
+                    ELSE s_m.path END
+                )
+                WHERE
+                    h.time_played > 0
+                    OR
+                    h.playhead > 0
+                """,
+                {"now": consts.now(), "source_prefix": args.source_prefix, "target_prefix": args.target_prefix},
+            )
+    log.info(cursor.rowcount)
 
 
 def copy_play_counts() -> None:
@@ -2,7 +2,7 @@ import argparse, sqlite3
 from pathlib import Path
 
 from xklb import usage
-from xklb.utils import arggroups, argparse_utils, db_utils
+from xklb.utils import arggroups, argparse_utils, db_utils, processes
 from xklb.utils.log_utils import log
 
 
@@ -38,51 +38,113 @@ def parse_args() -> argparse.Namespace:
     return args
 
 
+def upsert_sql(args, table, source_schema, selected_columns, conflict_keys, where_sql) -> list[str]:
+    # keep the existing row ids and don't replace existing values with NULL
+    target_pks = [o.name for o in args.db[table].columns if o.is_pk]
+    update_columns = [s for s in selected_columns if s not in conflict_keys and s not in target_pks]
+    columns_sql = ", ".join(f"[{s}]" for s in selected_columns)
+
+    unique_keys = [target_pks] + [idx.columns for idx in args.db[table].indexes if idx.unique]
+    if any(set(keys) == set(conflict_keys) for keys in unique_keys):
+        on_conflict = "DO NOTHING"
+        if update_columns:
+            on_conflict = "DO UPDATE SET " + ", ".join(
+                f"[{s}] = COALESCE(excluded.[{s}], [{s}])" for s in update_columns
+            )
+        return [
+            f"""INSERT INTO main.[{table}] ({columns_sql})
+            SELECT {columns_sql} FROM {source_schema}.[{table}] WHERE {where_sql}
+            ON CONFLICT ({", ".join(f"[{s}]" for s in conflict_keys)}) {on_conflict}"""
+        ]
+
+    # ON CONFLICT needs a matching UNIQUE constraint; otherwise update the existing rows then insert the rest
+    join_sql = " AND ".join(f"s.[{k}] = main.[{table}].[{k}]" for k in conflict_keys)
+    statements = []
+    if update_columns:
+        statements.append(
+            f"""UPDATE main.[{table}]
+            SET {", ".join(f"[{s}] = COALESCE(s.[{s}], main.[{table}].[{s}])" for s in update_columns)}
+            FROM (SELECT * FROM {source_schema}.[{table}] WHERE {where_sql}) s
+            WHERE {join_sql}"""
+        )
+    statements.append(
+        f"""INSERT INTO main.[{table}] ({columns_sql})
+        SELECT {columns_sql} FROM {source_schema}.[{table}] s
+        WHERE ({where_sql})
+        AND NOT EXISTS (
+            SELECT 1 FROM main.[{table}] WHERE {join_sql}
+        )"""
+    )
+    return statements
+
+
 def merge_db(args, source_db) -> None:
     source_db = str(Path(source_db).resolve())
 
     s_db = db_utils.connect(args, conn=sqlite3.connect(source_db))
-    for table in [s for s in s_db.table_names() if "_fts" not in s and not s.startswith("sqlite_")]:
-        if args.only_tables and table not in args.only_tables:
-            log.info("[%s]: Skipping %s", source_db, table)
-            continue
-        else:
-            log.info("[%s]: %s", source_db, table)
-
-        skip_columns = args.skip_columns
-        primary_keys = args.primary_keys
-        if args.business_keys:
-            if not primary_keys:
-                primary_keys = list(o.name for o in args.db[table].columns if o.is_pk)
-
-            skip_columns = [*(args.skip_columns or []), *primary_keys]
-
-        selected_columns = s_db[table].columns_dict
-        if args.only_target_columns:
-            target_columns = args.db[table].columns_dict
-            selected_columns = [s for s in selected_columns if s in target_columns]
-        if skip_columns:
-            selected_columns = [s for s in selected_columns if s not in skip_columns]
-
-        log.info("[%s]: %s", table, selected_columns)
-        kwargs = {}
-        if args.business_keys or primary_keys:
-            source_table_pks = [s for s in (args.business_keys or primary_keys) if s in selected_columns]
-            if source_table_pks:
-                log.info("[%s]: Using %s as primary key(s)", table, ", ".join(source_table_pks))
-                kwargs["pk"] = source_table_pks
-
-        data = s_db[table].rows_where(where=" AND ".join(args.where) if args.where else None)
-        data = ({k: v for k, v in d.items() if k in selected_columns} for d in data)
-        with args.db.conn:
-            args.db[table].insert_all(
-                data,
-                alter=True,
-                ignore=args.ignore,
-                replace=not args.ignore,
-                upsert=args.upsert,
-                **kwargs,
-            )
+    with db_utils.attach(args, source_db) as source_schema:
+        for table in [s for s in s_db.table_names() if "_fts" not in s and not s.startswith("sqlite_")]:
+            if args.only_tables and table not in args.only_tables:
+                log.info("[%s]: Skipping %s", source_db, table)
+                continue
+            else:
+                log.info("[%s]: %s", source_db, table)
+
+            skip_columns = args.skip_columns
+            primary_keys = args.primary_keys
+            if args.business_keys:
+                if not primary_keys:
+                    primary_keys = list(o.name for o in args.db[table].columns if o.is_pk)
+
+                skip_columns = [*(args.skip_columns or []), *primary_keys]
+
+            source_columns = s_db[table].columns_dict
+            selected_columns = list(source_columns)
+            if args.only_target_columns:
+                target_columns = args.db[table].columns_dict
+                selected_columns = [s for s in selected_columns if s in target_columns]
+            if skip_columns:
+                selected_columns = [s for s in selected_columns if s not in skip_columns]
+
+            log.info("[%s]: %s", table, selected_columns)
+            if not selected_columns:
+                continue
+
+            source_table_pks = []
+            if args.business_keys or primary_keys:
+                source_table_pks = [s for s in (args.business_keys or primary_keys) if s in selected_columns]
+                if source_table_pks:
+                    log.info("[%s]: Using %s as primary key(s)", table, ", ".join(source_table_pks))
+
+            if args.db[table].exists():
+                target_columns = args.db[table].columns_dict
+                for col in selected_columns:
+                    if col not in target_columns:
+                        args.db[table].add_column(col, source_columns[col])
+            else:
+                args.db[table].create(
+                    {col: source_columns[col] for col in selected_columns},
+                    pk=source_table_pks[0] if len(source_table_pks) == 1 else source_table_pks or None,
+                )
+
+            where_sql = " AND ".join(args.where) if args.where else "1=1"
+            if args.upsert:
+                conflict_keys = source_table_pks or [o.name for o in args.db[table].columns if o.is_pk]
+                if not conflict_keys:
+                    processes.exit_error(f"[{table}]: --upsert requires --pk or --bk")
+                statements = upsert_sql(args, table, source_schema, selected_columns, conflict_keys, where_sql)
+            else:
+                columns_sql = ", ".join(f"[{s}]" for s in selected_columns)
+                statements = [
+                    f"""INSERT OR {'IGNORE' if args.ignore else 'REPLACE'} INTO main.[{table}] ({columns_sql})
+                    SELECT {columns_sql} FROM {source_schema}.[{table}] WHERE {where_sql}"""
+                ]
+
+            with args.db.conn:
+                for sql in statements:
+                    cursor = args.db.conn.execute(sql)
+                    log.info("[%s]: %s rows", table, cursor.rowcount)
+    s_db.close()
 
 
 def merge_dbs() -> None:
@@ -369,6 +369,14 @@ def get_multiple_player_template(args) -> list[tuple[str, str]]:
     return players
 
 
+def warm_page_cache(path, size=1024 * 1024):
+    try:
+        with open(path, "rb") as f:
+            f.read(size)
+    except OSError as e:
+        log.debug("warm_page_cache %s: %s", path, e)
+
+
 class MediaPrefetcher:
     def __init__(self, args, media: list[dict]):
         self.args = Namespace(**{k: v for k, v in args.__dict__.items() if k not in {"db"}})
@@ -377,23 +385,28 @@ class MediaPrefetcher:
         self.remaining = len(media)
         self.ignore_paths = set()
         self.futures = deque()
+        # a single long-lived worker so that media is prepared while the previous media is playing
+        # and so that the worker thread can keep using the same DB connection
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
 
     def fetch(self):
-        if self.media:
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                fill_count = 0
-                while self.media and len(self.futures) < max(1, self.args.prefetch):
-                    m = self.media.pop()
-                    if m["path"] in self.ignore_paths:
-                        continue
-
-                    future = executor.submit(self.prep_media, m)  # if self.args.prefetch > 1 else []
-                    self.ignore_paths.add(m["path"])
-                    self.futures.append(future)
-                    fill_count += 1
-                log.debug("prefetch full (inserted %s)", fill_count)
+        fill_count = 0
+        while self.media and len(self.futures) < max(1, self.args.prefetch):
+            m = self.media.pop()
+            if m["path"] in self.ignore_paths:
+                continue
+
+            future = self.executor.submit(self.prep_media, m)
+            self.ignore_paths.add(m["path"])
+            self.futures.append(future)
+            fill_count += 1
+        if fill_count:
+            log.debug("prefetch full (inserted %s)", fill_count)
         return self
 
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
     def infer_command(self, m) -> tuple[list[str], bool]:
         args = self.args
 
@@ -477,7 +490,8 @@ class MediaPrefetcher:
 
     def prep_media(self, m: dict):
         t = log_utils.Timer()
-        self.args.db = db_utils.connect(self.args)
+        if getattr(self.args, "db", None) is None:
+            self.args.db = db_utils.connect(self.args)
 
         m["original_path"] = m["path"]
         if not m["path"].startswith("http"):
@@ -493,6 +507,10 @@ class MediaPrefetcher:
                 m["path"] = m["original_path"] = transcode(self.args, m["path"])
                 log.debug("transcode: %s", t.elapsed())
 
+            if getattr(self.args, "prefetch_read", False):
+                warm_page_cache(m["path"])
+                log.debug("warm_page_cache: %s", t.elapsed())
+
         if self.args.folders:
             m["now_playing"] = m["path"]
         else:
@@ -693,6 +711,7 @@ def play(args, m, media_len) -> None:
 
 
 def play_list(args, media):
+    playlist = None
     try:
         playlist = MediaPrefetcher(args, media)
         playlist.fetch()
@@ -706,6 +725,8 @@ def play_list(args, media):
                     play(args, m, playlist.remaining)
 
     finally:
+        if playlist:
+            playlist.close()
         Path(args.mpv_socket).unlink(missing_ok=True)
         if args.chromecast:
             Path(consts.CAST_NOW_PLAYING).unlink(missing_ok=True)
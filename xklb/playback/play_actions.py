@@ -1,4 +1,4 @@
-import argparse, os
+import argparse
 from pathlib import Path
 
 from xklb import usage
@@ -367,7 +367,6 @@ def process_playqueue(args) -> None:
         log.debug("player.get_related_media: %s", t.elapsed())
 
     if args.big_dirs:
-        media_keyed = {d["path"]: d for d in media}
         folders = big_dirs.group_files_by_parents(args, media)
         dirs = big_dirs.process_big_dirs(args, folders)
         dirs = mcda.group_sort_by(args, dirs)
@@ -377,20 +376,9 @@ def process_playqueue(args) -> None:
             media = db_media.get_dir_media(args, dirs)
             log.debug("get_dir_media: %s", t.elapsed())
         else:
-            media = []
-            media_set = set()
-            for dir in dirs:
-                if len(dir) == 1:
-                    continue
-
-                for key in media_keyed:
-                    if key in media_set:
-                        continue
-
-                    if os.sep not in key.replace(dir, "") and key.startswith(dir):
-                        media_set.add(key)
-                        media.append(media_keyed[key])
-            log.debug("double for loop compare_block_strings: %s", t.elapsed())
+            parent_media = big_dirs.media_by_parent(media)
+            media = [m for dir in iterables.ordered_set(dirs) if len(dir) > 1 for m in parent_media.get(dir, [])]
+            log.debug("media_by_parent: %s", t.elapsed())
 
     if args.partial:
         media = history_sort(args, media)
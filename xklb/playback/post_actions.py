@@ -40,6 +40,13 @@ def mv_to_keep_folder(args, src: str) -> str:
 
 def delete_media(args, paths) -> int:
     paths = iterables.conform(paths)
+
+    local_paths = [p for p in paths if not p.startswith("http")]
+    open_paths = {p for p, is_open in zip(local_paths, file_utils.are_files_open(local_paths)) if is_open}
+    if open_paths:
+        log.warning("Not deleting %s files which are open in another program: %s", len(open_paths), open_paths)
+        paths = [p for p in paths if p not in open_paths]
+
     for p in paths:
         if p.startswith("http"):
             continue
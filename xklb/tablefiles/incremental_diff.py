@@ -1,3 +1,5 @@
+import itertools
+
 from xklb import usage
 from xklb.utils import arggroups, argparse_utils, consts, file_utils, web
 from xklb.utils.argparse_utils import ArgparseList
@@ -36,81 +38,67 @@ def parse_args():
     return args
 
 
+def diff_dataframes(args, df1, df2):
+    # drop cols with all nulls to allow merging "X" and object columns
+    df1 = df1.drop(columns=df1.columns[df1.isnull().all()])
+    df2 = df2.drop(columns=df2.columns[df2.isnull().all()])
+
+    if df1.empty:
+        return df2.assign(_merge="right_only")
+    elif df2.empty:
+        return df1.assign(_merge="left_only")
+
+    df_diff = df1.merge(df2, on=args.join_keys, how="outer", indicator=True)
+    return df_diff[df_diff["_merge"] != "both"]
+
+
 def process_chunks(args):
-    chunk_start_row = args.start_row
-    chunk_end_row = args.batch_size
-    while True:
-        dfs1 = file_utils.read_file_to_dataframes(
-            args.path1,
-            table_name=args.table1_name,
-            table_index=args.table1_index,
-            start_row=chunk_start_row,
-            end_row=chunk_end_row,
-            order_by=args.sort,
-            encoding=args.encoding1,
-            mimetype=args.mimetype1,
-        )
-        dfs2 = file_utils.read_file_to_dataframes(
-            args.path2,
-            table_name=args.table2_name,
-            table_index=args.table2_index,
-            start_row=chunk_start_row,
-            end_row=chunk_end_row,
-            order_by=args.sort,
-            encoding=args.encoding2,
-            mimetype=args.mimetype2,
-        )
-
-        # TODO: https://github.com/ICRAR/ijson
-
-        tables1 = {df.name for df in dfs1}
-        tables2 = {df.name for df in dfs2}
-        common_tables = tables1.intersection(tables2)
-        dfs1 = sorted(dfs1, key=lambda df: (df.name in common_tables, df.name), reverse=True)
-        dfs2 = sorted(dfs2, key=lambda df: (df.name in common_tables, df.name), reverse=True)
-
-        empty_dfs = set()
-        for df_idx in range(len(dfs1)):
-            df1 = dfs1[df_idx]
-            df2 = dfs2[df_idx]
-
-            # drop cols with all nulls to allow merging "X" and object columns
-            df1.drop(columns=df1.columns[df1.isnull().all()], inplace=True)  # inplace to preserve df.name
-            df2.drop(columns=df2.columns[df2.isnull().all()], inplace=True)  # inplace to preserve df.name
-
-            if df1.empty and df2.empty:
-                empty_dfs.add(df_idx)
-                continue
-            elif df1.empty:
+    import pandas as pd
+
+    tables1 = file_utils.read_file_to_dataframe_chunks(
+        args.path1,
+        args.batch_size,
+        table_name=args.table1_name,
+        table_index=args.table1_index,
+        start_row=args.start_row,
+        order_by=args.sort,
+        encoding=args.encoding1,
+        mimetype=args.mimetype1,
+    )
+    tables2 = file_utils.read_file_to_dataframe_chunks(
+        args.path2,
+        args.batch_size,
+        table_name=args.table2_name,
+        table_index=args.table2_index,
+        start_row=args.start_row,
+        order_by=args.sort,
+        encoding=args.encoding2,
+        mimetype=args.mimetype2,
+    )
+
+    # TODO: https://github.com/ICRAR/ijson
+
+    common_tables = {name for name, _chunks in tables1}.intersection(name for name, _chunks in tables2)
+    tables1 = sorted(tables1, key=lambda t: (t[0] in common_tables, t[0]), reverse=True)
+    tables2 = sorted(tables2, key=lambda t: (t[0] in common_tables, t[0]), reverse=True)
+
+    for (name1, chunks1), (name2, chunks2) in zip(tables1, tables2):
+        # both readers advance together so only one batch of each table is in memory
+        for df1, df2 in itertools.zip_longest(chunks1, chunks2):
+            if df1 is None:
                 log.warning("df1 has no more rows")
-            elif df2.empty:
+                df1 = pd.DataFrame()
+            elif df2 is None:
                 log.warning("df2 has no more rows")
+                df2 = pd.DataFrame()
 
-            df_diff = df1.merge(df2, on=args.join_keys, how="outer", indicator=True)
-            df_diff = df_diff[df_diff["_merge"] != "both"]
-
+            df_diff = diff_dataframes(args, df1, df2)
             if len(df_diff) > 0:
-                print(f"## Diff {args.path1}:{df1.name} and {args.path2}:{df2.name}")
+                print(f"## Diff {args.path1}:{name1} and {args.path2}:{name2}")
                 print_df(df_diff)
             del df1
             del df2
 
-        if len(empty_dfs) == len(dfs1):
-            break
-
-        del dfs1
-        del dfs2
-
-        if args.batch_size:
-            if chunk_start_row is None:
-                chunk_start_row = 0
-            chunk_start_row += args.batch_size
-            chunk_end_row += args.batch_size
-            log.debug(chunk_end_row)
-            continue
-        else:
-            break
-
 
 def incremental_diff():
     args = parse_args()
@@ -1,4 +1,4 @@
-import argparse, difflib, json, sys
+import argparse, difflib, json, sqlite3, sys
 from pathlib import Path
 
 from xklb import usage
@@ -9,16 +9,21 @@ from xklb.utils import (
     consts,
     db_utils,
     file_utils,
+    image_utils,
     iterables,
     nums,
     objects,
     path_utils,
     printing,
+    processes,
     strings,
 )
 from xklb.utils.consts import DBType
 from xklb.utils.log_utils import Timer, log
 
+MINIBATCH_THRESHOLD = 20_000  # above this many strings full KMeans takes minutes and gigabytes of RAM
+MAX_FEATURES = 100_000
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse_utils.ArgumentParser(usage=usage.cluster_sort)
@@ -63,6 +68,17 @@ def parse_args() -> argparse.Namespace:
 
     arggroups.cluster(parser)
     parser.set_defaults(cluster_sort=True)
+    parser.add_argument(
+        "--hamming-distance",
+        type=int,
+        default=10,
+        help="Group images whose perceptual hashes differ by at most x bits (of 64)",
+    )
+    parser.add_argument(
+        "--image-db",
+        default=consts.IMAGE_HASH_DB,
+        help="SQLite database which stores image fingerprints between runs (default: %(default)s)",
+    )
     arggroups.debug(parser)
 
     parser.add_argument("input_path", nargs="?", type=argparse.FileType("r"), default=sys.stdin)
@@ -96,31 +112,68 @@ def map_and_name(paths, clusters):
     return result
 
 
-def find_clusters(n_clusters, sentence_strings, stop_words=None):
-    from sklearn.cluster import KMeans
-    from sklearn.feature_extraction.text import TfidfVectorizer
+def vectorize(sentence_strings, stop_words=None):
+    import numpy as np
+    from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
 
     if stop_words is None:
         from xklb.data import wordbank
 
         stop_words = wordbank.stop_words
 
+    # tokenize once then fall back to looser vocabularies by masking columns instead of refitting:
+    # min_df=2 without stop words, any word without stop words, any word, character n-grams
     try:
-        vectorizer = TfidfVectorizer(min_df=2, strip_accents="unicode", stop_words=stop_words)
-        X = vectorizer.fit_transform(sentence_strings)
-    except ValueError:
-        try:
-            vectorizer = TfidfVectorizer(strip_accents="unicode", stop_words=stop_words)
-            X = vectorizer.fit_transform(sentence_strings)
-        except ValueError:
-            try:
-                vectorizer = TfidfVectorizer()
-                X = vectorizer.fit_transform(sentence_strings)
-            except ValueError:
-                vectorizer = TfidfVectorizer(analyzer="char_wb")
-                X = vectorizer.fit_transform(sentence_strings)
-
-    clusterizer = KMeans(n_clusters=n_clusters or int(X.shape[0] ** 0.5), random_state=0, n_init=10).fit(X)
+        counter = CountVectorizer(strip_accents="unicode", dtype=np.float32)
+        X = counter.fit_transform(sentence_strings).tocsc()
+    except ValueError:  # no words
+        counter = CountVectorizer(analyzer="char_wb", dtype=np.float32)
+        X = counter.fit_transform(sentence_strings).tocsc()
+    else:
+        stop_words = {s.lower() for s in stop_words}
+        is_stop_word = np.array([w in stop_words for w in counter.get_feature_names_out()], dtype=bool)
+        document_frequency = np.diff(X.indptr)
+
+        for mask in [(document_frequency >= 2) & ~is_stop_word, ~is_stop_word]:
+            if mask.any():
+                X = X[:, mask]
+                break
+
+    if X.shape[1] > MAX_FEATURES:  # keep the most frequent words
+        X = X[:, np.sort(np.argsort(-np.asarray(X.sum(axis=0)).ravel(), kind="stable")[:MAX_FEATURES])]
+
+    return TfidfTransformer().fit_transform(X.tocsr())
+
+
+def find_clusters(n_clusters, sentence_strings, stop_words=None):
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    t = Timer()
+    X = vectorize(list(sentence_strings), stop_words=stop_words)
+    log.info(
+        "Vectorized %s strings into %s features (%s non-zero, %.1f MiB) in %ss",
+        X.shape[0],
+        X.shape[1],
+        X.nnz,
+        (X.data.nbytes + X.indices.nbytes + X.indptr.nbytes) / 1024**2,
+        t.elapsed(),
+    )
+
+    n_clusters = min(n_clusters or int(X.shape[0] ** 0.5), X.shape[0])
+    if X.shape[0] > MINIBATCH_THRESHOLD:
+        clusterizer = MiniBatchKMeans(
+            n_clusters=n_clusters, random_state=0, n_init=3, batch_size=max(4096, n_clusters * 4)
+        ).fit(X)
+    else:
+        clusterizer = KMeans(n_clusters=n_clusters, random_state=0, n_init=10).fit(X)
+    log.info(
+        "%s fit %s clusters in %ss (max RSS %.1f MiB)",
+        clusterizer.__class__.__name__,
+        n_clusters,
+        t.elapsed(),
+        processes.max_rss() / 1024**2,
+    )
+
     clusters = clusterizer.labels_
     return clusters
 
@@ -219,70 +272,21 @@ def cluster_dicts(args, media):
     return media
 
 
-def cluster_images(paths, n_clusters=None):
-    t = Timer()
+def cluster_images(args, paths, n_clusters=None):
+    fingerprints = image_utils.image_hashes(args, paths, threads=getattr(args, "threads", None))
+    fingerprints = {p: d for p, d in fingerprints.items() if d["phash"] is not None}
 
-    import os
+    if n_clusters and len(fingerprints) > n_clusters:
+        from sklearn.cluster import KMeans
 
-    import numpy as np
-    from annoy import AnnoyIndex
-    from PIL import Image
-
-    log.info("imports %s", t.elapsed())
-    index_dir = "image_cluster_indexes"
-    os.makedirs(index_dir, exist_ok=True)
-
-    img_size = 100  # trade-off between accuracy and speed
-
-    image_mode_groups = {}
-    for path in paths:
-        img = Image.open(path)
-        img = img.resize((img_size, img_size), Image.Resampling.NEAREST)
-        img_array = np.array(img).reshape(-1)  # convert to scalar for ANNoy
-        mode = img.mode
-        if mode not in image_mode_groups:
-            image_mode_groups[mode] = []
-        image_mode_groups[mode].append(img_array)
-    log.info("image_mode_groups %s", t.elapsed())
-
-    annoy_indexes = {}
-    for mode, images in image_mode_groups.items():
-        dimension = images[0].shape[0]
-
-        annoy_index = AnnoyIndex(dimension, "angular")
-        for i, vector in enumerate(images):
-            annoy_index.add_item(i, vector)
-
-        annoy_index.build(100)  # trade-off between accuracy and speed
-        annoy_indexes[mode] = annoy_index
-    log.info("annoy_index %s", t.elapsed())
-
-    clusters = []
-    for mode, images in image_mode_groups.items():
-        annoy_index = annoy_indexes[mode]
-        for i in range(len(images)):
-            nearest_neighbors = annoy_index.get_nns_by_item(i, n_clusters or int(len(images) ** 0.6))
-            clusters.extend([i] * len(nearest_neighbors))
-    log.info("image_mode_groups %s", t.elapsed())
-
-    grouped_strings = {}
-    for i, group_string in enumerate(paths):
-        cluster_id = clusters[i]
-
-        if cluster_id not in grouped_strings:
-            grouped_strings[cluster_id] = []
-
-        grouped_strings[cluster_id].append(group_string + "\n")
-    log.info("grouped_strings %s", t.elapsed())
-
-    result = []
-    for _cluster_id, paths in grouped_strings.items():
-        common_prefix = os.path.commonprefix(paths)
-        metadata = {"common_path": common_prefix, "grouped_paths": sorted(paths)}
-        result.append(metadata)
-    log.info("common_prefix %s", t.elapsed())
+        X = image_utils.feature_vectors(list(fingerprints.values()))
+        clusters = KMeans(n_clusters=n_clusters, random_state=0, n_init=10).fit(X).labels_
+        grouped_paths = list(map_cluster_to_paths(list(fingerprints), clusters).values())
+    else:
+        grouped_paths = image_utils.group_similar(fingerprints, args.hamming_distance)
+    grouped_paths.extend([p] for p in paths if p not in fingerprints)  # unreadable images are left on their own
 
-    return result
+    return [{"common_path": path_utils.common_path(g), "grouped_paths": sorted(g)} for g in grouped_paths]
 
 
 def filter_near_duplicates(groups: list[dict]) -> list[dict]:
@@ -323,7 +327,9 @@ def cluster_sort() -> None:
     if args.profile == "lines":
         groups = cluster_paths(lines, args.clusters, args.stop_words)
     elif args.profile == "image":
-        groups = cluster_images(lines, args.clusters)
+        Path(args.image_db).parent.mkdir(parents=True, exist_ok=True)
+        args.db = db_utils.connect(args, conn=sqlite3.connect(args.image_db))
+        groups = cluster_images(args, lines, args.clusters)
     else:
         raise NotImplementedError
     groups = sorted(groups, key=lambda d: (len(d["grouped_paths"]), -len(d["common_path"])))
@@ -146,6 +146,12 @@ download = r"""library download DATABASE [--prefix /mnt/d/] --video [--subs] [--
 
         library download photos.db --photos --image --sort "ROW_NUMBER() OVER ( PARTITION BY SUBSTR(m.path, INSTR(m.path, '//') + 2, INSTR( SUBSTR(m.path, INSTR(m.path, '//') + 2), '/') - 1) )"
 
+    Download from up to 8 sites at once with at most 2 connections per site
+
+        library download dl.db --fs --threads 8 --same-host-threads 2
+
+    Multiple download processes can share the same database; each row is only claimed by one of them
+
     Print list of queued up downloads
 
         library download --print
@@ -292,6 +298,10 @@ fs_update = """library fs-update DATABASE
     Update each path previously saved
 
         library fsupdate video.db
+
+    Skip folders which have not changed since the last scan (file additions, deletions, and renames change the folder modification time)
+
+        library fsupdate --incremental video.db
 """
 
 places_import = """library places-import DATABASE PATH ...
@@ -593,6 +603,10 @@ tube_update = """library tube-update [--audio | --video] DATABASE
 
         library tubeupdate educational.db --extra https://www.youtube.com/channel/UCBsEUcR-ezAuxB2WlfeENvA/videos
 
+    Update many playlists in parallel; playlists which often have new media are updated first
+
+        library tubeupdate educational.db --threads 8 --same-extractor-threads 2 --same-extractor-interval 5
+
     Remove duplicate playlists
 
         library dedupe-db video.db playlists --bk extractor_playlist_id
@@ -633,6 +647,11 @@ big_dirs = """library big-dirs PATH ... [--limit (4000)] [--depth (0)] [--sort-g
 
     Load from fs database
 
+        library big-dirs video.db
+
+        Folder totals are read from the folder_stats table (built on first use and kept up to date by triggers)
+        Sorting by or printing median_size or median_duration reads every media row instead
+
         library fs video.db --cols path,duration,size,time_deleted --to-json | library big-dirs --from-json
 
         Only include files between 1MiB and 5MiB
@@ -672,6 +691,8 @@ disk_usage = """library disk-usage DATABASE [--sort-groups-by size | count] [--d
         | /home/xk/github/xk/lb/__pypackages__/3.11/lib/jedi/third_party/typeshed/third_party/2and3/requests/packages/urllib3/packages/ssl_match_hostname/__init__.pyi        | 88 Bytes |
         | /home/xk/github/xk/lb/__pypackages__/3.11/lib/jedi/third_party/typeshed/third_party/2and3/requests/packages/urllib3/packages/ssl_match_hostname/_implementation.pyi | 81 Bytes |
 
+    Without filters (other than a single absolute path) folder totals are read from the folder_stats table.
+    It is built on first use and kept up to date by triggers; library optimize rebuilds it
 """
 
 christen = """library christen [--run]
@@ -729,6 +750,11 @@ cluster_sort = """library cluster-sort [input_path | stdin] [output_path | stdou
         image2.jpg
         image3.jpg' | library cluster-sort --image --move-groups
 
+    Image fingerprints are cached in ~/.cache/library/image_hashes.db so re-runs only decode new or changed files
+
+        fd -eJPG . ~/Pictures/ | library cluster-sort --image --hamming-distance 6 --print-groups
+        fd -eJPG . ~/Pictures/ | library cluster-sort --image --clusters 40  # KMeans on hashes and color thumbnails
+
     Print similar paths
 
         library fs 0day.db -pa --cluster --print-groups
@@ -741,7 +767,7 @@ copy_play_counts = """library copy-play-counts SOURCE_DB ... DEST_DB [--source-p
 
         library copy-play-counts phone.db audio.db --source-prefix /storage/6E7B-7DCE/d --target-prefix /mnt/d
 """
-dedupe_media = """library dedupe-media [--audio | --id | --title | --filesystem] [--only-soft-delete] [--limit LIMIT] DATABASE
+dedupe_media = """library dedupe-media [--audio | --id | --title | --filesystem | --image] [--only-soft-delete] [--limit LIMIT] DATABASE
 
     Dedupe your files (not to be confused with the dedupe-db subcommand)
 
@@ -749,6 +775,11 @@ dedupe_media = """library dedupe-media [--audio | --id | --title | --filesystem]
 
         library dedupe-media --fs video.db
 
+    Near-duplicate images (perceptual hashes are saved in the database so later runs only read new or changed files)
+
+        library dedupe-media --image photos.db
+        library dedupe-media --image --hamming-distance 8 photos.db  # looser matching
+
     Dedupe based on duration and file basename or dirname similarity
 
         library dedupe-media video.db --duration --basename -s release_group  # pre-filter with a specific text substring
@@ -1048,6 +1079,9 @@ scatter = """library scatter [--limit LIMIT] [--policy POLICY] [--sort SORT] --t
 
         library scatter fs.db -m /mnt/d1:/mnt/d3:/mnt/d4 /mnt/d2
 
+    Files are moved folder by folder (largest first) and a target is never planned past its free space.
+    The policy (free, used, total, rand) sets the share of the moved data that each target receives
+
     This tool is intended for local use. If transferring many small files across the network something like
     [fpart](https://github.com/martymac/fpart) or [fpsync](https://www.fpart.org/fpsync/) will be better.
 """
@@ -1329,11 +1363,21 @@ process_ffmpeg = """library process-ffmpeg PATH ... [--always-split] [--split-lo
     Use --split-longer-than to _only_ detect silence for files in excess of a specific duration
 
         library process-audio --split-longer-than 36mins audiobook.m4b audiobook2.mp3
+
+    Files are processed in parallel. Each video is estimated to keep one core busy per 250k output pixels,
+    audio and images one core each. Jobs start largest-first while their estimates fit within --cpu-budget
+
+        library process-ffmpeg --cpu-budget 12 --same-device-threads 4 ~/d/library/
+        library process-audio --threads 1 ./  # one file at a time
 """
 
 process_image = """library process-image PATH ...
 
     Resize images to max 2400x2400px and format AVIF to save space
+
+    Images are processed in parallel (see --cpu-budget and --same-device-threads)
+
+        library process-image --cpu-budget 4 ~/Pictures/
 """
 
 sample_hash = """library sample-hash [--same-file-threads 1] [--chunk-size BYTES] [--gap BYTES OR 0.0-1.0*FILESIZE] PATH ...
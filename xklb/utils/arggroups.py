@@ -12,7 +12,6 @@ from xklb.utils import (
     objects,
     processes,
     sql_utils,
-    web,
 )
 from xklb.utils.consts import DEFAULT_FILE_ROWS_READ_LIMIT, DBType
 from xklb.utils.log_utils import log
@@ -41,9 +40,21 @@ def args_post(args, parser, create_db=False):
         for k, v in args.__dict__.items()
         if k not in ["database", "verbose", "defaults"] + list(args.defaults.keys())
     }
-    args.extractor_config = {
-        k: v for k, v in settings.items() if k not in ["db", "paths", "actions", "backfill_pages"]
-    } | (getattr(args, "extractor_config", None) or {})
+    unsaved_settings = [
+        "db",
+        "paths",
+        "actions",
+        "backfill_pages",
+        "threads",
+        "same_host_threads",
+        "same_extractor_threads",
+        "same_extractor_interval",
+        "rate_limit_retries",
+        "profile_sql",
+    ]
+    args.extractor_config = {k: v for k, v in settings.items() if k not in unsaved_settings} | (
+        getattr(args, "extractor_config", None) or {}
+    )
 
     log_args = objects.dict_filter_bool(settings)
     if log_args:
@@ -127,6 +138,13 @@ def debug(parent_parser):
         help="Include only specific file extensions",
     )
     parser.add_argument("--simulate", "--dry-run", action="store_true")
+    parser.add_argument(
+        "--profile-sql",
+        nargs="?",
+        const=True,
+        metavar="JSON",
+        help="Time each SQL query and capture its EXPLAIN QUERY PLAN; print a summary at exit or write it to a JSON file",
+    )
     printing(parent_parser)
 
 
@@ -643,6 +661,11 @@ where 'o' is a key that seeks the amount you want in mpv""",
     parser.add_argument(
         "--prefetch", type=int, default=3, help="Prepare for playback by reading some file metadata before it is needed"
     )
+    parser.add_argument(
+        "--prefetch-read",
+        action="store_true",
+        help="Read the first MiB of upcoming files while the current file plays; useful for spinning disks and network mounts",
+    )
     parser.add_argument(
         "--prefix", default="", help="Add a prefix for file paths; eg. SSHFS mount makes paths different from normal"
     )
@@ -1128,6 +1151,27 @@ def process_ffmpeg(parent_parser):
     parser.add_argument("--crf", default="40")
 
 
+def process_jobs(parent_parser):
+    parser = parent_parser.add_argument_group("Job scheduling")
+    parser.add_argument(
+        "--cpu-budget",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="""Start jobs while their estimated CPU cores add up to at most this number (default: %(default)s)
+--threads limits the number of jobs regardless of cost""",
+    )
+    same_device_threads(parser)
+
+
+def same_device_threads(parser):
+    parser.add_argument(
+        "--same-device-threads",
+        type=int,
+        default=2,
+        help="Read or write at most x files on the same disk (or host) at a time",
+    )
+
+
 def process_ffmpeg_post(args):
     args.split_longer_than = nums.human_to_seconds(args.split_longer_than)
     args.min_split_segment = nums.human_to_seconds(args.min_split_segment)
@@ -1394,6 +1438,8 @@ def selenium_post(args):
     if args.scroll or args.firefox or args.chrome or args.auto_pager or args.poke:
         args.selenium = True
     if args.selenium:
+        from xklb.utils import web
+
         web.load_selenium(args)
 
 
@@ -51,6 +51,15 @@ DEFAULT_MULTIPLE_PLAYBACK = -1
 DEFAULT_SUBTITLE_MIX = 0.35
 MANY_LINKS = 8
 PYTEST_RUNNING = "pytest" in sys.modules
+
+if PYTEST_RUNNING:
+    CACHE_DIR = str(Path(TEMP_DIR) / "library_cache")
+else:
+    CACHE_DIR = str(Path(os.getenv("XDG_CACHE_HOME") or "~/.cache").expanduser() / "library")
+FFPROBE_CACHE_DB = os.getenv("LIBRARY_FFPROBE_CACHE", str(Path(CACHE_DIR) / "ffprobe.db"))  # set to "" to disable
+FFPROBE_CACHE_MAX_ENTRIES = 250_000
+IMAGE_HASH_DB = str(Path(CACHE_DIR) / "image_hashes.db")
+
 REGEX_ANSI_ESCAPE = re.compile(r"(?:\x1B[@-_]|[\x80-\x9F])[0-?]*[ -/]*[@-~]")
 REGEX_SUBREDDIT = re.compile("|".join([r".*reddit\.com/r/(.*?)/.*", r".*redd\.it/r/(.*?)/.*"]))
 REGEX_REDDITOR = re.compile(
@@ -0,0 +1,259 @@
+import errno, os, shutil, time
+from collections import Counter
+from functools import lru_cache
+
+from xklb.utils import printing, strings
+from xklb.utils.log_utils import log
+
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+CHUNK_SIZE = 1024 * 1024 * 1024
+BUFFER_SIZE = 1024 * 1024
+
+# the kernel or filesystem can't do it; try the next method
+UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+    errno.ENOTTY,
+    errno.EINVAL,
+    errno.EBADF,
+    errno.ENOTSOCK,
+}
+
+unsupported = set()  # (method, src_dev, dst_dev)
+
+
+def reflink(fsrc, fdst) -> None:
+    try:
+        import fcntl
+    except ModuleNotFoundError:
+        raise OSError(errno.ENOSYS, "FICLONE is not available")
+
+    fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def copy_range(fsrc, fdst) -> None:
+    if not hasattr(os, "copy_file_range"):
+        raise OSError(errno.ENOSYS, "copy_file_range is not available")
+
+    copied = 0
+    while n := os.copy_file_range(fsrc.fileno(), fdst.fileno(), CHUNK_SIZE):
+        copied += n
+    if copied == 0 and os.fstat(fsrc.fileno()).st_size > 0:
+        raise OSError(errno.ENOSYS, "copy_file_range did not copy anything")  # eg. procfs
+
+
+def sendfile(fsrc, fdst) -> None:
+    if not hasattr(os, "sendfile"):
+        raise OSError(errno.ENOSYS, "sendfile is not available")
+
+    while os.sendfile(fdst.fileno(), fsrc.fileno(), None, CHUNK_SIZE):
+        pass
+
+
+COPY_METHODS = [("reflink", reflink), ("copy_file_range", copy_range), ("sendfile", sendfile)]
+
+
+def copy_data(fsrc, fdst, methods=None) -> str:
+    devices = (os.fstat(fsrc.fileno()).st_dev, os.fstat(fdst.fileno()).st_dev)
+    for method, fn in COPY_METHODS:
+        if methods is not None and method not in methods:
+            continue
+        if (method, *devices) in unsupported:
+            continue
+        try:
+            fn(fsrc, fdst)
+            return method
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+            log.debug("%s unsupported between devices %s: %s", method, devices, e)
+            unsupported.add((method, *devices))
+            # file offsets are shared so the next method continues where this one stopped
+
+    if methods is not None and "buffered" not in methods:
+        raise OSError(errno.EOPNOTSUPP, f"{', '.join(methods)} not supported between devices {devices}")
+    shutil.copyfileobj(fsrc, fdst, BUFFER_SIZE)
+    return "buffered"
+
+
+def copy_file(source, destination, overwrite=True, methods=None) -> str:
+    """Copy data and metadata like shutil.copy2
+
+    Tries a reflink (FICLONE) first, then in-kernel copies (copy_file_range, sendfile), then a buffered copy.
+    methods limits which of "reflink", "copy_file_range", "sendfile", "buffered" are tried; OSError if none work.
+    Returns the name of the method that was used
+    """
+    if os.path.isdir(destination):
+        destination = os.path.join(destination, os.path.basename(source))
+    if os.path.exists(destination) and os.path.samefile(source, destination):
+        raise shutil.SameFileError(f"{source} and {destination} are the same file")
+
+    with open(source, "rb") as fsrc:
+        fdst = open(destination, "wb" if overwrite else "xb")  # nothing of ours to clean up if this fails
+        try:
+            with fdst:
+                method = copy_data(fsrc, fdst, methods)
+        except BaseException:
+            try:
+                os.unlink(destination)
+            except OSError:
+                pass
+            raise
+
+    shutil.copystat(source, destination)
+    log.debug("%s %s -> %s", method, source, destination)
+    return method
+
+
+def move_file(source, destination) -> None:
+    # rename when possible; across devices copy with copy_file then delete the source (directories too)
+    shutil.move(str(source), str(destination), copy_function=copy_file)
+
+
+@lru_cache(maxsize=4096)
+def folder_device(path) -> int | None:
+    while True:
+        try:
+            return os.stat(path).st_dev
+        except OSError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
+
+def transfer(fn, pairs, prepare=None, threads=None, device_threads=None, queue_size=None) -> dict:
+    """Run fn(source, destination) for each pair on a thread pool
+
+    Pairs are read lazily and at most queue_size of them wait for a thread at a time.
+    A job only starts while fewer than device_threads running jobs read from the same source device
+    and fewer than device_threads write to the same destination device.
+    Jobs with the same destination never overlap: prepare(source, destination) (eg. clobber handling) runs on
+    the calling thread after earlier jobs to that destination have finished and returns the pair to run
+    (source None to skip)
+
+    Returns the number of files, bytes, and seconds
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    threads = threads or min(32, (os.cpu_count() or 1) + 4)
+    queue_size = queue_size or threads * 4
+    pairs = iter(pairs)
+
+    pending = []
+    running = {}
+    key_counts = Counter()
+    destinations = Counter()
+    stats = {"files": 0, "bytes": 0, "seconds": 0.0}
+    errors = []
+    start_time = time.monotonic()
+    last_print = start_time
+
+    def job_keys(job):
+        return [("src", job["src_dev"]), ("dst", job["dst_dev"])]
+
+    def can_start(job):
+        return not device_threads or all(key_counts[key] < device_threads for key in job_keys(job))
+
+    def step(pool):
+        nonlocal pending, last_print
+
+        blocked = []
+        for job in pending:
+            if len(running) >= threads or not can_start(job):
+                blocked.append(job)
+                continue
+            for key in job_keys(job):
+                key_counts[key] += 1
+            running[pool.submit(fn, job["source"], job["destination"])] = job
+        pending = blocked
+        if not running:
+            return
+
+        finished, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in finished:
+            job = running.pop(future)
+            for key in job_keys(job):
+                key_counts[key] -= 1
+            destinations[job["destination"]] -= 1
+
+            error = future.exception()
+            if error:
+                errors.append(error)
+            else:
+                stats["files"] += 1
+                stats["bytes"] += job["size"]
+
+        now = time.monotonic()
+        if now - last_print > 1:
+            last_print = now
+            elapsed = now - start_time
+            printing.print_overwrite(
+                f"{stats['files']} files, {strings.file_size(stats['bytes'])}",
+                f"({strings.file_size(stats['bytes'] / elapsed)}/s), {len(running)} running",
+            )
+
+    def add(pool, source, destination):
+        while destinations[destination] and not errors:
+            step(pool)
+        if errors:
+            return
+
+        if prepare:
+            source, destination = prepare(source, destination)
+            if not source:
+                return
+            while destinations[destination] and not errors:
+                step(pool)
+
+        try:
+            src_stat = os.stat(source)
+            size, src_dev = src_stat.st_size, src_stat.st_dev
+        except OSError:
+            size, src_dev = 0, None
+
+        destinations[destination] += 1
+        pending.append(
+            {
+                "source": source,
+                "destination": destination,
+                "size": size,
+                "src_dev": src_dev,
+                "dst_dev": folder_device(os.path.dirname(destination)),
+            }
+        )
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        try:
+            while not errors:
+                for source, destination in pairs:
+                    add(pool, source, destination)
+                    if len(pending) >= queue_size or errors:
+                        break
+                else:
+                    break
+                step(pool)
+
+            while (pending or running) and not errors:
+                step(pool)
+        finally:
+            pending = []
+            while running:  # let running jobs finish but don't start any more
+                step(pool)
+
+    stats["seconds"] = time.monotonic() - start_time
+    if stats["files"] > 1:
+        printing.print_overwrite("")
+        log.info(
+            "Transferred %s files (%s) in %s (%s/s)",
+            stats["files"],
+            strings.file_size(stats["bytes"]),
+            strings.duration(stats["seconds"]),
+            strings.file_size(stats["bytes"] / (stats["seconds"] or 1)),
+        )
+
+    if errors:
+        raise errors[0]
+    return stats
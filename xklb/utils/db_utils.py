@@ -1,5 +1,7 @@
-import itertools, sqlite3
+import argparse, atexit, itertools, json, re, sqlite3, sys, textwrap, threading, time
 from collections.abc import Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from textwrap import dedent
 from typing import TYPE_CHECKING, Any
@@ -16,12 +18,217 @@ def tracer(sql, params) -> None:
     log.info(f"SQL: {sql} - params: {params}")
 
 
+class SQLProfiler:
+    # --profile-sql: wall time, rows, and EXPLAIN QUERY PLAN of every statement run through connect()
+    WATCHED_TABLES = ("media", "history", "captions")
+    EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT", "REPLACE")
+    SQL_KEYWORDS = {"WHERE", "JOIN", "LEFT", "INNER", "CROSS", "ON", "USING", "GROUP", "ORDER", "LIMIT", "UNION"}
+
+    def __init__(self, output=None):
+        self.output = output
+        self.queries = {}
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def caller() -> str:
+        frame = sys._getframe(2)
+        while frame and (
+            frame.f_globals.get("__name__", "").startswith("sqlite_utils") or frame.f_code.co_filename == __file__
+        ):
+            frame = frame.f_back
+        if frame is None:
+            return ""
+        return f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}:{frame.f_lineno}"
+
+    def record(self, db, sql, params, seconds, rows=None) -> dict | None:
+        sql = strings.remove_consecutives(dedent(sql).strip(), "\n")
+        keyword = sql.split(None, 1)[0].upper() if sql else ""
+        if keyword == "PRAGMA" or "sqlite_master" in sql:  # sqlite_utils introspection
+            return None
+
+        with self.lock:
+            q = self.queries.get(sql)
+            if q is None:
+                q = self.queries[sql] = {
+                    "sql": sql,
+                    "caller": self.caller(),
+                    "calls": 0,
+                    "seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "rows": 0,
+                    **self.explain(db, sql, params, keyword),
+                }
+            q["calls"] += 1
+            q["seconds"] += seconds
+            q["max_seconds"] = max(q["max_seconds"], seconds)
+            q["rows"] += rows or 0
+        return q
+
+    def profile_rows(self, q, rows, seconds=0.0):
+        try:
+            while True:
+                t = time.perf_counter()
+                try:
+                    row = next(rows)
+                except StopIteration:
+                    break
+                finally:
+                    seconds += time.perf_counter() - t
+                if q:
+                    q["rows"] += 1
+                yield row
+        finally:
+            if q:
+                q["seconds"] += seconds
+                q["max_seconds"] = max(q["max_seconds"], seconds)
+
+    def table_aliases(self, sql) -> dict[str, str]:
+        aliases = {}
+        for table, alias in re.findall(r"\b(?:FROM|JOIN)\s+\[?(\w+)\]?(?:\s+(?:AS\s+)?(\w+))?", sql, re.IGNORECASE):
+            aliases.setdefault(table, table)
+            if alias and alias.upper() not in self.SQL_KEYWORDS and table in self.WATCHED_TABLES:
+                aliases[alias] = table
+        return aliases
+
+    def explain(self, db, sql, params, keyword) -> dict:
+        if keyword not in self.EXPLAINABLE:
+            return {"plan": [], "full_scans": [], "suggestions": []}
+
+        try:
+            rows = db.conn.execute("EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()
+        except sqlite3.Error as e:
+            log.debug("Could not EXPLAIN query: %s", e)
+            return {"plan": [], "full_scans": [], "suggestions": []}
+        plan = [detail for _id, _parent, _notused, detail in rows]
+        parents = {id: parent for id, parent, _notused, _detail in rows}
+        subqueries = {  # CTEs and subqueries share a namespace with table aliases in the plan output
+            m.group(1): id
+            for id, _parent, _notused, detail in rows
+            if (m := re.match(r"(?:CO-ROUTINE|MATERIALIZE) (\w+)", detail))
+        }
+
+        def inside(id, ancestor):
+            while id in parents:
+                id = parents[id]
+                if id == ancestor:
+                    return True
+            return False
+
+        aliases = self.table_aliases(sql)
+        full_scans = []
+        for id, _parent, _notused, detail in rows:
+            m = re.match(r"SCAN (?:TABLE )?(\w+)", detail)
+            if m is None or "VIRTUAL TABLE" in detail:
+                continue
+            name = m.group(1)
+            if name in subqueries and not inside(id, subqueries[name]):
+                continue
+            table = aliases.get(name, name)
+            if table in self.WATCHED_TABLES and table not in full_scans:
+                full_scans.append(table)
+
+        suggestions = []
+        for table in full_scans:
+            suggestions.extend(self.index_suggestions(db, sql, table, [k for k, v in aliases.items() if v == table]))
+        return {"plan": plan, "full_scans": full_scans, "suggestions": suggestions}
+
+    @staticmethod
+    def index_suggestions(db, sql, table, aliases) -> list[str]:
+        table_columns = list(db[table].columns_dict)
+        indexed = {index.columns[0] for index in db[table].indexes if index.columns}
+        if not table_columns:
+            return []
+
+        qualifier = rf"(?:(?:{'|'.join(map(re.escape, aliases))})\.)?" if aliases else ""
+        column = rf"\b{qualifier}\[?({'|'.join(map(re.escape, table_columns))})\]?"
+        predicates = " ".join(
+            re.findall(r"\b(?:WHERE|ON)\b(.*?)(?=\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|\bUNION\b|$)", sql, re.I | re.S)
+        )
+        compared = re.findall(column + r"\s*(?:=|!=|<>|<|>|\bIS\b|\bIN\b|\bBETWEEN\b)", predicates, re.IGNORECASE)
+        ordered = re.findall(r"\bORDER BY\s+" + column, sql, re.IGNORECASE)
+        wrapped = re.findall(r"\b(?:COALESCE|IFNULL|LOWER)\(\s*" + column, sql, re.IGNORECASE)
+        liked = re.findall(column + r"\s+LIKE\b", predicates, re.IGNORECASE)
+
+        suggestions = []
+        for col in iterables.ordered_set([*compared, *ordered]):
+            if col not in indexed and col not in wrapped:
+                suggestions.append(f"CREATE INDEX idx_{table}_{col} ON {table}({col})")
+        for col in iterables.ordered_set(wrapped):
+            suggestions.append(f"{table}.{col} is wrapped in a function; a plain index on it cannot be used")
+        for col in iterables.ordered_set(liked):
+            suggestions.append(f"{table}.{col} LIKE cannot use a plain index; try full-text search (--fts)")
+        return suggestions
+
+    def report(self) -> None:
+        queries = sorted(self.queries.values(), key=lambda q: q["seconds"], reverse=True)
+        if self.output:
+            Path(self.output).write_text(json.dumps(queries, indent=2) + "\n")
+            return
+        if not queries:
+            return
+
+        from tabulate import tabulate
+
+        tbl = [
+            {
+                "seconds": round(q["seconds"], 4),
+                "calls": q["calls"],
+                "rows": q["rows"],
+                "caller": q["caller"],
+                "full scans": ", ".join(q["full_scans"]),
+                "sql": textwrap.shorten(q["sql"], 60),
+            }
+            for q in queries
+        ]
+        print("\nSQL profile", file=sys.stderr)
+        print(tabulate(tbl, tablefmt=consts.TABULATE_STYLE, headers="keys", showindex=False), file=sys.stderr)
+
+        for q in queries:
+            if q["full_scans"]:
+                print(f"\n{q['caller']} ({q['seconds']:.4f}s)", file=sys.stderr)
+                print(textwrap.indent("\n".join(q["plan"]), "  "), file=sys.stderr)
+                print(textwrap.indent("\n".join(q["suggestions"]), "  -- "), file=sys.stderr)
+
+
+_profiler = None
+
+
+def get_profiler(args) -> SQLProfiler | None:
+    global _profiler
+
+    profile_sql = getattr(args, "profile_sql", None)
+    if not profile_sql:
+        return None
+    if _profiler is None:
+        _profiler = SQLProfiler(output=None if profile_sql is True else profile_sql)
+        atexit.register(_profiler.report)
+    return _profiler
+
+
 def connect(args, conn=None, **kwargs):
     from sqlite_utils import Database
 
     sqlite3.enable_callback_tracebacks(True)  # noqa: FBT003
 
     class DB(Database):
+        profiler = get_profiler(args)
+
+        def query(self, sql: str, params: Iterable | dict | None = None):
+            if self.profiler is None:
+                return super().query(sql, params)
+            t = time.perf_counter()
+            rows = super().query(sql, params)
+            q = self.profiler.record(self, sql, params, seconds=0.0)
+            return self.profiler.profile_rows(q, rows, seconds=time.perf_counter() - t)
+
+        def execute(self, sql: str, parameters: Iterable | dict | None = None):
+            if self.profiler is None:
+                return super().execute(sql, parameters)
+            t = time.perf_counter()
+            cursor = super().execute(sql, parameters)
+            self.profiler.record(self, sql, parameters, seconds=time.perf_counter() - t)
+            return cursor
+
         def pop(self, sql: str, params: Iterable | dict | None = None, ignore_errors=None) -> Any | None:
             if ignore_errors is None:
                 ignore_errors = ["no such table"]
@@ -69,11 +276,65 @@ def connect(args, conn=None, **kwargs):
     with db.conn:  # type: ignore
         db.conn.execute("PRAGMA threads = 4")  # type: ignore
         db.conn.execute("PRAGMA main.cache_size = 8000")  # type: ignore
+        db.conn.execute("PRAGMA recursive_triggers = ON")  # type: ignore  # so that REPLACE fires delete triggers
 
     db.enable_wal()
     return db
 
 
+class DBWriter:
+    # worker threads queue their writes here so that only one thread ever writes to the database
+    def __init__(self, args):
+        self.args = argparse.Namespace(**{k: v for k, v in args.__dict__.items() if k not in {"db", "db_writer"}})
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db_writer")
+        self.errors = []
+
+    def _run(self, fn, pargs, kwargs):
+        if getattr(self.args, "db", None) is None:
+            self.args.db = connect(self.args)
+        return fn(self.args, *pargs, **kwargs)
+
+    def _check(self, future: Future):
+        if future.exception() is not None:
+            self.errors.append(future.exception())
+
+    def submit(self, fn, *pargs, **kwargs) -> Future:
+        future = self.executor.submit(self._run, fn, pargs, kwargs)
+        future.add_done_callback(self._check)
+        return future
+
+    def flush(self) -> None:
+        self.submit(lambda args: None).result()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        if self.errors:
+            raise self.errors[0]
+
+
+@contextmanager
+def attach(args, database, alias="source"):
+    # let SQLite copy rows between databases without passing them through Python
+    args.db.execute(f"ATTACH DATABASE ? AS [{alias}]", [str(database)])
+    try:
+        yield alias
+    finally:
+        args.db.execute(f"DETACH DATABASE [{alias}]")
+
+
+def write(args, fn, *pargs, **kwargs):
+    writer = getattr(args, "db_writer", None)
+    if writer is None:
+        return fn(args, *pargs, **kwargs)
+    return writer.submit(fn, *pargs, **kwargs)
+
+
+def flush_writes(args) -> None:
+    writer = getattr(args, "db_writer", None)
+    if writer is not None:
+        writer.flush()
+
+
 def columns(args, table_name):
     try:
         return args.db[table_name].columns_dict
@@ -290,6 +290,12 @@ def get_mount_stats(src_mounts) -> list[dict[str, int | float]]:
         mount_space.append((src_mount, used, free, total))
 
     return [
-        {"mount": mount, "used": used / total_used, "free": free / total_free, "total": total / grand_total}
+        {
+            "mount": mount,
+            "used": used / total_used,
+            "free": free / total_free,
+            "total": total / grand_total,
+            "free_bytes": free,
+        }
         for mount, used, free, total in mount_space
     ]
@@ -1,14 +1,14 @@
-import errno, mimetypes, os, shlex, shutil, tempfile, time
+import codecs, errno, mimetypes, os, shlex, shutil, sqlite3, tempfile, threading, time
 from collections import Counter
+from collections.abc import Iterator
 from fnmatch import fnmatch
 from functools import wraps
 from io import StringIO
+from itertools import chain
 from pathlib import Path
 from shutil import which
 
-import urllib3
-
-from xklb.utils import consts, file_utils, printing, processes, web
+from xklb.utils import consts, copy_utils, file_utils, printing, processes
 from xklb.utils.log_utils import log
 
 
@@ -125,7 +125,50 @@ def trash(args, path: Path | str, detach=True) -> None:
             Path(path).unlink(missing_ok=True)
 
 
-def is_file_open(path):
+class OpenFiles:
+    def __init__(self, ttl=2.0):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.time_scanned = None
+        self.paths = set()
+
+    def scan(self) -> set[str]:
+        open_files = set()
+        try:
+            procs = os.listdir("/proc")
+        except FileNotFoundError:
+            return open_files
+
+        for proc in procs:
+            if not proc.isdigit():
+                continue
+            fd_dir = os.path.join("/proc", proc, "fd")
+            try:
+                fds = os.listdir(fd_dir)
+            except OSError:
+                continue
+            for fd in fds:
+                try:
+                    link = os.readlink(os.path.join(fd_dir, fd))
+                except OSError:
+                    continue
+                if link.startswith("/"):
+                    open_files.add(link)
+        return open_files
+
+    def get(self, refresh=False) -> set[str]:
+        with self.lock:  # only one thread rebuilds the snapshot; the others wait and then share it
+            if refresh or self.time_scanned is None or time.monotonic() - self.time_scanned > self.ttl:
+                self.paths = self.scan()
+                self.time_scanned = time.monotonic()
+            return self.paths
+
+
+open_files = OpenFiles()
+
+
+def is_file_open(path, refresh=False):
+    # use refresh=True right before deleting a single file so that the snapshot is not a few seconds old
     if os.name == "nt":
         try:
             os.open(path, os.O_RDWR | os.O_EXCL)
@@ -133,17 +176,17 @@ def is_file_open(path):
         except OSError:
             return True
     else:
-        open_files = set()
-        for proc in os.listdir("/proc"):
-            try:
-                fd_dir = os.path.join("/proc", proc, "fd")
-                for fd in os.listdir(fd_dir):
-                    link = os.readlink(os.path.join(fd_dir, fd))
-                    if link.startswith("/") and link == path:
-                        open_files.add(link)
-            except OSError:
-                continue
-        return path in open_files
+        return str(path) in open_files.get(refresh=refresh)
+
+
+def are_files_open(paths) -> list[bool]:
+    if not paths:
+        return []
+    if os.name == "nt":
+        return [is_file_open(path) for path in paths]
+
+    snapshot = open_files.get(refresh=True)
+    return [str(path) in snapshot for path in paths]
 
 
 def filter_file(path, sieve) -> None:
@@ -214,11 +257,11 @@ def rename_move_file(source_file, destination_file, simulate=False):
                     os.rename(source_file, destination_file)  # try again
                 except OSError as e:
                     if e.errno == errno.EXDEV:  # Cross-device
-                        shutil.move(source_file, destination_file)  # Fallback to shutil.move
+                        copy_utils.move_file(source_file, destination_file)
                     else:
                         raise
             elif e.errno == errno.EXDEV:  # Cross-device
-                shutil.move(source_file, destination_file)  # Fallback to shutil.move
+                copy_utils.move_file(source_file, destination_file)
             else:
                 raise
 
@@ -232,7 +275,7 @@ def move_files(file_list):
                 parent_dir = os.path.dirname(new_path)
                 os.makedirs(parent_dir, exist_ok=True)
 
-                shutil.move(existing_path, new_path)
+                copy_utils.move_file(existing_path, new_path)
             except Exception:
                 log.exception("Could not move %s", existing_path)
 
@@ -278,6 +321,8 @@ def get_file_encoding(path):
     import chardet
 
     if path.startswith("http"):
+        from xklb.utils import web
+
         detector = chardet.UniversalDetector()
         response = web.session.get(path, stream=True)
         response.raw.decode_content = True
@@ -304,9 +349,44 @@ def get_file_encoding(path):
     return encoding
 
 
+def decodes_as(path, encoding) -> bool:
+    decoder = codecs.getincrementaldecoder(encoding)()
+    try:
+        with open(path, "rb") as f:
+            while block := f.read(1048576):
+                decoder.decode(block)
+        decoder.decode(b"", final=True)
+    except (UnicodeDecodeError, LookupError):
+        return False
+    return True
+
+
+def detect_file_encoding(path) -> str | None:
+    # unlike get_file_encoding this reads the whole file so a stray byte near the end is not missed
+    if decodes_as(path, "utf-8"):
+        return "utf-8"
+
+    likely_encodings = []
+    try:
+        detected_encoding = get_file_encoding(path)
+    except ModuleNotFoundError:  # chardet is optional
+        detected_encoding = None
+    if detected_encoding:
+        likely_encodings.append(detected_encoding)
+
+    for encoding in likely_encodings + consts.COMMON_ENCODINGS:
+        if decodes_as(path, encoding):
+            return encoding
+    return None
+
+
 def head_foot_stream(url, head_len, foot_len):
     import io
 
+    import urllib3
+
+    from xklb.utils import web
+
     head_response = web.session.get(url, stream=True)
     head_response.raw.decode_content = True
     head_response.raise_for_status()
@@ -401,7 +481,10 @@ def retry_with_different_encodings(func):
             original_exc = exc
 
         likely_encodings = []
-        detected_encoding = get_file_encoding(args[0])
+        try:
+            detected_encoding = get_file_encoding(args[0])
+        except ModuleNotFoundError:  # chardet is optional
+            detected_encoding = None
         if detected_encoding:
             likely_encodings.append(detected_encoding)
 
@@ -417,6 +500,33 @@ def retry_with_different_encodings(func):
     return wrapper
 
 
+def table_mimetype(path, mimetype=None) -> str:
+    if mimetype is None:
+        mimetype = file_utils.mimetype(path)
+    if mimetype is not None:
+        mimetype = mimetype.strip().lower()
+    log.info(mimetype)
+
+    if mimetype is None:
+        msg = f"{path}: File type could not be determined. Pass in --filetype"
+        raise ValueError(msg)
+    return mimetype
+
+
+def sqlite_table_names(db, table_name=None, table_index=None) -> list[str]:
+    if table_name:
+        return [table_name]
+
+    tables = [
+        s
+        for s in db.table_names() + db.view_names()
+        if not any(["_fts_" in s, s.endswith("_fts"), s.startswith("sqlite_")])
+    ]
+    if table_index is not None:
+        tables = [tables[table_index]]
+    return tables
+
+
 @retry_with_different_encodings
 def read_file_to_dataframes(
     path,
@@ -431,15 +541,7 @@ def read_file_to_dataframes(
 ):
     import pandas as pd
 
-    if mimetype is None:
-        mimetype = file_utils.mimetype(path)
-    if mimetype is not None:
-        mimetype = mimetype.strip().lower()
-    log.info(mimetype)
-
-    if mimetype is None:
-        msg = f"{path}: File type could not be determined. Pass in --filetype"
-        raise ValueError(msg)
+    mimetype = table_mimetype(path, mimetype)
 
     if mimetype in ("sqlite", "sqlite3", "sqlite database file"):
         import pandas as pd
@@ -447,19 +549,8 @@ def read_file_to_dataframes(
 
         db = Database(path)
 
-        if table_name:
-            tables = [table_name]
-        else:
-            tables = [
-                s
-                for s in db.table_names() + db.view_names()
-                if not any(["_fts_" in s, s.endswith("_fts"), s.startswith("sqlite_")])
-            ]
-            if table_index:
-                tables = [table_index]
-
         dfs = []
-        for table in tables:
+        for table in sqlite_table_names(db, table_name, table_index):
             df = pd.DataFrame(db[table].rows_where(offset=start_row, limit=end_row, order_by=order_by))
             df.name = table
             dfs.append(df)
@@ -529,6 +620,8 @@ def read_file_to_dataframes(
         "html document",
     ):
         if path.startswith("http"):
+            from xklb.utils import web
+
             path = StringIO(web.extract_html(path))
         dfs = pd.read_html(path, skiprows=start_row, encoding=encoding)
     elif mimetype in ("stata",):
@@ -540,6 +633,8 @@ def read_file_to_dataframes(
     elif "pdf" in mimetype:
         import camelot
 
+        from xklb.utils import web
+
         camelot_path = web.url_encode(path)  # camelot does not like spaces in URLs...
         dfs = []
         for t in camelot.read_pdf(camelot_path, pages="all", suppress_stdout=False):  # type: ignore
@@ -570,6 +665,167 @@ def read_file_to_dataframes(
     return dfs
 
 
+def skip_dataframe_rows(chunks, start_row=None):
+    for df in chunks:
+        if start_row:
+            skipped = min(start_row, len(df))
+            start_row -= skipped
+            df = df.iloc[skipped:]
+            if df.empty:
+                continue
+        yield df
+
+
+def slice_dataframe(df, chunk_size=None, start_row=None):
+    if start_row:
+        df = df.iloc[start_row:]
+    if not chunk_size:
+        yield df
+        return
+    for i in range(0, len(df), chunk_size):
+        yield df.iloc[i : i + chunk_size]
+
+
+def sqlite_dataframe_chunks(path, table, chunk_size=None, start_row=None, order_by=None):
+    import pandas as pd
+    from sqlite_utils import Database
+
+    db = Database(path)
+    try:
+        has_rowid = table in db.table_names()  # views don't have a stable rowid
+        if has_rowid:
+            try:
+                db.execute(f"SELECT rowid FROM [{table}] LIMIT 1")
+            except sqlite3.OperationalError:  # WITHOUT ROWID tables
+                has_rowid = False
+
+        if order_by or not has_rowid or not chunk_size:
+            offset = start_row
+            while True:
+                rows = list(db[table].rows_where(offset=offset, limit=chunk_size, order_by=order_by))
+                if rows:
+                    yield pd.DataFrame(rows)
+                if not chunk_size or len(rows) < chunk_size:
+                    break
+                offset = (offset or 0) + chunk_size
+        else:
+            # keyset pagination: each page is an index seek instead of re-reading the skipped rows
+            last_rowid = None
+            while True:
+                if last_rowid is None:
+                    rows = list(
+                        db.query(
+                            f"SELECT rowid AS __rowid, * FROM [{table}] ORDER BY rowid LIMIT ? OFFSET ?",
+                            [chunk_size, start_row or 0],
+                        )
+                    )
+                else:
+                    rows = list(
+                        db.query(
+                            f"SELECT rowid AS __rowid, * FROM [{table}] WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                            [last_rowid, chunk_size],
+                        )
+                    )
+                if not rows:
+                    break
+                last_rowid = rows[-1]["__rowid"]
+                yield pd.DataFrame(rows).drop(columns="__rowid")
+                if len(rows) < chunk_size:
+                    break
+    finally:
+        db.close()
+
+
+@retry_with_different_encodings
+def text_dataframe_chunks(path, mimetype, chunk_size=None, start_row=None, encoding=None) -> Iterator:
+    # the first chunk is read here so that decoding errors are retried with a different encoding
+    import pandas as pd
+    from pandas.io.common import infer_compression
+
+    if (
+        encoding is None
+        and chunk_size
+        and not str(path).startswith("http")
+        and infer_compression(str(path), "infer") is None
+    ):
+        # later chunks are read lazily, after the retry decorator has returned
+        encoding = detect_file_encoding(path)
+
+    if mimetype in ("jsonl", "json lines", "geojson lines"):
+        reader = pd.read_json(path, lines=True, chunksize=chunk_size, encoding=encoding)
+        reader = skip_dataframe_rows(reader if chunk_size else [reader], start_row)
+    else:
+        reader = pd.read_csv(
+            path,
+            delimiter="\t" if "tsv" in mimetype or "tab" in mimetype else ",",
+            chunksize=chunk_size,
+            skiprows=range(1, start_row + 1) if start_row else None,
+            encoding=encoding,
+        )
+        reader = reader if chunk_size else [reader]
+
+    reader = iter(reader)
+    first_chunk = next(reader, None)
+    return chain([first_chunk] if first_chunk is not None else [], reader)
+
+
+def read_file_to_dataframe_chunks(
+    path,
+    chunk_size=None,
+    table_name=None,
+    table_index=None,
+    start_row=None,
+    order_by=None,
+    encoding=None,
+    mimetype=None,
+) -> list[tuple[str, Iterator]]:
+    # each file is read once: chunks are taken from a persistent reader instead of re-reading with skiprows
+    import pandas as pd
+
+    mimetype = table_mimetype(path, mimetype)
+
+    if mimetype in ("sqlite", "sqlite3", "sqlite database file"):
+        from sqlite_utils import Database
+
+        db = Database(path)
+        tables = sqlite_table_names(db, table_name, table_index)
+        db.close()
+        return [(table, sqlite_dataframe_chunks(path, table, chunk_size, start_row, order_by)) for table in tables]
+    elif mimetype in (
+        "csv",
+        "text/csv",
+        "tsv",
+        "text/tsv",
+        "text/tab-separated-values",
+        "jsonl",
+        "json lines",
+        "geojson lines",
+    ):
+        return [("0", text_dataframe_chunks(path, mimetype, chunk_size, start_row, encoding=encoding))]
+    elif mimetype in ("parq", "parquet", "application/parquet") and chunk_size:
+        import pyarrow.parquet as pq
+
+        batches = pq.ParquetFile(path).iter_batches(batch_size=chunk_size)
+        return [("0", skip_dataframe_rows((batch.to_pandas() for batch in batches), start_row))]
+    elif mimetype in ("hdf", "application/x-hdf") and chunk_size:
+        try:
+            return [("0", pd.read_hdf(path, chunksize=chunk_size, start=start_row))]
+        except TypeError:  # fixed format HDF files can't be read incrementally
+            pass
+
+    dfs = read_file_to_dataframes(
+        path, table_name=table_name, table_index=table_index, order_by=order_by, encoding=encoding, mimetype=mimetype
+    )
+    return [(df.name, slice_dataframe(df, chunk_size, start_row)) for df in dfs]
+
+
+def safe_stat(path):
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+
 def get_filesize(d):
     try:
         stat = Path(d["path"]).stat()
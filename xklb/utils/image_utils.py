@@ -0,0 +1,205 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from xklb.utils import consts, file_utils, iterables
+from xklb.utils.log_utils import log
+
+HASH_BITS = 64
+EMBEDDING_SIZE = 4  # 4x4 RGB thumbnail; 48 bytes per image
+
+
+def to_signed(h: int) -> int:
+    # SQLite INTEGER is a signed 64-bit int
+    return h - (1 << HASH_BITS) if h >= (1 << (HASH_BITS - 1)) else h
+
+
+def to_unsigned(h: int) -> int:
+    return h & ((1 << HASH_BITS) - 1)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return to_unsigned(a ^ b).bit_count()
+
+
+def bits_to_int(bits) -> int:
+    h = 0
+    for bit in bits:
+        h = (h << 1) | int(bit)
+    return h
+
+
+def dct_matrix(n):
+    import numpy as np
+
+    k = np.arange(n)
+    m = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    m[0] /= np.sqrt(2)
+    return m
+
+
+def image_fingerprint(path) -> dict | None:
+    import numpy as np
+    from PIL import Image
+
+    try:
+        with Image.open(path) as img:
+            img.draft("RGB", (64, 64))  # let the JPEG decoder downscale while decoding
+            img = img.convert("RGB")
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        log.warning("[%s] Could not read image: %s", path, e)
+        return None
+
+    gray = img.convert("L")
+
+    # difference hash: is each pixel brighter than its right neighbor
+    pixels = np.asarray(gray.resize((9, 8), Image.Resampling.LANCZOS), dtype=np.int16)
+    dhash = bits_to_int((pixels[:, 1:] > pixels[:, :-1]).flatten())
+
+    # perceptual hash: low frequencies of the DCT compared to their median
+    pixels = np.asarray(gray.resize((32, 32), Image.Resampling.LANCZOS), dtype=np.float64)
+    m = dct_matrix(32)
+    low_freq = (m @ pixels @ m.T)[:8, :8].flatten()
+    phash = bits_to_int(low_freq > np.median(low_freq[1:]))
+
+    embedding = img.resize((EMBEDDING_SIZE, EMBEDDING_SIZE), Image.Resampling.BOX).tobytes()
+
+    return {"dhash": to_signed(dhash), "phash": to_signed(phash), "embedding": embedding}
+
+
+def image_hashes(args, paths, threads=None) -> dict[str, dict]:
+    """Fingerprints of image files keyed by path
+
+    Cached rows in the image_hashes table are reused while file size and mtime match.
+    New or modified files are decoded in a process pool and saved back
+    """
+    paths = list(dict.fromkeys(paths))
+    if threads == -1:
+        threads = None
+
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        path_stats = {path: stat for path, stat in zip(paths, pool.map(file_utils.safe_stat, paths)) if stat}
+
+    cached = {}
+    if "image_hashes" in args.db.table_names():
+        for chunk_paths in iterables.chunks(list(path_stats), consts.SQLITE_PARAM_LIMIT):
+            for d in args.db.query(
+                "SELECT * FROM image_hashes WHERE path IN (" + ",".join(["?"] * len(chunk_paths)) + ")", chunk_paths
+            ):
+                stat = path_stats[d["path"]]
+                if (d["size"], d["mtime"]) == (stat.st_size, stat.st_mtime_ns):
+                    cached[d["path"]] = d
+
+    need_hash_paths = [path for path in path_stats if path not in cached]
+    log.info("Reusing %s image fingerprints. Decoding %s images...", len(cached), len(need_hash_paths))
+
+    if need_hash_paths:
+        args.db["image_hashes"].create(
+            {"path": str, "size": int, "mtime": int, "dhash": int, "phash": int, "embedding": bytes},
+            pk="path",
+            if_not_exists=True,
+        )
+
+        parallel = threads != 1 and len(need_hash_paths) > 1
+        pool = ProcessPoolExecutor(max_workers=threads) if parallel else None
+        try:
+            # save each batch as it finishes so that an interrupted run keeps its progress
+            for chunk_paths in iterables.chunks(need_hash_paths, 1000):
+                if pool:
+                    results = pool.map(image_fingerprint, chunk_paths, chunksize=16)
+                else:
+                    results = map(image_fingerprint, chunk_paths)
+
+                rows = [
+                    {
+                        "path": path,
+                        "size": path_stats[path].st_size,
+                        "mtime": path_stats[path].st_mtime_ns,
+                        **(d or {"dhash": None, "phash": None, "embedding": None}),
+                    }
+                    for path, d in zip(chunk_paths, results)
+                ]
+                args.db["image_hashes"].upsert_all(rows, pk="path", alter=True)
+                cached.update((d["path"], d) for d in rows)
+        finally:
+            if pool:
+                pool.shutdown()
+
+    return {path: cached[path] for path in paths if path in cached}
+
+
+class BKTree:
+    # metric tree for Hamming-distance neighbor queries: only subtrees whose edge distance
+    # is within max_distance of the query distance can contain matches
+    def __init__(self, distance=hamming_distance):
+        self.distance = distance
+        self.root = None
+
+    def add(self, key, item) -> None:
+        if self.root is None:
+            self.root = (key, [item], {})
+            return
+
+        node = self.root
+        while True:
+            node_key, node_items, children = node
+            d = self.distance(key, node_key)
+            if d == 0:
+                node_items.append(item)
+                return
+            if d not in children:
+                children[d] = (key, [item], {})
+                return
+            node = children[d]
+
+    def search(self, key, max_distance) -> list[tuple[int, object]]:
+        results = []
+        if self.root is None:
+            return results
+
+        stack = [self.root]
+        while stack:
+            node_key, node_items, children = stack.pop()
+            d = self.distance(key, node_key)
+            if d <= max_distance:
+                results.extend((d, item) for item in node_items)
+            stack.extend(child for edge, child in children.items() if d - max_distance <= edge <= d + max_distance)
+        return results
+
+
+def group_similar(fingerprints: dict[str, dict], max_distance, key="phash") -> list[list[str]]:
+    """Connected components of images within max_distance bits of each other, in input order"""
+    tree = BKTree()
+    for path, d in fingerprints.items():
+        if d.get(key) is not None:
+            tree.add(d[key], path)
+
+    parent = {path: path for path in fingerprints}
+
+    def find(path):
+        while parent[path] != path:
+            parent[path] = parent[parent[path]]
+            path = parent[path]
+        return path
+
+    for path, d in fingerprints.items():
+        if d.get(key) is None:
+            continue
+        for _distance, other in tree.search(d[key], max_distance):
+            a, b = find(path), find(other)
+            if a != b:
+                parent[b] = a
+
+    groups = {}
+    for path in fingerprints:
+        groups.setdefault(find(path), []).append(path)
+    return list(groups.values())
+
+
+def feature_vectors(fingerprints: list[dict]):
+    import numpy as np
+
+    vectors = []
+    for d in fingerprints:
+        bits = [(to_unsigned(d[k] or 0) >> i) & 1 for k in ("phash", "dhash") for i in range(HASH_BITS)]
+        embedding = np.frombuffer(d["embedding"] or bytes(EMBEDDING_SIZE**2 * 3), dtype=np.uint8) / 255
+        vectors.append(np.concatenate([np.array(bits, dtype=np.float64), embedding]))
+    return np.array(vectors)
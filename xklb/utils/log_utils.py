@@ -2,9 +2,6 @@ import argparse, logging, os, sys
 from functools import wraps
 from timeit import default_timer
 
-from IPython.core import ultratb
-from IPython.terminal import debugger
-
 
 def clamp_index(arr, idx):
     return arr[min(max(idx, 0), len(arr) - 1)]
@@ -33,6 +30,9 @@ def argparse_log() -> logging.Logger:
         has_stdin = os.getpgrp() == os.tcgetpgrp(sys.stdin.fileno())
         has_stdout = os.getpgrp() == os.tcgetpgrp(sys.stdout.fileno())
         if args.verbose > 0 and has_stdin and has_stdout:
+            from IPython.core import ultratb  # IPython takes a few hundred ms to import
+            from IPython.terminal import debugger
+
             sys.breakpointhook = debugger.set_trace
             sys.excepthook = ultratb.FormattedTB(
                 mode="Verbose" if args.verbose > 1 else "Context",
@@ -2,9 +2,8 @@ import csv, math, os, sys, textwrap
 from datetime import datetime
 
 import humanize
-from tabulate import tabulate
 
-from xklb.utils import consts, web
+from xklb.utils import consts
 from xklb.utils.strings import duration, file_size, relative_datetime
 
 
@@ -20,6 +19,8 @@ def print_overwrite(*text):
 
 
 def table(tbl, *args, **kwargs) -> None:
+    from tabulate import tabulate
+
     try:
         print(tabulate(tbl, tablefmt=consts.TABULATE_STYLE, headers="keys", showindex=False, *args, **kwargs))
     except BrokenPipeError:
@@ -136,6 +137,8 @@ def col_unquote_url(tbl: list[dict], col: str) -> list[dict]:
         val = tbl[idx].get(col)
         if val is not None:
             if val.startswith("http"):
+                from xklb.utils import web
+
                 tbl[idx][col] = web.safe_unquote(val)
 
     return tbl
@@ -1,4 +1,5 @@
-import functools, json, multiprocessing, os, shlex, signal, subprocess, sys
+import functools, json, multiprocessing, os, shlex, signal, sqlite3, subprocess, sys, threading
+from pathlib import Path
 from typing import NoReturn
 
 from xklb.utils import consts, iterables, nums
@@ -56,6 +57,16 @@ def with_timeout(seconds):  # noqa: ANN201
     return decorator
 
 
+def max_rss() -> int:
+    try:
+        import resource
+    except ModuleNotFoundError:  # Windows
+        return 0
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024  # bytes on macOS, KiB elsewhere
+
+
 def os_bg_kwargs() -> dict:
     # prevent ctrl-c from affecting subprocesses first
 
@@ -181,37 +192,133 @@ def is_album_art(s):
     return traverse_obj(s, ["disposition", "attached_pic"]) == 1
 
 
+class FFProbeCache:
+    # ffprobe results of local files keyed by path and validated by size, mtime, and inode
+    def __init__(self, db_path, max_entries=consts.FFPROBE_CACHE_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.local = threading.local()
+        self.inserts = 0
+
+    def connect(self) -> sqlite3.Connection:
+        if getattr(self.local, "pid", None) != os.getpid():  # connections are not shared between threads or forks
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS ffprobe (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER,
+                    mtime INTEGER,
+                    inode INTEGER,
+                    time_accessed INTEGER,
+                    data TEXT
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ffprobe_time_accessed ON ffprobe (time_accessed)")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return self.local.conn
+
+    def get(self, path, stat) -> dict | None:
+        row = (
+            self.connect()
+            .execute(
+                "SELECT data, time_accessed FROM ffprobe WHERE path = ? AND size = ? AND mtime = ? AND inode = ?",
+                [path, stat.st_size, stat.st_mtime_ns, stat.st_ino],
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+
+        data, time_accessed = row
+        if time_accessed < consts.APPLICATION_START - 86400:  # avoid a write for every cache hit
+            self.connect().execute(
+                "UPDATE ffprobe SET time_accessed = ? WHERE path = ?", [consts.APPLICATION_START, path]
+            )
+        return json.loads(data)
+
+    def set(self, path, stat, d) -> None:
+        conn = self.connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO ffprobe (path, size, mtime, inode, time_accessed, data) VALUES (?, ?, ?, ?, ?, ?)",
+            [path, stat.st_size, stat.st_mtime_ns, stat.st_ino, consts.APPLICATION_START, json.dumps(d)],
+        )
+
+        self.inserts += 1
+        if self.inserts % 1000 == 1:
+            (count,) = conn.execute("SELECT count(*) FROM ffprobe").fetchone()
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM ffprobe WHERE path IN (SELECT path FROM ffprobe ORDER BY time_accessed LIMIT ?)",
+                    [count - self.max_entries],
+                )
+
+
+ffprobe_cache = FFProbeCache(consts.FFPROBE_CACHE_DB) if consts.FFPROBE_CACHE_DB else None
+
+
+def ffprobe_json(path, *args) -> dict:
+    args = [
+        "ffprobe",
+        "-hide_banner",
+        "-rw_timeout",
+        "100000000",
+        "-timeout",
+        "45000000",
+        "-show_format",
+        "-show_streams",
+        "-show_chapters",
+        "-of",
+        "json",
+        *args,
+        path,
+    ]
+    p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    out, err = p.communicate()
+    if p.returncode != 0:
+        log.info("ffprobe %s out %s error %s", p.returncode, out, err)
+        if p.returncode == -2:
+            raise KeyboardInterrupt
+        elif p.returncode == 127:  # Cannot open shared object file
+            raise RuntimeError
+        elif p.returncode == -6:  # Too many open files
+            raise OSError
+        else:
+            raise UnplayableFile(out, err)
+    return json.loads(out.decode("utf-8"))
+
+
+def ffprobe_json_cached(path) -> dict:
+    try:
+        stat = os.stat(path)
+    except (OSError, ValueError):  # URLs and other non-local inputs
+        return ffprobe_json(path)
+
+    try:
+        d = ffprobe_cache.get(str(path), stat)  # type: ignore
+    except (sqlite3.Error, OSError) as e:
+        log.debug("ffprobe cache: %s", e)
+        return ffprobe_json(path)
+    if d is not None:
+        return d
+
+    d = ffprobe_json(path)
+    try:
+        ffprobe_cache.set(str(path), stat, d)  # type: ignore
+    except (sqlite3.Error, OSError) as e:
+        log.debug("ffprobe cache: %s", e)
+    return d
+
+
 class FFProbe:
-    def __init__(self, path, *args):
-        args = [
-            "ffprobe",
-            "-hide_banner",
-            "-rw_timeout",
-            "100000000",
-            "-timeout",
-            "45000000",
-            "-show_format",
-            "-show_streams",
-            "-show_chapters",
-            "-of",
-            "json",
-            *args,
-            path,
-        ]
-        p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        out, err = p.communicate()
-        if p.returncode != 0:
-            log.info("ffprobe %s out %s error %s", p.returncode, out, err)
-            if p.returncode == -2:
-                raise KeyboardInterrupt
-            elif p.returncode == 127:  # Cannot open shared object file
-                raise RuntimeError
-            elif p.returncode == -6:  # Too many open files
-                raise OSError
-            else:
-                raise UnplayableFile(out, err)
-        d = json.loads(out.decode("utf-8"))
+    def __init__(self, path, *args, cache=True):
+        if cache and ffprobe_cache and not args:
+            d = ffprobe_json_cached(path)
+        else:
+            d = ffprobe_json(path, *args)
 
         self.path = path
 
@@ -265,3 +372,70 @@ class FFProbe:
                     self.duration = start - end
                 else:
                     self.duration -= start
+
+
+def schedule_jobs(fn, jobs: list[dict], cpu_budget=None, key_limit=None, max_jobs=None):
+    """Run fn(job) for each job on a thread pool and yield (job, future) as they finish
+
+    Jobs are dicts with "cost" (CPU cores it will keep busy), "work" (relative run time, for the ETA),
+    and "key" (e.g. source device). Jobs start longest-first while the summed cost of running jobs fits
+    within cpu_budget and fewer than key_limit jobs with the same key are running.
+    A job which costs more than the whole budget runs alone
+    """
+    import time
+    from collections import Counter
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    from xklb.utils import printing
+
+    cpu_budget = cpu_budget or os.cpu_count() or 1
+    pending = sorted(jobs, key=lambda d: d["work"], reverse=True)  # longest processing time first packs best
+    total_work = sum(d["work"] for d in jobs) or 1
+    done_work = 0
+    done_count = 0
+    used = 0
+    key_counts = Counter()
+    running = {}
+    start_time = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max_jobs or cpu_budget) as pool:
+        try:
+            while pending or running:
+                blocked = []
+                for i, job in enumerate(pending):
+                    if max_jobs and len(running) >= max_jobs:
+                        blocked.extend(pending[i:])
+                        break
+                    cost = min(job["cost"], cpu_budget)
+                    if running and used + cost > cpu_budget:
+                        blocked.extend(pending[i:])
+                        break
+                    if key_limit and key_counts[job["key"]] >= key_limit:
+                        blocked.append(job)
+                        continue
+
+                    used += cost
+                    key_counts[job["key"]] += 1
+                    running[pool.submit(fn, job)] = job
+                pending = blocked
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job = running.pop(future)
+                    used -= min(job["cost"], cpu_budget)
+                    key_counts[job["key"]] -= 1
+                    done_work += job["work"]
+                    done_count += 1
+
+                    elapsed = time.monotonic() - start_time
+                    eta = elapsed / done_work * (total_work - done_work) if done_work else 0
+                    printing.print_overwrite(
+                        f"{done_count}/{len(jobs)} done ({done_work / total_work:.0%} of work),",
+                        f"{len(running)} running, ETA {printing.seconds_to_hhmmss(eta).strip()}",
+                    )
+                    yield job, future
+        finally:
+            for future in running:  # let running jobs finish but don't start any more
+                future.cancel()
+    if len(jobs) > 1:
+        printing.print_overwrite("")
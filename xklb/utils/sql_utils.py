@@ -293,6 +293,11 @@ def limit_sql(limit, offset, limit_adj=0):
     return sql
 
 
+def prefix_range(prefix: str) -> tuple[str, str]:
+    # `path >= lo AND path < hi` matches the same rows as `path LIKE prefix || '%'` but can use an index
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
 def fts_quote(query: list[str]) -> list[str]:
     fts_words = [" NOT ", " AND ", " OR ", "*", ":", "NEAR("]
     return [s if any(r in s for r in fts_words) else '"' + s + '"' for s in query]